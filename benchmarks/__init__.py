@@ -0,0 +1,3 @@
+"""
+Offline benchmarks for the paps-bot command handlers, no discord token or network needed
+"""
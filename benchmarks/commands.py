@@ -0,0 +1,293 @@
+"""
+Drive the real slash command handlers with fake interactions and report their latency
+
+    python -m benchmarks.commands --backend memory --events 10000 --concurrency 16
+
+The memory backend needs nothing but the installed packages, and the
+sqlite backend writes a temporary file. The postgres backend uses the DB_*
+env vars like the bot does, and only touches rows of its own throwaway guild id.
+"""
+
+import os
+import sys
+import time
+import tempfile
+import random
+import asyncio
+import logging
+import argparse
+from datetime import date, time as dt_time, timedelta
+from typing import Awaitable, Callable, Dict, List, NamedTuple
+
+# the bot module builds its pool at import time, only the postgres backend opens it
+if not any("postgres" in arg for arg in sys.argv[1:]):
+    os.environ.setdefault("DB_BACKEND", "sqlite")
+
+# pylint: disable=wrong-import-position
+from paps_bot import paps_bot as bot_module
+from paps_bot.cache import EventCache
+from paps_bot.repository import EventRepository
+from paps_bot.rsvp import RsvpTracker
+from paps_bot.sqlite import SQLitePool
+from paps_bot.votes import THUMBS_UP, VoteEngine
+from benchmarks.fakes import (
+    FakeChannel,
+    FakeClient,
+    FakeGuild,
+    FakeInteraction,
+    FakeReaction,
+    FakeUser,
+)
+from benchmarks.memory import MemoryPool
+
+# get the bot logger
+logger = logging.getLogger("discord")
+
+# far outside the range of real discord snowflakes, so postgres runs never touch real guilds
+BENCHMARK_GUILD_ID = 7_270_000_000
+BENCHMARK_CHANNEL_ID = 7_270_000_001
+GAME_TYPES = ("dnd", "cpr", "pathfinder", "blades", "mothership")
+
+
+class Result(NamedTuple):
+    """Timings of one scenario"""
+
+    name: str
+    operations: int
+    errors: int
+    elapsed: float
+    latencies: List[float]
+
+    def percentile(self, pct: float) -> float:
+        """Nearest-rank percentile of the latencies, in seconds"""
+        if not self.latencies:
+            return 0.0
+        ordered = sorted(self.latencies)
+        return ordered[min(int(len(ordered) * pct / 100), len(ordered) - 1)]
+
+
+def _drop_guild(conn, guild_id: int) -> None:
+    with conn, conn.cursor() as cur:
+        cur.execute("DELETE FROM paps_votes WHERE guild_id = %s", (guild_id,))
+        cur.execute("DELETE FROM paps_table WHERE guild_id = %s", (guild_id,))
+
+
+def _random_event(rng: random.Random):
+    day = date.today() + timedelta(days=rng.randrange(1, 365))
+    return (
+        rng.choice(GAME_TYPES),
+        day,
+        dt_time(rng.randrange(12, 23), rng.choice((0, 15, 30, 45))),
+    )
+
+
+class Bench:
+    """The bot's singletons rewired to fake discord objects and the chosen backend"""
+
+    def __init__(self, pool, cache: bool, seed: int, shared: bool = False):
+        self.pool = pool
+        # storage that outlives the run, whose benchmark rows are removed
+        self.shared = shared
+        self.rng = random.Random(seed)
+        self.guild = FakeGuild(BENCHMARK_GUILD_ID)
+        self.channel = FakeChannel(BENCHMARK_CHANNEL_ID, self.guild)
+        self.client = FakeClient(self.guild)
+        # a cache that holds nothing still reports its stats, as the handlers expect
+        self.repository = EventRepository(
+            pool, cache=EventCache() if cache else EventCache(max_entries=0)
+        )
+        self.rsvp = RsvpTracker(self.client, self.repository)
+        self.vote_engine = VoteEngine(self.client, self.repository, rsvp=self.rsvp)
+        self.game_ids: List[int] = []
+        # the handlers read these module globals
+        bot_module.repository = self.repository
+        bot_module.rsvp = self.rsvp
+        bot_module.vote_engine = self.vote_engine
+
+    def interaction(self) -> FakeInteraction:
+        """A fresh interaction from a random member"""
+        user = FakeUser(self.rng.randrange(10_000, 20_000))
+        return FakeInteraction(user, self.channel)
+
+    async def seed(self, events: int) -> None:
+        """Fill the benchmark guild with random events"""
+        await self.cleanup()
+        rows = [_random_event(self.rng) for _ in range(events)]
+        await self.repository.import_events(BENCHMARK_GUILD_ID, rows)
+        page = await self.repository.find_events(BENCHMARK_GUILD_ID, limit=events)
+        self.game_ids = [row[0] for row in page.rows]
+
+    async def cleanup(self) -> None:
+        """Remove everything the benchmark wrote"""
+        if self.shared:
+            await self.pool.run(_drop_guild, BENCHMARK_GUILD_ID)
+
+    async def make_event_novote(self, _i: int) -> None:
+        """/make-event-novote"""
+        game_type, game_date, game_time = _random_event(self.rng)
+        await bot_module.make_event_novote.callback(
+            self.interaction(),
+            game_type,
+            game_date.strftime("%d-%m-%Y"),
+            game_time.strftime("%H:%M"),
+        )
+
+    async def list_events(self, i: int) -> None:
+        """/list-events, alternating between the unfiltered list and a type filter"""
+        if i % 2:
+            await bot_module.list_events.callback(self.interaction())
+        else:
+            await bot_module.list_events.callback(
+                self.interaction(), game_type=self.rng.choice(GAME_TYPES)
+            )
+
+    async def edit_event(self, _i: int) -> None:
+        """/edit-event on a seeded event"""
+        await bot_module.edit_event.callback(
+            self.interaction(),
+            self.rng.choice(self.game_ids),
+            game_type=self.rng.choice(GAME_TYPES),
+        )
+
+    async def delete_event(self, i: int) -> None:
+        """/delete-event, each seeded event once, misses once they run out"""
+        game_id = self.game_ids[-1 - i] if i < len(self.game_ids) else -1
+        await bot_module.delete_event.callback(self.interaction(), game_id)
+
+    async def vote(self, _i: int) -> None:
+        """/make-event, then the thumbs up that passes the vote"""
+        interaction = self.interaction()
+        game_type, game_date, game_time = _random_event(self.rng)
+        await bot_module.make_eventvote.callback(
+            interaction,
+            game_type,
+            game_date.strftime("%d-%m-%Y"),
+            game_time.strftime("%H:%M"),
+        )
+        message = interaction.followup.last_message
+        await self.vote_engine.handle_reaction(
+            FakeReaction(message.id, interaction.user.id, THUMBS_UP), added=True
+        )
+
+
+async def measure(
+    name: str,
+    scenario: Callable[[int], Awaitable[None]],
+    operations: int,
+    concurrency: int,
+) -> Result:
+    """Run a scenario the given number of times, from concurrency workers"""
+    latencies: List[float] = []
+    errors = 0
+    counter = iter(range(operations))
+
+    async def worker() -> None:
+        nonlocal errors
+        for i in counter:
+            start = time.perf_counter()
+            try:
+                await scenario(i)
+            except Exception as err:  # pylint: disable=broad-except
+                errors += 1
+                logger.error("%s failed: %r", name, err)
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return Result(name, operations, errors, time.perf_counter() - start, latencies)
+
+
+def report(results: List[Result]) -> str:
+    """Format the results as a table"""
+    lines = [
+        f"{'scenario':<18}{'ops':>8}{'errors':>8}{'ops/s':>10}{'p50 ms':>10}{'p99 ms':>10}"
+    ]
+    for result in results:
+        lines.append(
+            f"{result.name:<18}{result.operations:>8}{result.errors:>8}"
+            f"{result.operations / result.elapsed:>10.1f}"
+            f"{result.percentile(50) * 1000:>10.3f}{result.percentile(99) * 1000:>10.3f}"
+        )
+    return "\n".join(lines)
+
+
+async def main(args: argparse.Namespace) -> List[Result]:
+    """Set up the backend, seed it, and run each requested scenario in turn"""
+    directory = None
+    if args.backend == "postgres":
+        pool = bot_module.pool
+    elif args.backend == "sqlite":
+        directory = tempfile.TemporaryDirectory(prefix="paps-bench-")
+        pool = SQLitePool(os.path.join(directory.name, "bench.sqlite3"))
+    else:
+        pool = MemoryPool()
+    await pool.open()
+    await EventRepository(pool).migrate()
+    bench = Bench(
+        pool, cache=not args.no_cache, seed=args.seed, shared=args.backend == "postgres"
+    )
+    scenarios: Dict[str, Callable[[int], Awaitable[None]]] = {
+        "make-event-novote": bench.make_event_novote,
+        "list-events": bench.list_events,
+        "edit-event": bench.edit_event,
+        "vote": bench.vote,
+        "delete-event": bench.delete_event,
+    }
+    results = []
+    try:
+        await bench.seed(args.events)
+        for name in args.scenarios or scenarios:
+            results.append(
+                await measure(name, scenarios[name], args.operations, args.concurrency)
+            )
+    finally:
+        await bench.cleanup()
+        await pool.close()
+        if directory is not None:
+            directory.cleanup()
+    return results
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    """Command line options"""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument(
+        "--backend", choices=("memory", "sqlite", "postgres"), default="memory"
+    )
+    parser.add_argument(
+        "--events", type=int, default=1000, help="events seeded before the run"
+    )
+    parser.add_argument(
+        "--operations", type=int, default=500, help="calls per scenario"
+    )
+    parser.add_argument(
+        "--concurrency", type=int, default=8, help="handlers in flight at once"
+    )
+    parser.add_argument(
+        "--no-cache", action="store_true", help="read every list through to storage"
+    )
+    parser.add_argument("--seed", type=int, default=0, help="random seed")
+    parser.add_argument(
+        "--scenarios",
+        nargs="*",
+        choices=(
+            "make-event-novote",
+            "list-events",
+            "edit-event",
+            "vote",
+            "delete-event",
+        ),
+        help="scenarios to run, all of them by default",
+    )
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    # the handlers log a banner per call, which would dominate the timings
+    logger.setLevel(logging.ERROR)
+    logging.basicConfig(format="%(levelname)s %(message)s")
+    results = asyncio.run(main(parse_args()))
+    print(report(results))
+    # failed operations are only counted, the run itself would still succeed
+    if any(result.errors for result in results):
+        sys.exit(1)
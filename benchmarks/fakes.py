@@ -0,0 +1,163 @@
+"""
+Stand-ins for the discord objects the command handlers touch
+"""
+
+import itertools
+from typing import List, Optional
+
+# message ids are handed out from a counter, shaped like (large) discord snowflakes
+_message_ids = itertools.count(1 << 40)
+
+
+class FakeAsset:
+    """An avatar"""
+
+    url = "https://cdn.discordapp.com/embed/avatars/0.png"
+
+
+class FakeUser:
+    """A guild member or the bot itself"""
+
+    def __init__(self, user_id: int, name: str = "benchmark"):
+        self.id = user_id
+        self.name = name
+        self.mention = f"<@{user_id}>"
+        self.avatar = FakeAsset()
+        self.display_avatar = self.avatar
+
+    def __str__(self) -> str:
+        return self.name
+
+
+class FakeGuild:
+    """Just enough of a guild to carry its id"""
+
+    def __init__(self, guild_id: int):
+        self.id = guild_id
+
+
+class FakeMessage:
+    """A sent message, reactions added to it are only counted"""
+
+    def __init__(self, channel: "FakeChannel", embed=None, content=None):
+        self.id = next(_message_ids)
+        self.channel = channel
+        self.guild = channel.guild
+        self.embed = embed
+        self.content = content
+        self.reactions: List[str] = []
+
+    async def add_reaction(self, emoji: str) -> None:
+        """Record a reaction"""
+        self.reactions.append(emoji)
+
+    async def edit(self, **_kwargs) -> None:
+        """Messages are never rendered, so edits are dropped"""
+
+
+class FakeChannel:
+    """A text channel that remembers how many messages were sent to it"""
+
+    def __init__(self, channel_id: int, guild: FakeGuild):
+        self.id = channel_id
+        self.guild = guild
+        self.sent = 0
+        self.last_message: Optional[FakeMessage] = None
+
+    async def send(self, content=None, *, embed=None, **_kwargs) -> FakeMessage:
+        """Send a message"""
+        self.sent += 1
+        self.last_message = FakeMessage(self, embed=embed, content=content)
+        return self.last_message
+
+
+class FakeResponse:
+    """Interaction.response, only the first reply is a response as on discord"""
+
+    def __init__(self, interaction: "FakeInteraction"):
+        self.interaction = interaction
+        self.done = False
+
+    def is_done(self) -> bool:
+        """Whether the interaction was responded to"""
+        return self.done
+
+    async def _respond(self, content=None, embed=None) -> None:
+        if self.done:
+            raise RuntimeError("this interaction has already been responded to")
+        self.done = True
+        self.interaction.message = FakeMessage(
+            self.interaction.channel, embed=embed, content=content
+        )
+
+    async def send_message(self, content=None, *, embed=None, **_kwargs) -> None:
+        """Reply to the interaction"""
+        await self._respond(content, embed)
+
+    async def defer(self, **_kwargs) -> None:
+        """Acknowledge the interaction, replies then go through the followup"""
+        await self._respond()
+
+    async def edit_message(self, *, embed=None, **_kwargs) -> None:
+        """Edit the message a component was used on"""
+        await self._respond(embed=embed)
+
+
+class FakeFollowup:
+    """Interaction.followup"""
+
+    def __init__(self, interaction: "FakeInteraction"):
+        self.interaction = interaction
+        self.last_message: Optional[FakeMessage] = None
+
+    async def send(
+        self, content=None, *, embed=None, wait: bool = False, **_kwargs
+    ) -> Optional[FakeMessage]:
+        """Send a followup message, returned only when waited for"""
+        self.last_message = await self.interaction.channel.send(content, embed=embed)
+        return self.last_message if wait else None
+
+
+class FakeInteraction:
+    """A slash command invocation by a user in a guild channel"""
+
+    def __init__(self, user: FakeUser, channel: FakeChannel):
+        self.user = user
+        self.channel = channel
+        self.channel_id = channel.id
+        self.guild = channel.guild
+        self.guild_id = channel.guild.id
+        self.response = FakeResponse(self)
+        self.followup = FakeFollowup(self)
+        self.message: Optional[FakeMessage] = None
+
+    async def original_response(self) -> FakeMessage:
+        """The message sent in response to the interaction"""
+        if self.message is None:
+            raise RuntimeError("the interaction was not responded to")
+        return self.message
+
+
+class FakeClient:
+    """The parts of the bot client used by the vote engine and signup tracker"""
+
+    def __init__(self, guild: FakeGuild, bot_user_id: int = 1):
+        self.user = FakeUser(bot_user_id, "paps-bot")
+        self.guild = guild
+        self._channels = {}
+
+    def get_partial_messageable(self, channel_id: int) -> FakeChannel:
+        """A channel to send to by id"""
+        channel = self._channels.get(channel_id)
+        if channel is None:
+            channel = self._channels[channel_id] = FakeChannel(channel_id, self.guild)
+        return channel
+
+
+class FakeReaction:
+    """A raw reaction event on a message"""
+
+    def __init__(self, message_id: int, user_id: int, emoji: str):
+        self.message_id = message_id
+        self.user_id = user_id
+        self.emoji = emoji
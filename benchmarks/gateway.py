@@ -0,0 +1,147 @@
+"""
+Load fake guilds into discord.py's caches under each gateway mode and report the memory they hold
+
+    python -m benchmarks.gateway --guilds 20 --members 20000
+
+Each mode runs in a fresh process, so its resident memory growth is its own.
+Full mode is fed every member in GUILD_CREATE, as if chunking had finished.
+"""
+
+import time
+import argparse
+import tracemalloc
+import concurrent.futures
+import multiprocessing
+from typing import Dict, List, NamedTuple, Tuple
+import discord
+from paps_bot.footprint import footprint, rss_bytes
+from paps_bot.gateway import FULL, LEAN, gateway_options
+
+BENCHMARK_GUILD_ID = 7_270_000_000
+# subsystems shown per mode
+TOP_SUBSYSTEMS = 3
+
+
+class Footprint(NamedTuple):
+    """Memory held once the guilds were loaded under one mode"""
+
+    mode: str
+    members: int
+    traced: int
+    rss_growth: int
+    elapsed: float
+    subsystems: List[Tuple[str, int, int]]
+
+
+def _member(user_id: int) -> Dict:
+    return {
+        "user": {
+            "id": str(user_id),
+            "username": f"member{user_id}",
+            "discriminator": "0",
+            "avatar": None,
+            "global_name": None,
+        },
+        "roles": [],
+        "joined_at": "2023-01-01T00:00:00+00:00",
+        "deaf": False,
+        "mute": False,
+        "flags": 0,
+    }
+
+
+def _guild(guild_id: int, members: int) -> Dict:
+    return {
+        "id": str(guild_id),
+        "name": f"guild {guild_id}",
+        "member_count": members,
+        "large": True,
+        "members": [_member(guild_id * 1_000_000 + i) for i in range(members)],
+        "roles": [
+            {
+                "id": str(guild_id),
+                "name": "@everyone",
+                "permissions": "0",
+                "position": 0,
+                "color": 0,
+                "hoist": False,
+                "managed": False,
+                "mentionable": False,
+            }
+        ],
+        "channels": [],
+    }
+
+
+def measure(mode: str, guilds: int, members: int) -> Footprint:
+    """Load the guilds into a client's connection state, in the calling process"""
+    client = discord.Client(**gateway_options(mode))
+    state = client._connection  # pylint: disable=protected-access
+    rss_before = rss_bytes()
+    tracemalloc.start()
+    start = time.perf_counter()
+    for i in range(guilds):
+        # payloads are dropped once parsed, as the gateway does
+        state._add_guild_from_data(  # pylint: disable=protected-access
+            _guild(BENCHMARK_GUILD_ID + i, members)
+        )
+    elapsed = time.perf_counter() - start
+    snapshot = tracemalloc.take_snapshot()
+    traced = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return Footprint(
+        mode,
+        sum(len(guild.members) for guild in client.guilds),
+        traced,
+        rss_bytes() - rss_before,
+        elapsed,
+        footprint(snapshot),
+    )
+
+
+def report(results: List[Footprint]) -> str:
+    """Format the results as a table"""
+    lines = [
+        f"{'mode':<8}{'cached':>10}{'traced MiB':>12}{'RSS +MiB':>10}{'load s':>8}  largest"
+    ]
+    for result in results:
+        largest = ", ".join(
+            f"{name} {size / 2**20:.1f}"
+            for name, size, _ in result.subsystems[:TOP_SUBSYSTEMS]
+        )
+        lines.append(
+            f"{result.mode:<8}{result.members:>10}{result.traced / 2**20:>12.1f}"
+            f"{result.rss_growth / 2**20:>10.1f}{result.elapsed:>8.2f}  {largest}"
+        )
+    return "\n".join(lines)
+
+
+def main(args: argparse.Namespace) -> List[Footprint]:
+    """Measure each mode in a process of its own"""
+    results = []
+    context = multiprocessing.get_context("spawn")
+    for mode in args.modes:
+        with concurrent.futures.ProcessPoolExecutor(1, mp_context=context) as pool:
+            results.append(
+                pool.submit(measure, mode, args.guilds, args.members).result()
+            )
+    return results
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    """Command line options"""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--guilds", type=int, default=10, help="guilds loaded")
+    parser.add_argument("--members", type=int, default=10000, help="members per guild")
+    parser.add_argument(
+        "--modes",
+        nargs="*",
+        choices=(LEAN, FULL),
+        default=[FULL, LEAN],
+        help="gateway modes to measure",
+    )
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    print(report(main(parse_args())))
@@ -0,0 +1,222 @@
+"""
+An in-process stand-in for postgreSQL, behind the same ConnectionPool interface
+"""
+
+import asyncio
+import itertools
+from bisect import bisect_left, bisect_right, insort
+from datetime import date
+from typing import Dict, List, Optional, Tuple
+from paps_bot.repository import EventPage, EventRow, VoteRow
+from paps_bot.sharding import shard_for_guild
+
+
+def _owned(guild_id: int, shards) -> bool:
+    return shards is None or shard_for_guild(guild_id, shards[0]) in shards[1]
+
+
+class MemoryDatabase:
+    """
+    Implements each repository query function by name on plain dicts, with
+    the events of every guild kept in (date, time, id) order like the indexes do.
+    The semantics follow the SQL in paps_bot.repository, not the performance.
+    """
+
+    def __init__(self):
+        self._ids = itertools.count(1)
+        # game_id -> [guild_id, channel_id, game_type, game_date, game_time, message_id]
+        self.events: Dict[int, list] = {}
+        # guild_id -> sorted [(game_date, game_time, game_id)]
+        self.order: Dict[int, List[tuple]] = {}
+        # message_id -> [vote row as a list, status]
+        self.votes: Dict[int, list] = {}
+        self.attendees: Dict[Tuple[int, int], str] = {}
+        self.state: Dict[str, str] = {}
+
+    @staticmethod
+    def apply_migrations() -> int:
+        return 0
+
+    def _row(self, game_id: int) -> EventRow:
+        _, _, game_type, game_date, game_time, _ = self.events[game_id]
+        return (game_id, game_type, game_date, game_time)
+
+    def _insert_event(
+        self, guild_id, channel_id, game_type, game_date, game_time, duration=180
+    ):
+        game_id = next(self._ids)
+        self.events[game_id] = [
+            guild_id,
+            channel_id,
+            game_type,
+            game_date,
+            game_time,
+            None,
+        ]
+        insort(self.order.setdefault(guild_id, []), (game_date, game_time, game_id))
+        return game_id
+
+    def _copy_events(self, guild_id: int, channel_id, rows):
+        return [
+            self._row(self._insert_event(guild_id, channel_id, *row)) for row in rows
+        ]
+
+    def _drop_guild(self, guild_id: int) -> None:
+        for _, _, game_id in self.order.pop(guild_id, []):
+            del self.events[game_id]
+
+    def _select_events_page(
+        self, guild_id, column, value, cursor, backwards, limit, archived=False
+    ) -> EventPage:
+        if archived:
+            # nothing is ever archived here
+            return EventPage((), False)
+        keys = self.order.get(guild_id, [])
+        if cursor is None:
+            candidates = reversed(keys) if backwards else iter(keys)
+        elif backwards:
+            candidates = reversed(keys[: bisect_left(keys, tuple(cursor))])
+        else:
+            start = bisect_right(keys, tuple(cursor))
+            candidates = iter(keys[start:])
+        index = ("game_id", "game_type", "game_date", "game_time").index
+        if column == "game_id":
+            # postgres casts the text the handlers pass to the id's type
+            value = int(value)
+        rows = []
+        for _, _, game_id in candidates:
+            row = self._row(game_id)
+            if column is None or row[index(column)] == value:
+                rows.append(row)
+                if len(rows) > limit:
+                    break
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        if backwards:
+            rows.reverse()
+        return EventPage(tuple(rows), has_more)
+
+    def _delete_event(self, guild_id, game_id) -> bool:
+        event = self.events.get(game_id)
+        if event is None or event[0] != guild_id:
+            return False
+        del self.events[game_id]
+        self.order[guild_id].remove((event[3], event[4], game_id))
+        for key in [key for key in self.attendees if key[0] == game_id]:
+            del self.attendees[key]
+        return True
+
+    def _update_event(
+        self, guild_id, game_id, game_type, game_date, game_time, duration
+    ):
+        event = self.events.get(game_id)
+        if event is None or event[0] != guild_id:
+            return None
+        keys = self.order[guild_id]
+        keys.remove((event[3], event[4], game_id))
+        for index, value in ((2, game_type), (3, game_date), (4, game_time)):
+            if value is not None:
+                event[index] = value
+        insort(keys, (event[3], event[4], game_id))
+        return self._row(game_id), event[1]
+
+    def _insert_vote(self, vote: VoteRow) -> None:
+        self.votes[vote[0]] = [list(vote), "open"]
+
+    def _update_vote_tally(self, message_id, thumbs_up, thumbs_down) -> None:
+        vote = self.votes.get(message_id)
+        if vote is not None and vote[1] == "open":
+            vote[0][9:11] = [thumbs_up, thumbs_down]
+
+    def _close_vote(self, message_id, status) -> bool:
+        vote = self.votes.get(message_id)
+        if vote is None or vote[1] != "open":
+            return False
+        vote[1] = status
+        return True
+
+    def _pass_vote(self, message_id):
+        if not self._close_vote(message_id, "passed"):
+            return None
+        _, guild_id, channel_id, game_type, game_date, game_time = self.votes[
+            message_id
+        ][0][:6]
+        duration = self.votes[message_id][0][11]
+        game_id = self._insert_event(
+            guild_id, channel_id, game_type, game_date, game_time
+        )
+        return guild_id, channel_id, self._row(game_id), duration
+
+    def _select_upcoming_events(self, since: date, shards):
+        return [
+            (event[0], event[1], self._row(game_id))
+            for game_id, event in self.events.items()
+            if event[3] >= since and event[1] is not None and _owned(event[0], shards)
+        ]
+
+    def _select_open_votes(self, shards) -> List[VoteRow]:
+        return [
+            tuple(row)
+            for row, status in self.votes.values()
+            if status == "open" and _owned(row[1], shards)
+        ]
+
+    def _set_event_message(self, game_id, message_id) -> None:
+        if game_id in self.events:
+            self.events[game_id][5] = message_id
+
+    def _select_event_messages(self, since: date, shards):
+        return [
+            (event[5], game_id)
+            for game_id, event in self.events.items()
+            if event[3] >= since and event[5] is not None and _owned(event[0], shards)
+        ]
+
+    def _write_attendees(self, upserts, removals) -> None:
+        for game_id, user_id, status in upserts:
+            if game_id in self.events:
+                self.attendees[(game_id, user_id)] = status
+        for game_id, user_id, status in removals:
+            if self.attendees.get((game_id, user_id)) == status:
+                del self.attendees[(game_id, user_id)]
+
+    def _select_attendees(self, guild_id, game_id):
+        event = self.events.get(game_id)
+        if event is None or event[0] != guild_id:
+            return []
+        return [
+            (user_id, status)
+            for (g, user_id), status in self.attendees.items()
+            if g == game_id
+        ]
+
+    def _select_state(self, key):
+        return self.state.get(key)
+
+    def _upsert_state(self, key, value) -> None:
+        self.state[key] = value
+
+    def _insert_state_if_absent(self, key, value) -> str:
+        return self.state.setdefault(key, value)
+
+
+class MemoryPool:
+    """
+    Drop-in for ConnectionPool.run: the repository hands over its query
+    function and the call is answered by the MemoryDatabase method of that name.
+    Each call yields to the loop once, like a real round trip would.
+    """
+
+    def __init__(self, database: Optional[MemoryDatabase] = None):
+        self.database = database or MemoryDatabase()
+
+    async def open(self) -> None:
+        """Nothing to connect to"""
+
+    async def close(self) -> None:
+        """Nothing to disconnect from"""
+
+    async def run(self, func, *args):
+        """Answer func(conn, *args) from memory"""
+        await asyncio.sleep(0)
+        return getattr(self.database, func.__name__)(*args)
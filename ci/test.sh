@@ -0,0 +1,14 @@
+#!/usr/bin/env bash
+
+echo "Running the tests with pytest ..."
+echo "=================================================="
+
+python -m pytest -q
+status=$?
+# status 5 means no tests were collected, which is not a failure
+if [ "$status" -ne 0 ] && [ "$status" -ne 5 ]; then
+    exit 1
+fi
+
+echo "=================================================="
+echo "Done running the tests."
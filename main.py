@@ -1,9 +1,14 @@
 """
 Main entrypoint for the bot
 """
+
 import os
 import sys
-from paps_bot import paps_bot
+import signal
+import multiprocessing
+import multiprocessing.connection
+from typing import List
+from paps_bot.sharding import split_shards
 
 
 def read_token_from_env_var() -> str:
@@ -18,8 +23,63 @@ def read_token_from_env_var() -> str:
 
 
 DISCORD_TOKEN = read_token_from_env_var()
+# number of bot processes, each running its share of SHARD_COUNT shards
+WORKERS = int(os.environ.get("WORKERS", "1"))
+
+
+def run_worker(token: str, index: int, shard_ids: List[int], shard_count: int) -> None:
+    """Run the bot with a subset of the shards, in a worker process"""
+    os.environ["WORKER_INDEX"] = str(index)
+    os.environ["SHARD_IDS"] = ",".join(str(shard_id) for shard_id in shard_ids)
+    os.environ["SHARD_COUNT"] = str(shard_count)
+    # imported here, the bot reads its shards from the environment when it is created
+    from paps_bot import paps_bot
+
+    paps_bot.start(token=token)
+
+
+def run_workers(token: str, workers: int) -> int:
+    """
+    Split the shards over worker processes and wait for them. When one of
+    them exits the others are stopped too, so the container restarts as a whole.
+    """
+    shard_count = int(os.environ.get("SHARD_COUNT", str(workers)))
+    context = multiprocessing.get_context("spawn")
+    processes = [
+        context.Process(
+            target=run_worker,
+            args=(token, index, shard_ids, shard_count),
+            name=f"paps-bot-{index}",
+        )
+        for index, shard_ids in enumerate(split_shards(shard_count, workers))
+    ]
+    for process in processes:
+        process.start()
+
+    def stop(signum, _frame):
+        for process in processes:
+            if process.is_alive():
+                os.kill(process.pid, signum)
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    multiprocessing.connection.wait([process.sentinel for process in processes])
+    stop(signal.SIGTERM, None)
+    for process in processes:
+        process.join()
+    return max(abs(process.exitcode or 0) for process in processes)
 
 
 # run the bot
 if __name__ == "__main__":
+    if WORKERS > 1 and os.environ.get("DB_BACKEND") == "sqlite":
+        # workers learn about each other's writes through postgreSQL notifications
+        print(
+            "ERROR: WORKERS needs DB_BACKEND=postgres, a sqlite file serves one process."
+        )
+        sys.exit(1)
+    if WORKERS > 1:
+        sys.exit(run_workers(DISCORD_TOKEN, WORKERS))
+    from paps_bot import paps_bot
+
     paps_bot.start(token=DISCORD_TOKEN)
@@ -0,0 +1,193 @@
+"""
+In-memory prefix index of event values, answering slash command autocomplete without queries
+"""
+
+import logging
+from bisect import bisect_left, insort
+from datetime import date, time
+from typing import Dict, List, Optional, Tuple
+from paps_bot.repository import EventChange, EventRepository, EventRow
+
+# get the bot logger
+logger = logging.getLogger("discord")
+
+# discord shows at most 25 autocomplete choices
+MAX_CHOICES = 25
+# the date format the commands take
+DATE_FORMAT = "%d-%m-%Y"
+
+
+class PrefixIndex:
+    """
+    Counted strings in a sorted array, searched by case-insensitive prefix
+    with bisect, so a lookup costs O(log n) plus the matches returned.
+    """
+
+    def __init__(self):
+        self._keys: List[str] = []
+        # casefolded key -> (value as first seen, number of events holding it)
+        self._values: Dict[str, Tuple[str, int]] = {}
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def add(self, value: str) -> None:
+        """Count one more event holding the value"""
+        key = value.casefold()
+        entry = self._values.get(key)
+        if entry is None:
+            insort(self._keys, key)
+            self._values[key] = (value, 1)
+        else:
+            self._values[key] = (entry[0], entry[1] + 1)
+
+    def remove(self, value: str) -> None:
+        """Count one event less holding the value, forgetting it at zero"""
+        key = value.casefold()
+        entry = self._values.get(key)
+        if entry is None:
+            return
+        if entry[1] > 1:
+            self._values[key] = (entry[0], entry[1] - 1)
+            return
+        del self._values[key]
+        del self._keys[bisect_left(self._keys, key)]
+
+    def search(self, prefix: str, limit: int = MAX_CHOICES) -> List[str]:
+        """Values starting with the prefix, in sorted order"""
+        prefix = prefix.casefold()
+        found: List[str] = []
+        for i in range(bisect_left(self._keys, prefix), len(self._keys)):
+            key = self._keys[i]
+            if not key.startswith(prefix) or len(found) == limit:
+                break
+            found.append(self._values[key][0])
+        return found
+
+
+class GuildIndex:
+    """The autocomplete indexes of one guild"""
+
+    def __init__(self):
+        self.types = PrefixIndex()
+        self.ids = PrefixIndex()
+        self.dates = PrefixIndex()
+        # every event in (date, time, id) order, for suggestions before anything is typed
+        self.schedule: List[Tuple[date, time, int]] = []
+
+    def add(self, row: EventRow) -> None:
+        """Index an event"""
+        game_id, game_type, game_date, game_time = row
+        self.types.add(game_type)
+        self.ids.add(str(game_id))
+        self.dates.add(game_date.strftime(DATE_FORMAT))
+        insort(self.schedule, (game_date, game_time, game_id))
+
+    def remove(self, row: EventRow) -> None:
+        """Forget an event"""
+        game_id, game_type, game_date, game_time = row
+        self.types.remove(game_type)
+        self.ids.remove(str(game_id))
+        self.dates.remove(game_date.strftime(DATE_FORMAT))
+        key = (game_date, game_time, game_id)
+        index = bisect_left(self.schedule, key)
+        if index < len(self.schedule) and self.schedule[index] == key:
+            del self.schedule[index]
+
+    def upcoming(self, limit: int = MAX_CHOICES) -> List[int]:
+        """Ids of the next events from today on"""
+        start = bisect_left(self.schedule, (date.today(),))
+        stop = min(start + limit, len(self.schedule))
+        return [self.schedule[i][2] for i in range(start, stop)]
+
+
+class EventIndex:
+    """
+    Game types, event ids and dates of every event by guild, loaded once at
+    startup and kept in sync by the repository's write notifications.
+    """
+
+    def __init__(self, repository: EventRepository):
+        self.repository = repository
+        self._guilds: Dict[int, GuildIndex] = {}
+        # game_id -> (guild_id, row), to find what an update or delete replaces
+        self._rows: Dict[int, Tuple[int, EventRow]] = {}
+        repository.add_listener(self._on_change)
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    async def load(
+        self, events: Optional[List[Tuple[int, EventRow, int]]] = None
+    ) -> None:
+        """
+        Index every stored event, before any write can race with the read, or
+        the (guild_id, row, duration_minutes) of a state snapshot
+        """
+        if events is not None:
+            for guild_id, row, _ in events:
+                self._add(guild_id, row)
+        else:
+            async for rows in self.repository.stream_all_events():
+                for guild_id, row, _ in rows:
+                    self._add(guild_id, row)
+        logger.info(
+            "Indexed %s event(s) of %s guild(s) for autocomplete.",
+            len(self._rows),
+            len(self._guilds),
+        )
+
+    def clear(self) -> None:
+        """Forget every indexed event, before loading them again"""
+        self._guilds.clear()
+        self._rows.clear()
+
+    def _add(self, guild_id: int, row: EventRow) -> None:
+        self._remove(row[0])
+        self._rows[row[0]] = (guild_id, row)
+        self._guilds.setdefault(guild_id, GuildIndex()).add(row)
+
+    def _remove(self, game_id: int) -> None:
+        indexed = self._rows.pop(game_id, None)
+        if indexed is not None:
+            self._guilds[indexed[0]].remove(indexed[1])
+
+    def _on_change(self, change: EventChange) -> None:
+        if change.row is None:
+            self._remove(change.game_id)
+        else:
+            self._add(change.guild_id, change.row)
+
+    def game_types(self, guild_id: int, prefix: str) -> List[str]:
+        """A guild's game types starting with the prefix"""
+        guild = self._guilds.get(guild_id)
+        return guild.types.search(prefix) if guild is not None else []
+
+    def events(self, guild_id: int, prefix: str) -> List[EventRow]:
+        """A guild's events whose id starts with the prefix, upcoming ones when it is empty"""
+        guild = self._guilds.get(guild_id)
+        if guild is None:
+            return []
+        if prefix.strip():
+            game_ids = [int(game_id) for game_id in guild.ids.search(prefix.strip())]
+        else:
+            game_ids = guild.upcoming()
+        return [self._rows[game_id][1] for game_id in game_ids]
+
+    def dates(self, guild_id: int, prefix: str) -> List[str]:
+        """A guild's event dates as DD-MM-YYYY starting with the prefix, in date order"""
+        guild = self._guilds.get(guild_id)
+        if guild is None:
+            return []
+        if not prefix.strip():
+            found: List[str] = []
+            start = bisect_left(guild.schedule, (date.today(),))
+            for i in range(start, len(guild.schedule)):
+                formatted = guild.schedule[i][0].strftime(DATE_FORMAT)
+                if not found or found[-1] != formatted:
+                    found.append(formatted)
+                if len(found) == MAX_CHOICES:
+                    break
+            return found
+        found = guild.dates.search(prefix.strip())
+        return sorted(found, key=lambda value: value.split("-")[::-1])
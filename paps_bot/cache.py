@@ -0,0 +1,172 @@
+"""
+In-memory read-through cache for paps_table queries
+"""
+
+import time
+import logging
+from collections import OrderedDict
+from datetime import date, datetime
+from datetime import time as dt_time
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+
+# get the bot logger
+logger = logging.getLogger("discord")
+
+# a cache key is the guild, the filter column (None for "all events") and its normalised value
+FilterKey = Tuple[int, Optional[str], Any]
+# each filter holds several result pages, keyed by the keyset cursor and page size
+PageKey = Hashable
+
+FILTER_COLUMNS = ("game_id", "game_type", "game_date", "game_time")
+
+
+def filter_key(guild_id: int, column: Optional[str], value: Any) -> FilterKey:
+    """
+    Normalise a filter so that equal SQL comparisons share one cache key,
+    e.g. game_id "5" and 5, or game_time "18:00" and time(18, 0)
+    """
+    if column is None:
+        return (guild_id, None, None)
+    try:
+        if column == "game_id":
+            value = int(value)
+        elif column == "game_date" and isinstance(value, str):
+            value = date.fromisoformat(value)
+        elif column == "game_time" and isinstance(value, str):
+            value = dt_time.fromisoformat(value)
+        elif column == "game_date" and isinstance(value, datetime):
+            value = value.date()
+    except ValueError:
+        # unparseable filters still get a (never invalidated by rows) key of their own
+        pass
+    return (guild_id, column, value)
+
+
+def keys_for_row(guild_id: int, row) -> Tuple[FilterKey, ...]:
+    """Every cache key whose result set contains the given event row"""
+    return ((guild_id, None, None),) + tuple(
+        filter_key(guild_id, column, value)
+        for column, value in zip(FILTER_COLUMNS, row)
+    )
+
+
+def _pages_hold(pages: Dict[PageKey, Any], game_id: int) -> bool:
+    return any(row[0] == game_id for page in pages.values() for row in page.rows)
+
+
+class EventCache:
+    """
+    LRU cache with a TTL, holding pages of event query results keyed per filter.
+    Cached pages are immutable and expose their event rows as `.rows`.
+
+    Entries are invalidated precisely from the write paths; the generation
+    counter stops a read that raced with a write from storing stale rows.
+    """
+
+    def __init__(self, max_entries: int = 256, ttl: float = 300.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        # filter key -> (expiry time, {page key: page})
+        self._entries: "OrderedDict[FilterKey, Tuple[float, Dict[PageKey, Any]]]" = (
+            OrderedDict()
+        )
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: FilterKey, page: PageKey = None) -> Any:
+        """Return a cached page of a filter, or None on a miss"""
+        entry = self._entries.get(key)
+        if entry is not None:
+            expires, pages = entry
+            if expires <= time.monotonic():
+                del self._entries[key]
+            elif page in pages:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return pages[page]
+        self.misses += 1
+        return None
+
+    def put(self, key: FilterKey, value, generation: int, page: PageKey = None) -> None:
+        """Store a page fetched while the cache was at the given generation"""
+        if generation != self.generation:
+            # a write landed while the query was in flight, the rows may be stale
+            return
+        entry = self._entries.get(key)
+        if entry is None or entry[0] <= time.monotonic():
+            entry = (time.monotonic() + self.ttl, {})
+            self._entries[key] = entry
+        entry[1][page] = value
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, *keys: FilterKey) -> None:
+        """Drop the given keys"""
+        self.generation += 1
+        for key in keys:
+            if self._entries.pop(key, None) is not None:
+                self.invalidations += 1
+
+    def invalidate_game(self, guild_id: int, game_id: int, new_row=None) -> None:
+        """
+        Drop every entry that contains the event, and every entry the event's
+        new values would now match.
+        """
+        stale = [
+            key
+            for key, (_, pages) in self._entries.items()
+            if key[0] == guild_id and _pages_hold(pages, game_id)
+        ]
+        if new_row is not None:
+            stale.extend(keys_for_row(guild_id, new_row))
+        else:
+            stale.append(filter_key(guild_id, "game_id", game_id))
+        self.invalidate(*stale)
+
+    def invalidate_guild(self, guild_id: int) -> None:
+        """Drop every entry of a guild"""
+        self.invalidate(*[key for key in self._entries if key[0] == guild_id])
+
+    def clear(self) -> None:
+        """Drop everything"""
+        self.invalidate(*list(self._entries))
+
+    def snapshot(self) -> List[Tuple[FilterKey, float, Dict[PageKey, Any]]]:
+        """Live entries, least recently used first, with their seconds left to live"""
+        now = time.monotonic()
+        return [
+            (key, expires - now, pages)
+            for key, (expires, pages) in self._entries.items()
+            if expires > now
+        ]
+
+    def restore(
+        self, entries: List[Tuple[FilterKey, float, Dict[PageKey, Any]]]
+    ) -> None:
+        """Load the entries of another process' snapshot()"""
+        now = time.monotonic()
+        for key, remaining, pages in entries:
+            self._entries[key] = (now + remaining, pages)
+            self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def stats(self) -> Dict[str, float]:
+        """Hit/miss counters and current size"""
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+            "entries": len(self._entries),
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
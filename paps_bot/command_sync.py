@@ -0,0 +1,48 @@
+"""
+Sync the slash command tree with discord only when the registered commands changed
+"""
+
+import json
+import hashlib
+import logging
+from discord import app_commands
+from paps_bot.repository import EventRepository
+
+# get the bot logger
+logger = logging.getLogger("discord")
+
+
+def command_tree_fingerprint(tree: app_commands.CommandTree) -> str:
+    """
+    Stable hash of every global command as discord receives it, names,
+    descriptions, parameters, permissions and all, independent of
+    the order the commands were registered in.
+    """
+    payload = sorted(
+        (command.to_dict() for command in tree.get_commands()),
+        key=lambda command: (command["name"], command.get("type", 1)),
+    )
+    encoded = json.dumps(payload, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(encoded.encode()).hexdigest()
+
+
+async def sync_command_tree(
+    tree: app_commands.CommandTree,
+    repository: EventRepository,
+    application_id: int,
+    force: bool = False,
+) -> bool:
+    """
+    Upload the command tree unless discord already has this exact version,
+    returns whether it was uploaded. The fingerprint is stored per application,
+    so bots sharing a database do not skip each other's syncs.
+    """
+    key = f"command_tree_fingerprint:{application_id}"
+    fingerprint = command_tree_fingerprint(tree)
+    if not force and await repository.get_state(key) == fingerprint:
+        logger.info("Command tree unchanged (%s), skipping sync.", fingerprint[:12])
+        return False
+    synced = await tree.sync()
+    await repository.set_state(key, fingerprint)
+    logger.info("Synced %s command(s), fingerprint %s.", len(synced), fingerprint[:12])
+    return True
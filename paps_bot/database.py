@@ -3,81 +3,277 @@ Database related functions for use with paps-bot
 """
 
 import os
-import sys
+import time
+import asyncio
 import logging
+import secrets
+import functools
+from collections import deque
+from typing import AsyncIterator, Dict, Optional, Protocol
+from contextlib import asynccontextmanager
+from concurrent.futures import ThreadPoolExecutor
 import psycopg2
-from psycopg2 import sql
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE
+from paps_bot.metrics import DB_ERRORS, DB_POOL_WAIT, DB_QUERY_DURATION
+from paps_bot.queries import PreparedConnection
 
 # get the bot logger
 logger = logging.getLogger("discord")
 
 
+# the env vars a postgreSQL connection needs, by libpq keyword
+DB_ENV_VARS = (
+    ("host", "DB_HOST"),
+    ("port", "DB_PORT"),
+    ("user", "DB_USER"),
+    ("password", "DB_PASSWORD"),
+    ("dbname", "DB_NAME"),
+)
+
+
 def create_db_connection_string_from_env_vars() -> str:
-    """read environment variables and build libpq connection string"""
-    # read each env var and check that it gets a value, otherwise print a message to user and exit
-    db_host = os.getenv("DB_HOST", None)
-    if not db_host:
-        print("ERROR: 'DB_HOST' env var not set.")
-        sys.exit(1)
+    """Build the libpq connection string from the DB_* env vars, naming any that are missing"""
+    missing = [name for _, name in DB_ENV_VARS if not os.getenv(name)]
+    if missing:
+        raise ValueError(
+            f"{', '.join(missing)} not set, set them or use DB_BACKEND=sqlite"
+        )
+    return " ".join(f"{keyword}={os.getenv(name)}" for keyword, name in DB_ENV_VARS)
+
 
-    db_name = os.getenv("DB_NAME", None)
-    if not db_name:
-        print("ERROR: 'DB_NAME' env var not set.")
-        sys.exit(1)
+class StoragePool(Protocol):
+    """
+    What the repository needs from a storage backend. Query functions are
+    handed over whole and a backend may run them, as ConnectionPool does, or
+    answer them by name with its own implementation. Errors are raised as
+    psycopg2.Error, which every caller handles.
+    """
 
-    db_user = os.getenv("DB_USER", None)
-    if not db_user:
-        print("ERROR: 'DB_USER' env var not set.")
-        sys.exit(1)
+    # identifies this process's writes to other processes, None if none share the storage
+    application_name: Optional[str]
 
-    db_password = os.getenv("DB_PASSWORD", None)
-    if not db_password:
-        print("ERROR: 'DB_PASSWORD' env var not set.")
-        sys.exit(1)
+    async def open(self) -> None:
+        """Connect"""
 
-    db_port = os.getenv("DB_PORT", None)
-    if not db_port:
-        print("ERROR: 'DB_PORT' env var not set.")
-        sys.exit(1)
+    async def close(self) -> None:
+        """Disconnect"""
 
-    connection_string = f"host={db_host} port={db_port} user={db_user} password={db_password} dbname={db_name}"
-    print(connection_string)
-    return connection_string
+    async def run(self, func, *args):
+        """Run func(conn, *args), or the backend's function of that name"""
 
+    async def in_thread(self, func, *args):
+        """Run a blocking function on the backend's threads"""
 
-DB_CONNECTION_STRING = create_db_connection_string_from_env_vars()
+    def stream(self, open_cursor, *args, batch: int) -> AsyncIterator[list]:
+        """Yield batches of the rows of the cursor open_cursor(conn, *args) returns"""
 
+    def stats(self) -> Dict[str, int]:
+        """Open, idle and borrowed connection counts"""
 
-def create_connection():
-    """Function establishing connection to database"""
-    conn = None
+
+async def fetch_batches(pool: StoragePool, cur, batch: int) -> AsyncIterator[list]:
+    """Fetch a cursor's rows batch by batch on the pool's threads, closing it at the end"""
     try:
-        conn = psycopg2.connect(DB_CONNECTION_STRING)
-    except psycopg2.DatabaseError as err:
-        print(err)
-    return conn
+        while True:
+            rows = await pool.in_thread(cur.fetchmany, batch)
+            if not rows:
+                break
+            yield rows
+    finally:
+        await pool.in_thread(cur.close)
+
 
+class PoolTimeout(psycopg2.OperationalError):
+    """Raised when no pooled connection became available within the acquire timeout"""
 
-def create_table_sql():
+
+class ConnectionPool:
     """
-    Function creating a blank table, if it does not already exist, in postgreSQL
+    Bounded pool of psycopg2 connections for use from the asyncio event loop.
+
+    Every query runs on a dedicated thread executor, so the discord.py loop is
+    never blocked by network round trips to postgreSQL.
     """
-    conn = create_connection()
-    cur = conn.cursor()
-    table_name = "paps_table"
-    sql_table_query = sql.SQL(
-        f"""CREATE TABLE IF NOT EXISTS {table_name} (
-        game_id SERIAL PRIMARY KEY,
-        game_type VARCHAR(255) NOT NULL,
-        game_date DATE NOT NULL,
-        game_time TIME NOT NULL
+
+    def __init__(
+        self,
+        dsn: str,
+        *,
+        min_size: int = 1,
+        max_size: int = 5,
+        acquire_timeout: float = 10.0,
+        health_check_interval: float = 30.0,
+        application_name: Optional[str] = None,
+    ):
+        if min_size < 0 or max_size < 1 or min_size > max_size:
+            raise ValueError(
+                "pool sizes must satisfy 0 <= min_size <= max_size, max_size >= 1"
+            )
+        self.dsn = dsn
+        self.min_size = min_size
+        self.max_size = max_size
+        self.acquire_timeout = acquire_timeout
+        self.health_check_interval = health_check_interval
+        # identifies this process's connections, e.g. as the origin of notifications
+        self.application_name = application_name
+        # idle connections, with the monotonic time they were last handed back
+        self._idle: deque = deque()
+        self._size = 0
+        self._slots = asyncio.Semaphore(max_size)
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_size, thread_name_prefix="paps-db"
+        )
+        self._closed = False
+
+    async def in_thread(self, func, *args):
+        """Run a blocking function on the pool's executor"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._executor, functools.partial(func, *args)
         )
-        """
+
+    async def _connect(self):
+        conn = await self.in_thread(self.connect)
+        self._size += 1
+        return conn
+
+    def connect(self):
+        """Open a connection outside the pool, blocking"""
+        kwargs = {"connection_factory": PreparedConnection}
+        if self.application_name is not None:
+            kwargs["application_name"] = self.application_name
+        return psycopg2.connect(self.dsn, **kwargs)
+
+    async def _discard(self, conn) -> None:
+        self._size -= 1
+        if not conn.closed:
+            await self.in_thread(conn.close)
+
+    @staticmethod
+    def _ping(conn) -> None:
+        with conn.cursor() as cur:
+            cur.execute("SELECT 1")
+        conn.rollback()
+
+    async def open(self) -> None:
+        """Establish the minimum number of connections up front"""
+        logger.info(
+            "Opening postgreSQL connection pool (min %s, max %s)...",
+            self.min_size,
+            self.max_size,
+        )
+        for _ in range(self.min_size - self._size):
+            self._idle.append((await self._connect(), time.monotonic()))
+
+    async def close(self) -> None:
+        """Close every idle connection and stop handing out new ones"""
+        self._closed = True
+        while self._idle:
+            conn, _ = self._idle.popleft()
+            await self._discard(conn)
+        self._executor.shutdown(wait=False)
+        logger.info("postgreSQL connection pool closed.")
+
+    async def _checkout(self):
+        """Take an idle connection, verifying stale ones, or open a new one"""
+        while self._idle:
+            conn, last_used = self._idle.pop()
+            if conn.closed:
+                await self._discard(conn)
+                continue
+            if time.monotonic() - last_used > self.health_check_interval:
+                try:
+                    await self.in_thread(self._ping, conn)
+                except psycopg2.Error as err:
+                    logger.warning("Dropping broken pooled connection: %s", err)
+                    await self._discard(conn)
+                    continue
+            return conn
+        return await self._connect()
+
+    async def _checkin(self, conn) -> None:
+        """Hand a connection back, never leaving a transaction open on it"""
+        if self._closed or conn.closed:
+            await self._discard(conn)
+            return
+        if conn.get_transaction_status() != TRANSACTION_STATUS_IDLE:
+            try:
+                await self.in_thread(conn.rollback)
+            except psycopg2.Error:
+                await self._discard(conn)
+                return
+        self._idle.append((conn, time.monotonic()))
+
+    @asynccontextmanager
+    async def connection(self):
+        """Borrow a connection from the pool for the duration of the block"""
+        if self._closed:
+            raise psycopg2.InterfaceError("connection pool is closed")
+        waited = time.perf_counter()
+        try:
+            await asyncio.wait_for(self._slots.acquire(), self.acquire_timeout)
+        except asyncio.TimeoutError as err:
+            DB_POOL_WAIT.observe(time.perf_counter() - waited)
+            raise PoolTimeout(
+                f"no database connection available after {self.acquire_timeout}s"
+            ) from err
+        conn = None
+        try:
+            conn = await self._checkout()
+            DB_POOL_WAIT.observe(time.perf_counter() - waited)
+            yield conn
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            # the connection is most likely dead, make sure the next caller reconnects
+            if conn is not None:
+                await self._discard(conn)
+                conn = None
+            raise
+        finally:
+            if conn is not None:
+                await self._checkin(conn)
+            self._slots.release()
+
+    async def run(self, func, *args):
+        """Run func(conn, *args) on a pooled connection without blocking the loop"""
+        query = func.__name__.lstrip("_")
+        try:
+            async with self.connection() as conn:
+                with DB_QUERY_DURATION.time(query=query):
+                    return await self.in_thread(func, conn, *args)
+        except psycopg2.Error:
+            DB_ERRORS.inc(query=query)
+            raise
+
+    async def stream(self, open_cursor, *args, batch: int) -> AsyncIterator[list]:
+        """Fetch batches from the server-side cursor open_cursor(conn, *args) returns"""
+        async with self.connection() as conn:
+            cur = await self.in_thread(open_cursor, conn, *args)
+            async for rows in fetch_batches(self, cur, batch):
+                yield rows
+
+    def stats(self) -> Dict[str, int]:
+        """Open, idle and borrowed connection counts"""
+        return {
+            "size": self._size,
+            "idle": len(self._idle),
+            "in_use": self._size - len(self._idle),
+        }
+
+
+def create_pool_from_env_vars() -> ConnectionPool:
+    """
+    Build the postgreSQL pool, sized by the optional DB_POOL_* env vars.
+    DB_BACKEND=sqlite is built by paps_bot.sqlite.create_sqlite_pool_from_env_vars.
+    """
+    backend = os.getenv("DB_BACKEND", "postgres")
+    if backend != "postgres":
+        raise ValueError(f"unknown DB_BACKEND {backend!r}, use postgres or sqlite")
+    return ConnectionPool(
+        create_db_connection_string_from_env_vars(),
+        min_size=int(os.getenv("DB_POOL_MIN_SIZE", "1")),
+        max_size=int(os.getenv("DB_POOL_MAX_SIZE", "5")),
+        acquire_timeout=float(os.getenv("DB_POOL_TIMEOUT", "10")),
+        health_check_interval=float(os.getenv("DB_POOL_HEALTH_CHECK", "30")),
+        # unique per process, so a bot can tell its own writes from other bots'
+        application_name=f"paps-bot-{secrets.token_hex(4)}",
     )
-    try:
-        cur.execute(sql_table_query)
-        conn.commit()
-        cur.close()
-        conn.close()
-    except psycopg2.Error as err:
-        logger.error("Error creating table: %s", str(err))
@@ -0,0 +1,281 @@
+"""
+Per-guild iCalendar subscription feeds, kept in memory and served over HTTP
+"""
+
+import hmac
+import asyncio
+import hashlib
+import logging
+import secrets
+from datetime import date, datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Dict, Optional, Set, Tuple
+from aiohttp import web
+import psycopg2
+from paps_bot.metrics import FEED_RESPONSES
+from paps_bot.recurrence import HORIZON, Recurrence
+from paps_bot.repository import EventChange, EventRepository
+from paps_bot.sharding import ShardOwnership
+from paps_bot.transfer import ICS_FOOTER, ICS_HEADER, ics_event, ics_stamp
+
+# get the bot logger
+logger = logging.getLogger("discord")
+
+# how often subscribed calendar apps are told to poll, clients may ignore it
+REFRESH_INTERVAL = "PT1H"
+
+
+def series_events(recurrence: Recurrence, stamp: str) -> str:
+    """The VEVENTs of a series' occurrences, as far ahead as list-events lists them"""
+    return "".join(
+        ics_event(row, stamp)
+        for row in recurrence.occurrences(date.min, date.today() + HORIZON)
+    )
+
+
+class GuildFeed:
+    """
+    The VEVENTs of one guild keyed by game_id, a series' occurrences under
+    its occurrence id. A write re-renders only the changed event or series,
+    and the whole body is joined again lazily on the next poll.
+    """
+
+    def __init__(self, guild_id: int):
+        self.guild_id = guild_id
+        self.events: Dict[int, str] = {}
+        self.last_modified = datetime.now(timezone.utc).replace(microsecond=0)
+        self._body: Optional[bytes] = None
+        self._etag = ""
+
+    def apply(self, change: EventChange) -> None:
+        """Update the feed from a committed write"""
+        if change.row is None:
+            self.events.pop(change.game_id, None)
+        else:
+            self.events[change.game_id] = ics_event(
+                change.row, ics_stamp(datetime.now(timezone.utc))
+            )
+        self._touch()
+
+    def set_series(self, game_id: int, recurrence: Optional[Recurrence]) -> None:
+        """Replace the occurrences of a series, None once it is deleted"""
+        if recurrence is None:
+            self.events.pop(game_id, None)
+        else:
+            self.events[game_id] = series_events(
+                recurrence, ics_stamp(datetime.now(timezone.utc))
+            )
+        self._touch()
+
+    def _touch(self) -> None:
+        self._body = None
+        # HTTP dates have a resolution of one second
+        self.last_modified = datetime.now(timezone.utc).replace(microsecond=0)
+
+    def render(self) -> bytes:
+        """The whole calendar, joined once per change rather than once per poll"""
+        if self._body is None:
+            self._body = (
+                ICS_HEADER
+                + "X-WR-CALNAME:paps-bot events\r\n"
+                + f"REFRESH-INTERVAL;VALUE=DURATION:{REFRESH_INTERVAL}\r\n"
+                + "".join(self.events.values())
+                + ICS_FOOTER
+            ).encode()
+            self._etag = '"' + hashlib.sha1(self._body).hexdigest() + '"'
+        return self._body
+
+    @property
+    def etag(self) -> str:
+        """Strong validator of the current body"""
+        self.render()
+        return self._etag
+
+
+class CalendarFeeds:
+    """
+    Serves /feeds/<guild_id>/<token>.ics. A guild's feed is read from the
+    database once, on its first poll, and from then on kept current by the
+    repository's write notifications, so polls never reach the database and
+    unchanged feeds are answered with 304 Not Modified. When the shards are
+    split over several processes each one serves only the guilds it owns,
+    the writes of the others never reach its listener. A change to a series
+    carries no rows, so the series is read again in the background.
+    """
+
+    def __init__(
+        self,
+        repository: EventRepository,
+        secret: Optional[str] = None,
+        ownership: Optional[ShardOwnership] = None,
+    ):
+        self.repository = repository
+        self.secret = secret
+        self.ownership = ownership or ShardOwnership()
+        self._feeds: Dict[int, GuildFeed] = {}
+        # guilds being read from the database, with the writes that landed meanwhile
+        self._loading: Dict[int, asyncio.Future] = {}
+        self._missed: Dict[int, list] = {}
+        # the latest pending read of each (guild_id, game_id) series, older ones are dropped
+        self._series_reads: Dict[Tuple[int, int], int] = {}
+        self._tasks: Set[asyncio.Task] = set()
+        repository.add_listener(self._on_change)
+
+    async def start(self) -> None:
+        """Load or create the secret the feed urls are signed with"""
+        if self.secret is None:
+            self.secret = await self.repository.get_state("feed_secret")
+        if self.secret is None:
+            # another process may be creating it at the same time, the first one wins
+            self.secret = await self.repository.init_state(
+                "feed_secret", secrets.token_hex(32)
+            )
+
+    def clear(self) -> None:
+        """Drop every feed, each one is read again on its next poll"""
+        self._feeds.clear()
+
+    def token(self, guild_id: int) -> str:
+        """The unguessable part of a guild's feed url"""
+        if self.secret is None:
+            raise RuntimeError("the feed secret is loaded by start()")
+        return hmac.new(
+            self.secret.encode(), str(guild_id).encode(), hashlib.sha256
+        ).hexdigest()[:32]
+
+    def path(self, guild_id: int) -> str:
+        """Where a guild's feed is served"""
+        return f"/feeds/{guild_id}/{self.token(guild_id)}.ics"
+
+    def _on_change(self, change: EventChange) -> None:
+        if change.guild_id in self._missed:
+            self._missed[change.guild_id].append(change)
+        feed = self._feeds.get(change.guild_id)
+        if feed is None:
+            return
+        if change.action == "series":
+            self._refresh_series(feed, change.game_id)
+        else:
+            feed.apply(change)
+
+    def _refresh_series(self, feed: GuildFeed, game_id: int) -> None:
+        key = (feed.guild_id, game_id)
+        generation = self._series_reads[key] = self._series_reads.get(key, 0) + 1
+        task = asyncio.create_task(self._read_series(feed, game_id, generation))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _read_series(
+        self, feed: GuildFeed, game_id: int, generation: int
+    ) -> None:
+        key = (feed.guild_id, game_id)
+        try:
+            # occurrence ids are the negated series id
+            recurrence = await self.repository.get_series(-game_id)
+        except psycopg2.Error as err:
+            logger.error("Could not read series %s for its feed: %s", -game_id, err)
+            # read the whole feed again on its next poll
+            if self._feeds.get(feed.guild_id) is feed:
+                del self._feeds[feed.guild_id]
+            return
+        if self._series_reads.get(key) != generation:
+            return
+        del self._series_reads[key]
+        if recurrence is not None and recurrence.series.guild_id != feed.guild_id:
+            recurrence = None
+        feed.set_series(game_id, recurrence)
+
+    async def feed(self, guild_id: int) -> GuildFeed:
+        """A guild's feed, read from the database by a single request on first use"""
+        feed = self._feeds.get(guild_id)
+        if feed is not None:
+            return feed
+        loading = self._loading.get(guild_id)
+        if loading is not None:
+            return await asyncio.shield(loading)
+        loading = self._loading[guild_id] = asyncio.get_running_loop().create_future()
+        self._missed[guild_id] = []
+        try:
+            feed = GuildFeed(guild_id)
+            stamp = ics_stamp(feed.last_modified)
+            async for rows in self.repository.stream_events(guild_id):
+                for row in rows:
+                    feed.events[row[0]] = ics_event(row, stamp)
+            for recurrence in await self.repository.guild_series(guild_id):
+                feed.events[recurrence.game_id] = series_events(recurrence, stamp)
+            self._feeds[guild_id] = feed
+            # writes committed while reading may or may not be in the rows read
+            for change in self._missed[guild_id]:
+                if change.action == "series":
+                    self._refresh_series(feed, change.game_id)
+                else:
+                    feed.apply(change)
+            loading.set_result(feed)
+            return feed
+        except BaseException as err:
+            loading.set_exception(err)
+            # nobody else may be waiting, so mark the exception as retrieved
+            loading.exception()
+            raise
+        finally:
+            del self._loading[guild_id]
+            del self._missed[guild_id]
+
+    async def handle(self, request: web.Request) -> web.Response:
+        """GET a guild's feed, honouring If-None-Match and If-Modified-Since"""
+        try:
+            guild_id = int(request.match_info["guild_id"])
+        except ValueError:
+            FEED_RESPONSES.inc(status="404")
+            raise web.HTTPNotFound() from None
+        if not hmac.compare_digest(
+            request.match_info["token"], self.token(guild_id)
+        ) or not self.ownership.owns_guild(guild_id):
+            FEED_RESPONSES.inc(status="404")
+            raise web.HTTPNotFound()
+        try:
+            feed = await self.feed(guild_id)
+        except psycopg2.Error as err:
+            logger.error("Could not load the calendar feed of %s: %s", guild_id, err)
+            FEED_RESPONSES.inc(status="503")
+            raise web.HTTPServiceUnavailable() from err
+        headers = {
+            "ETag": feed.etag,
+            "Last-Modified": format_datetime(feed.last_modified, usegmt=True),
+            "Cache-Control": "no-cache",
+        }
+        if self._not_modified(request, feed):
+            FEED_RESPONSES.inc(status="304")
+            return web.Response(status=304, headers=headers)
+        FEED_RESPONSES.inc(status="200")
+        return web.Response(
+            body=feed.render(),
+            headers=headers,
+            content_type="text/calendar",
+            charset="utf-8",
+        )
+
+    @staticmethod
+    def _not_modified(request: web.Request, feed: GuildFeed) -> bool:
+        if_none_match = request.headers.get("If-None-Match")
+        if if_none_match is not None:
+            # an ETag match takes precedence over the modification date
+            tags = [tag.strip() for tag in if_none_match.split(",")]
+            return "*" in tags or feed.etag in tags or f"W/{feed.etag}" in tags
+        if_modified_since = request.headers.get("If-Modified-Since")
+        if if_modified_since is not None:
+            try:
+                return feed.last_modified <= parsedate_to_datetime(if_modified_since)
+            except (TypeError, ValueError):
+                return False
+        return False
+
+    async def serve(self, host: str, port: int) -> web.AppRunner:
+        """Start the feed server, returns the runner to clean up on shutdown"""
+        app = web.Application()
+        app.router.add_get(r"/feeds/{guild_id}/{token}.ics", self.handle)
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        await web.TCPSite(runner, host, port).start()
+        logger.info("Serving calendar feeds on http://%s:%s/feeds/", host, port)
+        return runner
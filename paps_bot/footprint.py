@@ -0,0 +1,87 @@
+"""
+Memory footprint of the bot by subsystem, from tracemalloc snapshots
+"""
+
+import os
+import asyncio
+import logging
+import tracemalloc
+from typing import Dict, List, Tuple
+from paps_bot.metrics import REGISTRY, Gauge
+
+# get the bot logger
+logger = logging.getLogger("discord")
+
+# third-party packages reported on their own, everything else is "other"
+PACKAGES = ("discord", "psycopg2", "aiohttp")
+# subsystems listed in a logged report
+REPORT_LIMIT = 10
+
+TRACED_MEMORY = REGISTRY.register(
+    Gauge(
+        "paps_traced_memory_bytes",
+        "Memory allocated by each subsystem at the last footprint report",
+        ["subsystem"],
+    )
+)
+
+
+def subsystem(filename: str) -> str:
+    """The subsystem owning a source file: a paps_bot module, a package or "other" """
+    parts = filename.replace("\\", "/").split("/")
+    for i in range(len(parts) - 1, -1, -1):
+        if parts[i] == "paps_bot" and i + 1 < len(parts):
+            return "paps_bot." + os.path.splitext(parts[i + 1])[0]
+        if parts[i] in PACKAGES:
+            return parts[i]
+    return "other"
+
+
+def footprint(snapshot: tracemalloc.Snapshot) -> List[Tuple[str, int, int]]:
+    """(subsystem, bytes, blocks) of a snapshot, largest first"""
+    totals: Dict[str, List[int]] = {}
+    for stat in snapshot.statistics("filename"):
+        entry = totals.setdefault(subsystem(stat.traceback[0].filename), [0, 0])
+        entry[0] += stat.size
+        entry[1] += stat.count
+    return sorted(
+        ((name, size, count) for name, (size, count) in totals.items()),
+        key=lambda item: item[1],
+        reverse=True,
+    )
+
+
+def rss_bytes() -> int:
+    """The resident set size of the process, 0 where /proc is not available"""
+    try:
+        with open("/proc/self/statm", encoding="ascii") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+def report() -> List[Tuple[str, int, int]]:
+    """Take a snapshot, log the largest subsystems and update their gauges"""
+    if not tracemalloc.is_tracing():
+        return []
+    subsystems = footprint(tracemalloc.take_snapshot())
+    for name, size, _ in subsystems:
+        TRACED_MEMORY.set(size, subsystem=name)
+    logger.info(
+        "Memory footprint, %.1f MiB resident: %s",
+        rss_bytes() / 2**20,
+        ", ".join(
+            f"{name} {size / 2**20:.1f} MiB"
+            for name, size, _ in subsystems[:REPORT_LIMIT]
+        ),
+        extra={"footprint": {name: size for name, size, _ in subsystems}},
+    )
+    return subsystems
+
+
+async def report_periodically(interval: float) -> None:
+    """Log a footprint report every interval seconds, tracemalloc must be tracing"""
+    while True:
+        await asyncio.sleep(interval)
+        # the snapshot walks every traced block, keep it off the event loop
+        await asyncio.to_thread(report)
@@ -0,0 +1,35 @@
+"""
+Date and time formatting shared by the commands and the event import
+"""
+
+import logging
+from datetime import datetime, time
+
+# get the bot logger
+logger = logging.getLogger("discord")
+
+
+def format_date(date_str, format_str):
+    """Function to format EU date formats DD-MM-YYYY to SQL accepted time object"""
+    try:
+        logger.info("Attempting to format time: %s", date_str)
+        date_obj = datetime.strptime(date_str, format_str)
+        logger.info("Time successfully formatted: %s", date_obj.date())
+        return date_obj.date()
+    except ValueError as err:
+        logger.error("Time formatting error detected: \n %s", err)
+        return None
+
+
+def parse_time(time_str):
+    """Function to parse HH:MM to a time object, None if it is not one"""
+    try:
+        return time.fromisoformat(time_str + ":00")
+    except ValueError as err:
+        logger.error("Time formatting error detected: \n %s", err)
+        return None
+
+
+def event_label(game_id: int) -> str:
+    """How an event id is shown, occurrences of a series carry the negated series id"""
+    return str(game_id) if game_id >= 0 else f"series {-game_id}"
@@ -0,0 +1,74 @@
+"""
+The gateway intents and discord.py caches the bot connects with
+"""
+
+import os
+from typing import Any, Dict, Optional, Sequence
+import discord
+
+# only what slash commands and reactions on the bot's own messages need
+LEAN = "lean"
+# every default intent plus members and message content, with discord.py's default caches
+FULL = "full"
+
+
+def lean_intents() -> discord.Intents:
+    """
+    Guilds, which interactions and partial channels are resolved against, and
+    guild reactions, which raw reaction events of votes and signups need.
+    Interactions themselves arrive whatever the intents.
+    """
+    intents = discord.Intents.none()
+    intents.guilds = True
+    intents.guild_reactions = True
+    return intents
+
+
+def full_intents() -> discord.Intents:
+    """The default intents plus members and message content"""
+    intents = discord.Intents.default()
+    intents.message_content = True
+    intents.members = True
+    return intents
+
+
+def gateway_options(
+    mode: str = LEAN,
+    extra_intents: Sequence[str] = (),
+    max_messages: Optional[int] = None,
+) -> Dict[str, Any]:
+    """
+    Client keyword arguments for a gateway mode. Extra intents are added by
+    name, e.g. "members", and the member cache holds only what the intents
+    keep up to date. max_messages overrides the message cache size, 0 turns
+    it off.
+    """
+    if mode not in (LEAN, FULL):
+        raise ValueError(f"unknown gateway mode {mode!r}, use {LEAN} or {FULL}")
+    intents = lean_intents() if mode == LEAN else full_intents()
+    for name in extra_intents:
+        if name not in discord.Intents.VALID_FLAGS:
+            raise ValueError(f"unknown gateway intent {name!r}")
+        setattr(intents, name, True)
+    options: Dict[str, Any] = {"intents": intents}
+    if mode == LEAN:
+        options["member_cache_flags"] = discord.MemberCacheFlags.from_intents(intents)
+        # chunking downloads every member of every guild, only worth it when they are cached
+        options["chunk_guilds_at_startup"] = intents.members
+        # without message events the bot never reads a cached message
+        options["max_messages"] = None
+    if max_messages is not None:
+        # discord.py reads a cache size of 0 as its default of 1000, None turns it off
+        options["max_messages"] = max_messages or None
+    return options
+
+
+def gateway_options_from_env() -> Dict[str, Any]:
+    """Read GATEWAY_MODE, GATEWAY_INTENTS (comma separated) and MESSAGE_CACHE_SIZE, all optional"""
+    extra = os.getenv("GATEWAY_INTENTS", "")
+    max_messages = os.getenv("MESSAGE_CACHE_SIZE")
+    return gateway_options(
+        os.getenv("GATEWAY_MODE", LEAN),
+        [name.strip() for name in extra.split(",") if name.strip()],
+        int(max_messages) if max_messages else None,
+    )
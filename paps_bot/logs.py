@@ -0,0 +1,153 @@
+"""
+Logging pipeline for paps-bot: records are queued on the event loop and
+formatted and written by a background thread
+"""
+
+import os
+import sys
+import json
+import time
+import queue
+import atexit
+import logging
+import logging.handlers
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Dict, Optional, Tuple
+
+# fields added to every record logged while handling a slash command
+COMMAND_CONTEXT: ContextVar[Optional[Dict[str, object]]] = ContextVar(
+    "paps_command_context", default=None
+)
+# structured fields copied from records into the JSON output, when present
+STRUCTURED_FIELDS = ("command", "user", "guild", "duration", "footprint")
+
+
+class ContextFilter(logging.Filter):
+    """Attach the current command's fields to records, runs on the logging thread's caller"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        context = COMMAND_CONTEXT.get()
+        if context:
+            for name, value in context.items():
+                if not hasattr(record, name):
+                    setattr(record, name, value)
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Lets at most rate records per second through per call site (source file
+    and line) below WARNING, with bursts of up to burst records, so only the
+    log statements on hot paths are thinned out. Warnings and errors are never
+    sampled away. The max_sites most recently used call sites are tracked.
+    """
+
+    def __init__(
+        self, rate: float, burst: Optional[float] = None, max_sites: int = 1024
+    ):
+        super().__init__()
+        self.rate = rate
+        self.burst = burst if burst is not None else max(rate, 1.0)
+        self.max_sites = max_sites
+        self.dropped = 0
+        # (pathname, lineno) -> (tokens left, monotonic time they were counted),
+        # least recently used first
+        self._buckets: Dict[Tuple[str, int], Tuple[float, float]] = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING or self.rate <= 0:
+            return True
+        now = time.monotonic()
+        key = (record.pathname, record.lineno)
+        tokens, last = self._buckets.pop(key, (self.burst, now))
+        tokens = min(self.burst, tokens + (now - last) * self.rate)
+        if len(self._buckets) >= self.max_sites:
+            # the least recently used site, it starts over with a full bucket
+            del self._buckets[next(iter(self._buckets))]
+        if tokens < 1:
+            self._buckets[key] = (tokens, now)
+            self.dropped += 1
+            return False
+        self._buckets[key] = (tokens - 1, now)
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for name in STRUCTURED_FIELDS:
+            value = getattr(record, name, None)
+            if value is not None:
+                entry[name] = value
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    """Renders the message and traceback text only, the formatting happens on the listener"""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = logging.makeLogRecord(record.__dict__)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def _parse_levels(spec: str) -> Dict[str, str]:
+    """LOG_LEVELS="discord.gateway=WARNING,paps=DEBUG" as {logger: level}"""
+    levels = {}
+    for item in spec.split(","):
+        name, _, level = item.partition("=")
+        if name.strip() and level.strip():
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+def configure_logging() -> logging.handlers.QueueListener:
+    """
+    Route every record through a queue to a writer thread, so log I/O never
+    runs on the event loop. Configured by the optional env vars LOG_LEVEL,
+    LOG_LEVELS, LOG_FORMAT (json or text) and LOG_SAMPLE_RATE.
+    """
+    writer = logging.StreamHandler(sys.stderr)
+    if os.getenv("LOG_FORMAT", "json") == "text":
+        writer.setFormatter(
+            logging.Formatter(
+                "[{asctime}] [{levelname:<8}] {name}: {message}", style="{"
+            )
+        )
+    else:
+        writer.setFormatter(JsonFormatter())
+
+    records: queue.SimpleQueue = queue.SimpleQueue()
+    handler = _QueueHandler(records)
+    handler.addFilter(ContextFilter())
+    handler.addFilter(SamplingFilter(float(os.getenv("LOG_SAMPLE_RATE", "10"))))
+
+    root = logging.getLogger()
+    for existing in root.handlers[:]:
+        root.removeHandler(existing)
+    root.addHandler(handler)
+    root.setLevel(os.getenv("LOG_LEVEL", "INFO").upper())
+    levels = {"discord.gateway": "WARNING", "discord.http": "WARNING"}
+    levels.update(_parse_levels(os.getenv("LOG_LEVELS", "")))
+    for name, level in levels.items():
+        logging.getLogger(name).setLevel(level)
+
+    listener = logging.handlers.QueueListener(records, writer)
+    listener.start()
+    # write out whatever is still queued when the process exits
+    atexit.register(listener.stop)
+    return listener
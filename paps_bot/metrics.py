@@ -0,0 +1,397 @@
+"""
+Prometheus-format metrics for paps-bot, served from a small local HTTP endpoint
+"""
+
+import time
+import asyncio
+import logging
+import functools
+from bisect import bisect_left
+from typing import Callable, Dict, List, Optional, Sequence, Tuple, TypeVar
+from aiohttp import web
+from paps_bot.logs import COMMAND_CONTEXT
+
+# get the bot logger
+logger = logging.getLogger("discord")
+
+LabelValues = Tuple[str, ...]
+
+# seconds, tuned for discord commands and database round trips
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(
+        '{}="{}"'.format(name, str(value).replace("\\", "\\\\").replace('"', '\\"'))
+        for name, value in zip(names, values)
+    )
+    return "{" + pairs + "}"
+
+
+class Metric:
+    """Base for a named metric family with a fixed set of label names"""
+
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        return tuple(str(labels[name]) for name in self.label_names)
+
+    def samples(self) -> List[Tuple[str, str, float]]:
+        """(sample name, formatted labels, value) of every sample"""
+        raise NotImplementedError
+
+    def render(self) -> str:
+        """The metric family in the Prometheus text exposition format"""
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.kind}",
+        ]
+        lines.extend(
+            f"{name}{labels} {value}" for name, labels, value in self.samples()
+        )
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    """A value that only goes up"""
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        super().__init__(name, documentation, labels)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        """Add to the counter"""
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self) -> List[Tuple[str, str, float]]:
+        return [
+            (self.name, _format_labels(self.label_names, key), value)
+            for key, value in self._values.items()
+        ]
+
+
+class Gauge(Metric):
+    """A value that goes up and down, or is read from a callback when scraped"""
+
+    kind = "gauge"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labels: Sequence[str] = (),
+        callback: Optional[Callable[[], float]] = None,
+    ):
+        super().__init__(name, documentation, labels)
+        self._values: Dict[LabelValues, float] = {}
+        self.callback = callback
+
+    def set(self, value: float, **labels: str) -> None:
+        """Set the gauge"""
+        self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        """Add to the gauge"""
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels: str) -> None:
+        """Subtract from the gauge"""
+        self.inc(-amount, **labels)
+
+    def samples(self) -> List[Tuple[str, str, float]]:
+        if self.callback is not None:
+            return [(self.name, "", self.callback())]
+        return [
+            (self.name, _format_labels(self.label_names, key), value)
+            for key, value in self._values.items()
+        ]
+
+
+class Histogram(Metric):
+    """Observations counted into cumulative buckets"""
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labels: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+        # label values -> (per-bucket counts with a trailing +Inf bucket, sum)
+        self._values: Dict[LabelValues, Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        """Record one observation"""
+        key = self._key(labels)
+        entry = self._values.get(key)
+        if entry is None:
+            entry = ([0] * (len(self.buckets) + 1), [0.0])
+            self._values[key] = entry
+        entry[0][bisect_left(self.buckets, value)] += 1
+        entry[1][0] += value
+
+    def time(self, **labels: str) -> "_Timer":
+        """Context manager observing the duration of its block"""
+        return _Timer(self, labels)
+
+    def samples(self) -> List[Tuple[str, str, float]]:
+        samples: List[Tuple[str, str, float]] = []
+        names = self.label_names + ("le",)
+        for key, (counts, total) in self._values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(float(bound))
+                samples.append(
+                    (
+                        f"{self.name}_bucket",
+                        _format_labels(names, key + (le,)),
+                        cumulative,
+                    )
+                )
+            labels = _format_labels(self.label_names, key)
+            samples.append((f"{self.name}_sum", labels, total[0]))
+            samples.append((f"{self.name}_count", labels, cumulative))
+        return samples
+
+
+class _Timer:
+    def __init__(self, histogram: Histogram, labels: Dict[str, str]):
+        self.histogram = histogram
+        self.labels = labels
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start, **self.labels)
+        return False
+
+
+T = TypeVar("T", bound=Metric)
+
+
+class Registry:
+    """Every metric exposed by the endpoint"""
+
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+
+    def register(self, metric: T) -> T:
+        """Add a metric, returning it for convenient module level definitions"""
+        if metric.name in self._metrics:
+            raise ValueError(f"metric {metric.name} is already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def gauge_callback(
+        self, name: str, documentation: str, callback: Callable[[], float]
+    ) -> Gauge:
+        """Register a gauge read from a callback whenever it is scraped"""
+        gauge = Gauge(name, documentation, callback=callback)
+        self.register(gauge)
+        return gauge
+
+    def render(self) -> str:
+        """Every metric in the Prometheus text exposition format"""
+        return "\n".join(metric.render() for metric in self._metrics.values()) + "\n"
+
+
+REGISTRY = Registry()
+
+COMMAND_DURATION = REGISTRY.register(
+    Histogram(
+        "paps_command_duration_seconds",
+        "Time spent handling slash commands",
+        ["command"],
+    )
+)
+COMMAND_ERRORS = REGISTRY.register(
+    Counter(
+        "paps_command_errors_total",
+        "Slash commands that raised an unhandled error",
+        ["command"],
+    )
+)
+COMMANDS_IN_FLIGHT = REGISTRY.register(
+    Gauge(
+        "paps_commands_in_flight",
+        "Slash commands currently being handled",
+        ["command"],
+    )
+)
+DB_QUERY_DURATION = REGISTRY.register(
+    Histogram(
+        "paps_db_query_duration_seconds",
+        "Time spent running database calls on a pooled connection",
+        ["query"],
+    )
+)
+DB_ERRORS = REGISTRY.register(
+    Counter("paps_db_errors_total", "Database calls that failed", ["query"])
+)
+COALESCED_CALLS = REGISTRY.register(
+    Counter(
+        "paps_coalesced_calls_total",
+        "Reads answered by an identical read that was already in flight",
+        ["call"],
+    )
+)
+DB_POOL_WAIT = REGISTRY.register(
+    Histogram(
+        "paps_db_pool_wait_seconds",
+        "Time spent waiting for a pooled database connection",
+    )
+)
+FEED_RESPONSES = REGISTRY.register(
+    Counter(
+        "paps_feed_responses_total",
+        "Calendar feed requests by response status",
+        ["status"],
+    )
+)
+CHANGE_NOTIFICATIONS = REGISTRY.register(
+    Counter(
+        "paps_change_notifications_total",
+        "paps_table change notifications received, by whether they were applied",
+        ["outcome"],
+    )
+)
+ARCHIVED_EVENTS = REGISTRY.register(
+    Counter(
+        "paps_archived_events_total",
+        "Past events moved from paps_table into the archive",
+    )
+)
+EVENT_LOOP_LAG = REGISTRY.register(
+    Gauge(
+        "paps_event_loop_lag_seconds",
+        "How late the event loop ran a timer it was asked to run",
+    )
+)
+
+
+class CommandDrain:
+    """
+    Counts the slash commands being handled. Once draining, new commands are
+    turned away, so a stopping bot only waits for the ones already running.
+    """
+
+    def __init__(self):
+        self.draining = False
+        self.in_flight = 0
+        self._idle: Optional[asyncio.Event] = None
+
+    def begin(self) -> None:
+        """Count a command that started"""
+        self.in_flight += 1
+
+    def end(self) -> None:
+        """Count a command that finished"""
+        self.in_flight -= 1
+        if not self.in_flight and self._idle is not None:
+            self._idle.set()
+
+    async def drain(self, timeout: float) -> bool:
+        """Turn new commands away and wait for the running ones, False if some outlived the timeout"""
+        self.draining = True
+        if not self.in_flight:
+            return True
+        self._idle = asyncio.Event()
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout)
+        except asyncio.TimeoutError:
+            return False
+        return True
+
+
+DRAIN = CommandDrain()
+RESTARTING_MESSAGE = "The bot is restarting, try again in a moment."
+
+
+def instrument_command(func):
+    """
+    Time a slash command callback, count its errors and track it while in flight.
+    Records logged while it runs carry the command, user and guild, and a
+    structured record with its duration is logged once it finishes. While the
+    bot drains for a restart, the command is answered with a notice instead.
+    """
+    name = func.__name__
+
+    @functools.wraps(func)
+    async def wrapper(Interaction, *args, **kwargs):
+        if DRAIN.draining:
+            await Interaction.response.send_message(RESTARTING_MESSAGE, ephemeral=True)
+            return None
+        DRAIN.begin()
+        token = COMMAND_CONTEXT.set(
+            {
+                "command": name,
+                "user": Interaction.user.id,
+                "guild": Interaction.guild_id,
+            }
+        )
+        COMMANDS_IN_FLIGHT.inc(command=name)
+        start = time.perf_counter()
+        try:
+            return await func(Interaction, *args, **kwargs)
+        except Exception:
+            COMMAND_ERRORS.inc(command=name)
+            raise
+        finally:
+            duration = time.perf_counter() - start
+            COMMAND_DURATION.observe(duration, command=name)
+            COMMANDS_IN_FLIGHT.dec(command=name)
+            DRAIN.end()
+            logger.info(
+                "Handled %s in %.1f ms",
+                name,
+                duration * 1000,
+                extra={"duration": round(duration, 6)},
+            )
+            COMMAND_CONTEXT.reset(token)
+
+    return wrapper
+
+
+async def monitor_event_loop_lag(interval: float = 0.5) -> None:
+    """Measure how far behind schedule the event loop wakes up a sleeping task"""
+    loop = asyncio.get_running_loop()
+    while True:
+        start = loop.time()
+        await asyncio.sleep(interval)
+        EVENT_LOOP_LAG.set(max(loop.time() - start - interval, 0.0))
+
+
+async def serve(host: str, port: int) -> web.AppRunner:
+    """Serve the registry at /metrics, returns the runner to clean up on shutdown"""
+
+    async def handle_metrics(_request: web.Request) -> web.Response:
+        return web.Response(
+            text=REGISTRY.render(), content_type="text/plain", charset="utf-8"
+        )
+
+    app = web.Application()
+    app.router.add_get("/metrics", handle_metrics)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logger.info("Serving metrics on http://%s:%s/metrics", host, port)
+    return runner
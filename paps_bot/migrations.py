@@ -0,0 +1,326 @@
+"""
+Versioned schema migrations for paps-bot, applied once at startup
+"""
+
+import logging
+from typing import List, Tuple
+
+# get the bot logger
+logger = logging.getLogger("discord")
+
+# arbitrary key for pg_advisory_xact_lock, so concurrently starting bots migrate one at a time
+MIGRATION_LOCK_ID = 7270_2023
+
+# (version, description, statements), append new migrations at the end and never edit old ones
+MIGRATIONS: List[Tuple[int, str, Tuple[str, ...]]] = [
+    (
+        1,
+        "create paps_table and paps_votes",
+        (
+            """CREATE TABLE IF NOT EXISTS paps_table (
+            game_id SERIAL PRIMARY KEY,
+            game_type VARCHAR(255) NOT NULL,
+            game_date DATE NOT NULL,
+            game_time TIME NOT NULL
+            )""",
+            """CREATE TABLE IF NOT EXISTS paps_votes (
+            message_id BIGINT PRIMARY KEY,
+            channel_id BIGINT NOT NULL,
+            game_type VARCHAR(255) NOT NULL,
+            game_date DATE NOT NULL,
+            game_time TIME NOT NULL,
+            count_limit_success INTEGER NOT NULL,
+            count_limit_fail INTEGER NOT NULL,
+            deadline TIMESTAMPTZ NOT NULL,
+            thumbs_up INTEGER NOT NULL DEFAULT 0,
+            thumbs_down INTEGER NOT NULL DEFAULT 0,
+            status VARCHAR(16) NOT NULL DEFAULT 'open'
+            )""",
+        ),
+    ),
+    (
+        2,
+        "index the list-events filters and open votes",
+        (
+            "CREATE INDEX IF NOT EXISTS paps_table_game_date_idx ON paps_table (game_date)",
+            "CREATE INDEX IF NOT EXISTS paps_table_game_type_idx ON paps_table (game_type)",
+            "CREATE INDEX IF NOT EXISTS paps_table_game_date_time_idx ON paps_table (game_date, game_time)",
+            "CREATE INDEX IF NOT EXISTS paps_votes_open_idx ON paps_votes (deadline) WHERE status = 'open'",
+        ),
+    ),
+    (
+        3,
+        "scope events and votes by guild",
+        (
+            # rows from before guild scoping are parked under guild 0
+            "ALTER TABLE paps_table ADD COLUMN guild_id BIGINT NOT NULL DEFAULT 0",
+            "ALTER TABLE paps_table ALTER COLUMN guild_id DROP DEFAULT",
+            "ALTER TABLE paps_votes ADD COLUMN guild_id BIGINT NOT NULL DEFAULT 0",
+            "ALTER TABLE paps_votes ALTER COLUMN guild_id DROP DEFAULT",
+            # every query now leads with guild_id, so the per-guild indexes replace the global ones
+            "DROP INDEX IF EXISTS paps_table_game_date_idx",
+            "DROP INDEX IF EXISTS paps_table_game_type_idx",
+            "DROP INDEX IF EXISTS paps_table_game_date_time_idx",
+            "CREATE INDEX paps_table_guild_date_time_idx ON paps_table (guild_id, game_date, game_time)",
+            "CREATE INDEX paps_table_guild_type_idx ON paps_table (guild_id, game_type)",
+            "CREATE INDEX paps_table_guild_time_idx ON paps_table (guild_id, game_time)",
+        ),
+    ),
+    (
+        4,
+        "cover the list-events keyset order with an index",
+        (
+            "DROP INDEX IF EXISTS paps_table_guild_date_time_idx",
+            "CREATE INDEX paps_table_guild_date_time_id_idx ON paps_table (guild_id, game_date, game_time, game_id)",
+        ),
+    ),
+    (
+        5,
+        "remember the announcement channel of events for reminders",
+        (
+            "ALTER TABLE paps_table ADD COLUMN channel_id BIGINT",
+            "CREATE INDEX paps_table_game_date_idx ON paps_table (game_date) WHERE channel_id IS NOT NULL",
+        ),
+    ),
+    (
+        6,
+        "track attendee signups on event messages",
+        (
+            "ALTER TABLE paps_table ADD COLUMN message_id BIGINT",
+            "CREATE UNIQUE INDEX paps_table_message_id_idx ON paps_table (message_id)",
+            """CREATE TABLE paps_attendees (
+            game_id INTEGER NOT NULL REFERENCES paps_table (game_id) ON DELETE CASCADE,
+            user_id BIGINT NOT NULL,
+            status VARCHAR(16) NOT NULL,
+            updated_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+            PRIMARY KEY (game_id, user_id)
+            )""",
+        ),
+    ),
+    (
+        7,
+        "keep bot state, such as the synced command tree fingerprint",
+        (
+            """CREATE TABLE paps_bot_state (
+            key VARCHAR(255) PRIMARY KEY,
+            value TEXT NOT NULL,
+            updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+            )""",
+        ),
+    ),
+    (
+        8,
+        "notify listening bots of committed paps_table writes",
+        (
+            # the writer's application_name lets a bot skip the writes it made itself
+            """CREATE FUNCTION paps_notify_event_change() RETURNS trigger AS $$
+            DECLARE
+                event paps_table%ROWTYPE;
+            BEGIN
+                IF TG_OP = 'DELETE' THEN
+                    event := OLD;
+                ELSE
+                    event := NEW;
+                END IF;
+                PERFORM pg_notify('paps_event_changes', json_build_object(
+                    'action', lower(TG_OP),
+                    'origin', current_setting('application_name'),
+                    'guild_id', event.guild_id,
+                    'channel_id', event.channel_id,
+                    'game_id', event.game_id,
+                    'game_type', event.game_type,
+                    'game_date', event.game_date,
+                    'game_time', event.game_time
+                )::text);
+                RETURN NULL;
+            END;
+            $$ LANGUAGE plpgsql""",
+            # message_id updates only record the announcement, nothing to tell anyone
+            """CREATE TRIGGER paps_table_notify
+            AFTER INSERT OR DELETE
+            OR UPDATE OF guild_id, channel_id, game_type, game_date, game_time
+            ON paps_table FOR EACH ROW EXECUTE FUNCTION paps_notify_event_change()""",
+        ),
+    ),
+    (
+        9,
+        "store recurring events as rules with per-occurrence overrides",
+        (
+            """CREATE TABLE paps_series (
+            series_id SERIAL PRIMARY KEY,
+            guild_id BIGINT NOT NULL,
+            channel_id BIGINT,
+            game_type VARCHAR(255) NOT NULL,
+            start_date DATE NOT NULL,
+            game_time TIME NOT NULL,
+            interval_weeks SMALLINT NOT NULL CHECK (interval_weeks IN (1, 2)),
+            until DATE,
+            count INTEGER CHECK (count > 0),
+            CHECK (until IS NULL OR count IS NULL)
+            )""",
+            "CREATE INDEX paps_series_guild_idx ON paps_series (guild_id)",
+            # occurrences are identified by the date the rule gives them
+            """CREATE TABLE paps_series_overrides (
+            series_id INTEGER NOT NULL REFERENCES paps_series ON DELETE CASCADE,
+            occurrence_date DATE NOT NULL,
+            game_type VARCHAR(255),
+            game_date DATE,
+            game_time TIME,
+            cancelled BOOLEAN NOT NULL DEFAULT FALSE,
+            PRIMARY KEY (series_id, occurrence_date)
+            )""",
+            """CREATE FUNCTION paps_notify_series_change() RETURNS trigger AS $$
+            DECLARE
+                target INTEGER;
+                guild BIGINT;
+                channel BIGINT;
+            BEGIN
+                IF TG_OP = 'DELETE' THEN
+                    target := OLD.series_id;
+                ELSE
+                    target := NEW.series_id;
+                END IF;
+                SELECT guild_id, channel_id INTO guild, channel
+                FROM paps_series WHERE series_id = target;
+                IF guild IS NULL AND TG_TABLE_NAME = 'paps_series' THEN
+                    guild := OLD.guild_id;
+                    channel := OLD.channel_id;
+                END IF;
+                -- overrides deleted along with their series, which was notified itself
+                IF guild IS NULL THEN
+                    RETURN NULL;
+                END IF;
+                PERFORM pg_notify('paps_event_changes', json_build_object(
+                    'action', 'series',
+                    'origin', current_setting('application_name'),
+                    'guild_id', guild,
+                    'channel_id', channel,
+                    'series_id', target
+                )::text);
+                RETURN NULL;
+            END;
+            $$ LANGUAGE plpgsql""",
+            """CREATE TRIGGER paps_series_notify
+            AFTER INSERT OR UPDATE OR DELETE ON paps_series
+            FOR EACH ROW EXECUTE FUNCTION paps_notify_series_change()""",
+            """CREATE TRIGGER paps_series_overrides_notify
+            AFTER INSERT OR UPDATE OR DELETE ON paps_series_overrides
+            FOR EACH ROW EXECUTE FUNCTION paps_notify_series_change()""",
+        ),
+    ),
+    (
+        10,
+        "give events a duration and keep members' weekly availability",
+        (
+            # three hours, a typical session, for every event from before durations
+            """ALTER TABLE paps_table
+            ADD COLUMN duration_minutes INTEGER NOT NULL DEFAULT 180 CHECK (duration_minutes > 0)""",
+            """ALTER TABLE paps_votes
+            ADD COLUMN duration_minutes INTEGER NOT NULL DEFAULT 180 CHECK (duration_minutes > 0)""",
+            """ALTER TABLE paps_series
+            ADD COLUMN duration_minutes INTEGER NOT NULL DEFAULT 180 CHECK (duration_minutes > 0)""",
+            # minutes since midnight in the bot's timezone, weekday 0 is monday
+            """CREATE TABLE paps_availability (
+            guild_id BIGINT NOT NULL,
+            user_id BIGINT NOT NULL,
+            weekday SMALLINT NOT NULL CHECK (weekday BETWEEN 0 AND 6),
+            start_minute SMALLINT NOT NULL CHECK (start_minute BETWEEN 0 AND 1439),
+            end_minute SMALLINT NOT NULL CHECK (end_minute BETWEEN 1 AND 1440),
+            CHECK (start_minute < end_minute),
+            PRIMARY KEY (guild_id, user_id, weekday, start_minute)
+            )""",
+            # same as in migration 8, with the duration added to the payload
+            """CREATE OR REPLACE FUNCTION paps_notify_event_change() RETURNS trigger AS $$
+            DECLARE
+                event paps_table%ROWTYPE;
+            BEGIN
+                IF TG_OP = 'DELETE' THEN
+                    event := OLD;
+                ELSE
+                    event := NEW;
+                END IF;
+                PERFORM pg_notify('paps_event_changes', json_build_object(
+                    'action', lower(TG_OP),
+                    'origin', current_setting('application_name'),
+                    'guild_id', event.guild_id,
+                    'channel_id', event.channel_id,
+                    'game_id', event.game_id,
+                    'game_type', event.game_type,
+                    'game_date', event.game_date,
+                    'game_time', event.game_time,
+                    'duration_minutes', event.duration_minutes
+                )::text);
+                RETURN NULL;
+            END;
+            $$ LANGUAGE plpgsql""",
+            "DROP TRIGGER paps_table_notify ON paps_table",
+            """CREATE TRIGGER paps_table_notify
+            AFTER INSERT OR DELETE
+            OR UPDATE OF guild_id, channel_id, game_type, game_date, game_time, duration_minutes
+            ON paps_table FOR EACH ROW EXECUTE FUNCTION paps_notify_event_change()""",
+        ),
+    ),
+    (
+        11,
+        "archive past events into a table partitioned by date",
+        (
+            # partitions are created by the archive job, one per year it moves events of
+            """CREATE TABLE paps_archive (
+            game_id INTEGER NOT NULL,
+            guild_id BIGINT NOT NULL,
+            channel_id BIGINT,
+            game_type VARCHAR(255) NOT NULL,
+            game_date DATE NOT NULL,
+            game_time TIME NOT NULL,
+            duration_minutes INTEGER NOT NULL,
+            message_id BIGINT,
+            attendees JSONB,
+            archived_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+            PRIMARY KEY (game_id, game_date)
+            ) PARTITION BY RANGE (game_date)""",
+            "CREATE INDEX paps_archive_guild_date_time_id_idx ON paps_archive (guild_id, game_date, game_time, game_id)",
+            # the archive job picks the oldest events, reminders still only read announced ones
+            "DROP INDEX paps_table_game_date_idx",
+            "CREATE INDEX paps_table_game_date_idx ON paps_table (game_date)",
+        ),
+    ),
+]
+
+
+def apply_migrations(conn) -> int:
+    """
+    Bring the schema up to date, returns the resulting schema version.
+    Each migration runs in its own transaction together with its schema_version row.
+    """
+    with conn, conn.cursor() as cur:
+        cur.execute("SELECT pg_advisory_xact_lock(%s)", (MIGRATION_LOCK_ID,))
+        cur.execute("""CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            description TEXT NOT NULL,
+            applied_at TIMESTAMPTZ NOT NULL DEFAULT now()
+            )""")
+
+        cur.execute("SELECT version FROM schema_version")
+        applied = {row[0] for row in cur.fetchall()}
+
+    for migration_version, description, statements in MIGRATIONS:
+        if migration_version in applied:
+            continue
+        with conn, conn.cursor() as cur:
+            cur.execute("SELECT pg_advisory_xact_lock(%s)", (MIGRATION_LOCK_ID,))
+            # another process may have applied it while we waited for the lock
+            cur.execute(
+                "SELECT 1 FROM schema_version WHERE version = %s", (migration_version,)
+            )
+            if cur.fetchone() is None:
+                logger.info(
+                    "Applying schema migration %s: %s", migration_version, description
+                )
+                for statement in statements:
+                    cur.execute(statement)
+                cur.execute(
+                    "INSERT INTO schema_version (version, description) VALUES (%s, %s)",
+                    (migration_version, description),
+                )
+        applied.add(migration_version)
+    return max(applied, default=0)
@@ -0,0 +1,199 @@
+"""
+Applies paps_table writes made by other bot processes, delivered by postgreSQL LISTEN/NOTIFY
+"""
+
+import json
+import asyncio
+import logging
+from datetime import date, time
+from typing import Awaitable, Callable, Optional, Tuple
+import psycopg2
+from paps_bot.database import ConnectionPool
+from paps_bot.metrics import CHANGE_NOTIFICATIONS
+from paps_bot.recurrence import occurrence_id
+from paps_bot.repository import EventChange, EventRepository, _select_watermark
+
+# get the bot logger
+logger = logging.getLogger("discord")
+
+# the channel the paps_table trigger notifies, see migration 8
+CHANNEL = "paps_event_changes"
+
+
+def parse_notification(payload: str) -> Tuple[str, EventChange]:
+    """The writer's application_name and the change, from a trigger's JSON payload"""
+    data = json.loads(payload)
+    if data["action"] == "series":
+        change = EventChange(
+            "series",
+            data["guild_id"],
+            occurrence_id(data["series_id"]),
+            None,
+            data["channel_id"],
+        )
+        return data["origin"], change
+    row = (
+        data["game_id"],
+        data["game_type"],
+        date.fromisoformat(data["game_date"]),
+        time.fromisoformat(data["game_time"]),
+    )
+    change = EventChange(
+        data["action"],
+        data["guild_id"],
+        data["game_id"],
+        None if data["action"] == "delete" else row,
+        data["channel_id"],
+        data.get("duration_minutes"),
+    )
+    return data["origin"], change
+
+
+class ChangeListener:
+    """
+    Holds a dedicated LISTEN connection, watched by the event loop instead of
+    polled, and publishes the writes of other processes through the
+    repository as if they were local, so caches, reminders, autocomplete and
+    feeds follow them. This process's own writes are skipped, they were
+    already published when they committed. After a reconnect the cache is
+    cleared and on_reconnect reloads whatever else was built from the
+    notifications that may have been lost meanwhile.
+    """
+
+    def __init__(
+        self,
+        pool: ConnectionPool,
+        repository: EventRepository,
+        reconnect_delay: float = 5.0,
+        on_reconnect: Optional[Callable[[], Awaitable[None]]] = None,
+    ):
+        self.pool = pool
+        self.repository = repository
+        self.reconnect_delay = reconnect_delay
+        self.on_reconnect = on_reconnect
+        self._conn: Optional[psycopg2.extensions.connection] = None
+        # kept apart, a closed connection no longer reports its socket
+        self._fd: Optional[int] = None
+        self._reconnect_task: Optional[asyncio.Task] = None
+        # whether notifications may have been lost while reconnecting
+        self.missed = False
+
+    async def start(self) -> None:
+        """Connect and LISTEN, before any state is loaded so no write goes unseen"""
+        await self._listen()
+        logger.info("Listening for event changes on %s.", CHANNEL)
+
+    async def stop(self) -> None:
+        """Stop listening and close the connection"""
+        if self._reconnect_task is not None:
+            self._reconnect_task.cancel()
+            self._reconnect_task = None
+        self._drop()
+
+    async def _listen(self) -> None:
+        conn = await self.pool.in_thread(self.pool.connect)
+        try:
+            conn.autocommit = True
+            with conn.cursor() as cur:
+                await self.pool.in_thread(cur.execute, f"LISTEN {CHANNEL}")
+        except psycopg2.Error:
+            conn.close()
+            raise
+        self._conn, self._fd = conn, conn.fileno()
+        asyncio.get_running_loop().add_reader(self._fd, self._on_readable)
+
+    def _drop(self) -> None:
+        if self._conn is None or self._fd is None:
+            return
+        asyncio.get_running_loop().remove_reader(self._fd)
+        self._conn.close()
+        self._conn, self._fd = None, None
+
+    def _on_readable(self) -> None:
+        if self._conn is None:
+            return
+        try:
+            self._conn.poll()
+        except psycopg2.Error as err:
+            logger.warning("Lost the event change listener connection: %s", err)
+            self._drop()
+            self._reconnect_task = asyncio.create_task(self._reconnect())
+            return
+        self._dispatch()
+
+    def _dispatch(self) -> None:
+        if self._conn is None:
+            return
+        notifies = self._conn.notifies
+        while notifies:
+            self._apply(notifies.pop(0).payload)
+
+    async def watermark(self) -> Optional[str]:
+        """
+        The repository watermark, read on the LISTEN connection off the loop
+        and returned after applying every notification that arrived ahead of
+        it, or None if some may be missing. Nothing is awaited after the
+        notifications are applied, so none lands before the caller acts on
+        the value.
+        """
+        conn, fd = self._conn, self._fd
+        if conn is None or fd is None or self.missed:
+            return None
+        # the loop must not poll the connection while a thread runs a query on it
+        loop = asyncio.get_running_loop()
+        loop.remove_reader(fd)
+        try:
+            watermark = await self.pool.in_thread(_select_watermark, conn)
+        except psycopg2.Error as err:
+            logger.warning("Could not read the watermark: %s", err)
+            return None
+        finally:
+            if self._conn is conn:
+                loop.add_reader(fd, self._on_readable)
+        if self._conn is not conn:
+            return None
+        # notifications of writes committed before the read arrive ahead of its result
+        self._dispatch()
+        return watermark
+
+    def _apply(self, payload: str) -> None:
+        try:
+            origin, change = parse_notification(payload)
+        except (ValueError, KeyError, TypeError) as err:
+            logger.warning("Ignoring malformed event change %r: %s", payload, err)
+            CHANGE_NOTIFICATIONS.inc(outcome="malformed")
+            return
+        if origin == self.pool.application_name:
+            CHANGE_NOTIFICATIONS.inc(outcome="own")
+            return
+        if not self.repository.ownership.owns_guild(change.guild_id):
+            CHANGE_NOTIFICATIONS.inc(outcome="other_shard")
+            return
+        CHANGE_NOTIFICATIONS.inc(outcome="applied")
+        self.repository.publish(change)
+
+    async def _reconnect(self) -> None:
+        while True:
+            await asyncio.sleep(self.reconnect_delay)
+            try:
+                await self._listen()
+                break
+            except psycopg2.Error as err:
+                logger.warning("Could not reconnect the event change listener: %s", err)
+        # whatever was notified while disconnected is lost, don't answer from what it changed
+        self.missed = True
+        if self.repository.cache is not None:
+            self.repository.cache.clear()
+        logger.warning(
+            "Event change listener reconnected, reloading what other processes may have changed meanwhile."
+        )
+        # the listener is back first, so writes made during the reload are not lost too
+        while self.on_reconnect is not None:
+            try:
+                await self.on_reconnect()
+                break
+            except psycopg2.Error as err:
+                logger.warning("Could not reload after reconnecting: %s", err)
+            await asyncio.sleep(self.reconnect_delay)
+        self.missed = False
+        self._reconnect_task = None
@@ -1,81 +1,404 @@
 """
 Discord bot for coordinating pen-and-paper-shenanigans
 """
+
+import os
 import random
-import logging
-from datetime import time
-from datetime import datetime
+import signal
 import asyncio
+import logging
+import tracemalloc
+from typing import Any, Dict, List, Optional
+from datetime import datetime, time
+from datetime import timedelta
 import psycopg2
 import discord
 from discord import app_commands
 from discord.ext import commands
-from paps_bot.database import create_connection, create_table_sql
+from paps_bot.database import (
+    ConnectionPool,
+    StoragePool,
+    create_pool_from_env_vars,
+)
+from paps_bot.repository import DEFAULT_DURATION_MINUTES, EventRepository
+from paps_bot.cache import EventCache
+from paps_bot.votes import THUMBS_DOWN, THUMBS_UP, VoteEngine
+from paps_bot.views import PAGE_SIZE, EventPager, events_embed, send_export
+from paps_bot.reminders import ReminderScheduler
+from paps_bot.rsvp import ATTENDING, NOT_ATTENDING, RsvpTracker
+from paps_bot import metrics
+from paps_bot.metrics import DRAIN, instrument_command
+from paps_bot.command_sync import sync_command_tree
+from paps_bot.formatting import event_label, format_date, parse_time
+from paps_bot.transfer import parse_import
+from paps_bot.feeds import CalendarFeeds
+from paps_bot.autocomplete import EventIndex
+from paps_bot.logs import configure_logging
+from paps_bot.sharding import ownership_from_env
+from paps_bot.notify import ChangeListener
+from paps_bot.retention import ArchiveJob
+from paps_bot.snapshot import StateSnapshot, read_snapshot, write_snapshot
+from paps_bot.sqlite import create_sqlite_pool_from_env_vars
+from paps_bot.gateway import gateway_options_from_env
+from paps_bot import footprint
+from paps_bot.scheduling import (
+    ConflictIndex,
+    horizon_start,
+    parse_ranges,
+    suggest_slots,
+)
 
 """
 Bot shutdown state for graceful shutdown of bot.
 """
 IS_SHUTTING_DOWN = False
+# largest file import-events reads, a few thousand events
+MAX_IMPORT_BYTES = 1024 * 1024
+# import-events lists at most this many rejected rows
+MAX_IMPORT_ERRORS = 10
+# make-event lists at most this many clashing events
+MAX_CONFLICTS = 5
+WEEKDAYS = (
+    "Monday",
+    "Tuesday",
+    "Wednesday",
+    "Thursday",
+    "Friday",
+    "Saturday",
+    "Sunday",
+)
 
 
-# create the bot
-intents = discord.Intents.default()
-intents.message_content = True
-intents.members = True
-bot = commands.Bot(command_prefix="$", intents=intents)
+# the shards this process runs, all of them unless main.py split them over workers
+ownership = ownership_from_env()
+# worker processes offset their local ports by their index
+WORKER_INDEX = int(os.getenv("WORKER_INDEX", "0"))
+
+# create the bot, GATEWAY_MODE=full brings back the member and message content intents
+bot = commands.AutoShardedBot(
+    command_prefix="$",
+    shard_ids=ownership.shard_ids,
+    shard_count=ownership.shard_count,
+    **gateway_options_from_env(),
+)
 # get the bot logger
 logger = logging.getLogger("discord")
+# every database call goes through the pooled, non-blocking repository,
+# on the storage DB_BACKEND names, postgres unless it is sqlite
+pool: StoragePool = (
+    create_sqlite_pool_from_env_vars()
+    if os.getenv("DB_BACKEND") == "sqlite"
+    else create_pool_from_env_vars()
+)
+cache = EventCache(
+    max_entries=int(os.getenv("EVENT_CACHE_SIZE", "256")),
+    ttl=float(os.getenv("EVENT_CACHE_TTL", "300")),
+)
+repository = EventRepository(pool, cache=cache, ownership=ownership)
+# signups on event messages, batched before they are written
+rsvp = RsvpTracker(
+    bot,
+    repository,
+    flush_interval=float(os.getenv("RSVP_FLUSH_INTERVAL", "2")),
+    flush_size=int(os.getenv("RSVP_FLUSH_SIZE", "200")),
+)
+# open votes are persisted, and routed to by message id from the reaction events
+vote_engine = VoteEngine(bot, repository, rsvp=rsvp)
+# reminders for upcoming events, kept up to date from the repository's writes
+reminders = ReminderScheduler(
+    bot,
+    repository,
+    lead=timedelta(minutes=int(os.getenv("REMINDER_LEAD_MINUTES", "60"))),
+)
+# writes of other bot processes, applied to everything above as they commit,
+# a sqlite file is never shared between processes so it has none
+change_listener = (
+    ChangeListener(pool, repository) if isinstance(pool, ConnectionPool) else None
+)
+# autocomplete suggestions, answered from memory instead of a query per keystroke
+event_index = EventIndex(repository)
+# start and end of every event, so make-event can warn about double bookings
+conflict_index = ConflictIndex(repository)
+# moves past events out of the hot table, set ARCHIVE_AFTER_DAYS=0 to keep them there
+ARCHIVE_AFTER_DAYS = int(os.getenv("ARCHIVE_AFTER_DAYS", "90"))
+archive_job = ArchiveJob(
+    repository,
+    keep=timedelta(days=ARCHIVE_AFTER_DAYS),
+    interval=float(os.getenv("ARCHIVE_INTERVAL", "3600")),
+    batch=int(os.getenv("ARCHIVE_BATCH_SIZE", "500")),
+)
+# local prometheus endpoint, set METRICS_PORT=0 to turn it off
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9108"))
+if METRICS_PORT:
+    METRICS_PORT += WORKER_INDEX
+metrics.REGISTRY.gauge_callback(
+    "paps_open_votes", "Votes waiting for their outcome", lambda: len(vote_engine)
+)
+metrics.REGISTRY.gauge_callback(
+    "paps_pending_reminders", "Event reminders not yet sent", lambda: len(reminders)
+)
+metrics.REGISTRY.gauge_callback(
+    "paps_event_cache_hit_rate",
+    "Share of event list lookups answered from the cache",
+    lambda: cache.stats()["hit_rate"],
+)
+metrics.REGISTRY.gauge_callback(
+    "paps_event_cache_entries",
+    "Filters held by the event cache",
+    lambda: cache.stats()["entries"],
+)
+metrics.REGISTRY.gauge_callback(
+    "paps_db_pool_connections",
+    "Open database connections",
+    lambda: pool.stats()["size"],
+)
+metrics.REGISTRY.gauge_callback(
+    "paps_db_pool_connections_in_use",
+    "Database connections currently borrowed from the pool",
+    lambda: pool.stats()["in_use"],
+)
+metrics.REGISTRY.gauge_callback(
+    "paps_resident_memory_bytes",
+    "Resident set size of the bot process",
+    footprint.rss_bytes,
+)
+metrics_runner = None
+loop_lag_task = None
+# seconds between memory footprint reports, traced with tracemalloc, 0 turns them off
+MEMORY_REPORT_INTERVAL = float(os.getenv("MEMORY_REPORT_INTERVAL", "0"))
+footprint_task = None
+# calendar subscription feeds, set FEED_PORT=0 to turn them off
+FEED_HOST = os.getenv("FEED_HOST", "127.0.0.1")
+FEED_PORT = int(os.getenv("FEED_PORT", "8000"))
+if FEED_PORT:
+    FEED_PORT += WORKER_INDEX
+# where members reach the feed server, e.g. behind a reverse proxy, {port} is this worker's
+FEED_BASE_URL = os.getenv("FEED_BASE_URL", "http://localhost:{port}").replace(
+    "{port}", str(FEED_PORT)
+)
+feeds = CalendarFeeds(repository, secret=os.getenv("FEED_SECRET"), ownership=ownership)
+feed_runner = None
+# in-memory state handed to the next start, {worker} is this worker's index, empty turns it off
+SNAPSHOT_PATH = os.getenv("SNAPSHOT_PATH", "").replace("{worker}", str(WORKER_INDEX))
+# seconds a stopping bot waits for the commands it is still handling
+SHUTDOWN_GRACE = float(os.getenv("SHUTDOWN_GRACE", "10"))
+shutdown_task = None
 
 
-def format_date(date_str, format_str):
-    """Function to format EU date formats DD-MM-YYYY to SQL accepted time object"""
+async def change_watermark() -> Optional[str]:
+    """The repository watermark, None if a snapshot cannot be trusted"""
+    if change_listener is not None:
+        return await change_listener.watermark()
+    # nothing else writes to the file, the watermark cannot move under this process
     try:
-        logger.info("Attempting to format time: %s", date_str)
-        date_obj = datetime.strptime(date_str, format_str)
-        logger.info("Time successfully formatted: %s", date_obj.date())
-        return date_obj.date()
-    except ValueError as err:
-        logger.error("Time formatting error detected: \n %s", err)
+        return await repository.watermark()
+    except psycopg2.Error as err:
+        logger.warning("Could not read the watermark: %s", err)
         return None
 
 
+async def load_state() -> None:
+    """
+    Restore the state a stopping bot left in SNAPSHOT_PATH if nothing was
+    written since, otherwise read it from the database. The warm path never
+    yields to the loop, so no notification lands between the check and the
+    restore.
+    """
+    state = read_snapshot(SNAPSHOT_PATH) if SNAPSHOT_PATH else None
+    if state is not None and (
+        state.shards != ownership.query_filter()
+        or state.watermark != await change_watermark()
+    ):
+        logger.info("The state snapshot is out of date, loading from the database.")
+        state = None
+    if state is None:
+        await event_index.load()
+        await conflict_index.load()
+        await vote_engine.resume()
+        await reminders.start()
+        await rsvp.start()
+        return
+    await event_index.load(state.events)
+    await conflict_index.load(state.events, state.series)
+    await vote_engine.resume(state.votes)
+    await reminders.start(state.upcoming, state.series)
+    await rsvp.start(state.messages)
+    if repository.cache is not None:
+        repository.cache.restore(state.cache)
+    logger.info("Restored the state snapshot at watermark %s.", state.watermark)
+
+
+async def save_state() -> None:
+    """Write the in-memory state to SNAPSHOT_PATH, as of the current watermark"""
+    if not conflict_index.settled:
+        logger.warning("A series change is still being read, not saving state.")
+        return
+    watermark = await change_watermark()
+    if watermark is None:
+        logger.warning("Changes may have been missed, not saving state.")
+        return
+    # taken without yielding, so no write is applied halfway through
+    events, series = conflict_index.snapshot()
+    state = StateSnapshot(
+        watermark=watermark,
+        shards=ownership.query_filter(),
+        events=events,
+        series=series,
+        votes=vote_engine.snapshot(),
+        upcoming=reminders.snapshot(),
+        messages=rsvp.snapshot(),
+        cache=repository.cache.snapshot() if repository.cache is not None else [],
+    )
+    try:
+        size = await asyncio.to_thread(write_snapshot, SNAPSHOT_PATH, state)
+    except OSError as err:
+        logger.error("Could not save the state snapshot: %s", err)
+        return
+    logger.info("Saved the state snapshot at watermark %s, %s bytes.", watermark, size)
+
+
+def request_shutdown() -> None:
+    """Start the graceful shutdown, from a signal handler"""
+    global shutdown_task
+    if shutdown_task is None:
+        shutdown_task = asyncio.create_task(on_shutdown())
+
+
+def guild_of(interaction: discord.Interaction) -> int:
+    """The guild a guild_only command was used in"""
+    if interaction.guild_id is None:
+        raise app_commands.NoPrivateMessage()
+    return interaction.guild_id
+
+
+async def reply(interaction: discord.Interaction, content=None, **kwargs) -> None:
+    """Answer an interaction, or follow it up if it was already answered"""
+    if interaction.response.is_done():
+        await interaction.followup.send(content, **kwargs)
+    else:
+        await interaction.response.send_message(content, **kwargs)
+
+
+async def reload_state() -> None:
+    """Read the indexes, reminders and feeds again, after notifications were lost"""
+    event_index.clear()
+    conflict_index.clear()
+    reminders.clear()
+    feeds.clear()
+    await event_index.load()
+    await conflict_index.load()
+    await reminders.start()
+
+
+@bot.event
+async def setup_hook():
+    """Executed once before the bot connects to discord"""
+    await pool.open()
+    logger.info("Applying database migrations, if any are pending.")
+    version = await repository.migrate()
+    logger.info("Database schema is at version %s.", version)
+    # once per process rather than on_ready, which fires again on every reconnect,
+    # and by one worker only, the commands are global
+    if ownership.owns_shard(0):
+        try:
+            await sync_command_tree(bot.tree, repository, bot.application_id)
+        except (psycopg2.Error, discord.DiscordException) as err:
+            logger.error("Could not sync the command tree:\n %s", err)
+    if change_listener is not None:
+        change_listener.on_reconnect = reload_state
+        await change_listener.start()
+    await load_state()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(signum, request_shutdown)
+    # the archive is shared, one worker moving events into it is enough
+    if ARCHIVE_AFTER_DAYS and ownership.owns_shard(0):
+        await archive_job.start()
+    global metrics_runner, loop_lag_task, feed_runner, footprint_task
+    loop_lag_task = asyncio.create_task(metrics.monitor_event_loop_lag())
+    if MEMORY_REPORT_INTERVAL:
+        footprint_task = asyncio.create_task(
+            footprint.report_periodically(MEMORY_REPORT_INTERVAL)
+        )
+    if METRICS_PORT:
+        metrics_runner = await metrics.serve(METRICS_HOST, METRICS_PORT)
+    if FEED_PORT:
+        await feeds.start()
+        feed_runner = await feeds.serve(FEED_HOST, FEED_PORT)
+
+
 @bot.event
 async def on_ready():
     """Executed when the bot joins the discord server"""
     logger.info("We have logged in as %s", bot.user)
-    logger.info("Creating table, if it does not exist already.")
-    # Create table, if it does not already exist
-    create_table_sql()
-    try:
-        synced = await bot.tree.sync()
-        logger.info("synced %s command(s)" % (len(synced)))
-    except psycopg2.DatabaseError as err:
-        logger.error("An error has occured:\n %s", err)
     logger.info("========= Ready! =========")
 
 
+@bot.event
+async def on_shard_ready(shard_id: int):
+    """Executed when one of this process's shards has connected"""
+    logger.info("Shard %s of %s is ready.", shard_id, bot.shard_count)
+
+
 @bot.event
 async def on_shutdown():
-    """Event handler on_shutdown listens for sigterm signals, and performs an action."""
+    """
+    Event handler on_shutdown runs on SIGTERM and SIGINT. New commands are
+    turned away, running ones get SHUTDOWN_GRACE seconds to finish, buffered
+    signups are written and the in-memory state is saved for the next start.
+    """
     global IS_SHUTTING_DOWN
+    if IS_SHUTTING_DOWN:
+        return
     IS_SHUTTING_DOWN = True
     logger.warning("Bot is shutting down...")
-    conn = create_connection()
-    conn.rollback()
-    conn.close()
-    await bot.logout()
+    if not await DRAIN.drain(SHUTDOWN_GRACE):
+        logger.warning(
+            "%s command(s) still running after %s s, stopping anyway.",
+            DRAIN.in_flight,
+            SHUTDOWN_GRACE,
+        )
+    await archive_job.stop()
+    await vote_engine.stop()
+    await reminders.stop()
+    await rsvp.stop()
+    # signups buffered meanwhile are written before the snapshot reads its watermark
+    await rsvp.flush()
+    if SNAPSHOT_PATH:
+        await save_state()
+    if change_listener is not None:
+        await change_listener.stop()
+    if loop_lag_task is not None:
+        loop_lag_task.cancel()
+    if footprint_task is not None:
+        footprint_task.cancel()
+    if metrics_runner is not None:
+        await metrics_runner.cleanup()
+    if feed_runner is not None:
+        await feed_runner.cleanup()
+    await pool.close()
     await bot.close()
 
 
 @bot.event
-async def on_guild_join():
-    """Once a guild is joined, initiate the db if it does not already exist."""
-    logger.info("Establishing connection to postgreSQL databse ...")
-    conn = create_connection()
-    logger.info("Creating new table...")
-    create_table_sql()
-    logger.info("Done, now ready!")
-    conn.close()
+async def on_raw_reaction_add(payload: discord.RawReactionActionEvent):
+    """Route reactions to the open vote or event signup on that message, if any"""
+    rsvp.handle_reaction(payload, added=True)
+    await vote_engine.handle_reaction(payload, added=True)
+
+
+@bot.event
+async def on_raw_reaction_remove(payload: discord.RawReactionActionEvent):
+    """Route removed reactions to the open vote or event signup on that message, if any"""
+    rsvp.handle_reaction(payload, added=False)
+    await vote_engine.handle_reaction(payload, added=False)
+
+
+@bot.event
+async def on_guild_join(guild: discord.Guild):
+    """Log newly joined guilds, the schema is already migrated at startup."""
+    logger.info("Joined guild %s, now ready!", guild)
 
 
 @bot.command()
@@ -87,6 +410,7 @@ async def bot_shutdown(ctx):
 
 
 @bot.tree.command(name="hello", description="Answers with an appropriate hello message")
+@instrument_command
 async def hello(Interaction: discord.Interaction):
     """Funny function to say hello in various ways"""
     options = [
@@ -104,6 +428,34 @@ async def hello(Interaction: discord.Interaction):
     await Interaction.response.send_message(response)
 
 
+def _describe_conflicts(
+    guild_id: int, game_date, game_time: time, duration_minutes: int
+):
+    """A message listing the events a new one would overlap, None if it overlaps none"""
+    if game_date is None:
+        # the insert reports the bad date
+        return None
+    begins = datetime.combine(game_date, game_time)
+    clashes = conflict_index.conflicts(
+        guild_id, begins, begins + timedelta(minutes=duration_minutes)
+    )
+    if not clashes:
+        return None
+    logger.warning("New event overlaps %s event(s), not creating it.", len(clashes))
+    lines = [
+        f"- {event_label(row[0])}: {row[1]} from {begins:%d-%m-%Y %H:%M} to {ends:%H:%M}"
+        for begins, ends, row in clashes[:MAX_CONFLICTS]
+    ]
+    if len(clashes) > MAX_CONFLICTS:
+        lines.append(f"... and {len(clashes) - MAX_CONFLICTS} more")
+    return (
+        "That would overlap these events:\n"
+        + "\n".join(lines)
+        + "\nPick another time, or set allow_overlap to create it anyway."
+    )
+
+
+@app_commands.guild_only()
 @bot.tree.command(
     name="make-event-novote",
     description="Create an event using the given parameters, voiding the voting process.",
@@ -112,9 +464,18 @@ async def hello(Interaction: discord.Interaction):
     game_type="Type of event - CPR or DND",
     game_date="Date of event - DD-MM-YYYY",
     game_time="Time of event - HH:MM",
+    duration_hours="How long the event lasts in hours, 3 if not given",
+    allow_overlap="Create the event even if it overlaps another one",
 )
+@instrument_command
 async def make_event_novote(
-    Interaction: discord.Interaction, game_type: str, game_date: str, game_time: str
+    Interaction: discord.Interaction,
+    game_type: str,
+    game_date: str,
+    game_time: str,
+    duration_hours: app_commands.Range[float, 0.5, 24.0] = DEFAULT_DURATION_MINUTES
+    / 60,
+    allow_overlap: bool = False,
 ):
     """Bot command to insert a new event into paps_table table, voiding vote process."""
     try:
@@ -128,189 +489,168 @@ async def make_event_novote(
         # Some formatting of game_time, we will never set an event to a specific second
         # So in order for SQL to accept just HH:MM we need to add it to whatever is input
         logger.info("Formatting game time to SQL acceptable HH:MM:SS format")
-        game_time = game_time + ":00"  # Required, add seconds as 00 to query
-        game_time = time.fromisoformat(
-            game_time
-        )  # Convert above to time object to insert to query.
-        game_date = format_date(
+        start_time = parse_time(game_time)
+        day = format_date(
             game_date, "%d-%m-%Y"
         )  # Formart EU standard date format to SQL date format.
-
-        logger.info("Establishing connection to database...")
-        conn = create_connection()
-        cur = conn.cursor()
-        logger.info("Connection established, cursor created...")
-
-        logger.info("Sending SQL query to database...")
-        cur.execute(
-            f"""INSERT INTO paps_table (game_type, game_date, game_time) VALUES ('{game_type}', '{game_date}', '{game_time}')"""
-        )
+        if day is None or start_time is None:
+            await Interaction.response.send_message(
+                "The date must be DD-MM-YYYY and the time HH:MM.", ephemeral=True
+            )
+            return
+        duration_minutes = round(duration_hours * 60)
+        clash = None
+        if not allow_overlap:
+            clash = _describe_conflicts(
+                guild_of(Interaction), day, start_time, duration_minutes
+            )
+        if clash is not None:
+            await Interaction.response.send_message(clash, ephemeral=True)
+            return
 
         logger.info(
             "Attempting to add event to paps_table:\n Type: %s, Date: %s, Time: %s",
             game_type,
-            game_date,
-            game_time,
+            day,
+            start_time,
+        )
+        game_id = await repository.add_event(
+            guild_of(Interaction),
+            game_type,
+            day,
+            start_time,
+            channel_id=Interaction.channel_id,
+            duration_minutes=duration_minutes,
         )
-        conn.commit()
-        cur.close()
-        conn.close()
         embed = discord.Embed(
             title="Event created WITHOUT a vote", color=discord.Color.red()
         )
-        embed.set_author(name=Interaction.user, icon_url=Interaction.user.avatar.url)
+        embed.set_author(
+            name=Interaction.user, icon_url=Interaction.user.display_avatar.url
+        )
         embed.add_field(name="Event Type", value=game_type, inline=False)
-        embed.add_field(name="Event Date", value=game_date, inline=False)
-        embed.add_field(name="Event Time", value=game_time, inline=False)
-        embed.set_footer(text="This event was forced, bypassing the vote.")
-        await Interaction.response.send_message(embed=embed)
-        logger.warning(
-            "========= Event succesfully added! Connection closed... ========="
+        embed.add_field(name="Event Date", value=day, inline=False)
+        embed.add_field(name="Event Time", value=start_time, inline=False)
+        embed.add_field(
+            name="Duration", value=f"{duration_hours:g} hours", inline=False
         )
-    except (psycopg2.Error, discord.DiscordException) as err:
-        await Interaction.channel.send(
-            f"======== An error has occured: ======== \n{str(err)}"
+        embed.set_footer(
+            text=f"This event was forced, bypassing the vote. React {ATTENDING} if you are attending, {NOT_ATTENDING} if not."
         )
-        logger.error(
-            "======== Error occured: ======== \n %s \nConnection closed...", str(err)
+        await Interaction.response.send_message(embed=embed)
+        await rsvp.track_message(game_id, await Interaction.original_response())
+        logger.warning("========= Event succesfully added! =========")
+    except (psycopg2.Error, discord.DiscordException) as err:
+        await reply(
+            Interaction, f"======== An error has occured: ======== \n{str(err)}"
         )
+        logger.error("======== Error occured: ======== \n %s", str(err))
 
 
+@app_commands.guild_only()
 @bot.tree.command(name="make-event", description="Creates a new event")
 @app_commands.describe(
     game_type="Type of event - CPR or DND",
     game_date="Date of event - DD-MM-YYYY",
     game_time="Time of event - HH:MM",
+    duration_hours="How long the event lasts in hours, 3 if not given",
+    allow_overlap="Start the vote even if the event overlaps another one",
 )
+@instrument_command
 async def make_eventvote(
-    Interaction: discord.Interaction, game_type: str, game_date: str, game_time: str
+    Interaction: discord.Interaction,
+    game_type: str,
+    game_date: str,
+    game_time: str,
+    duration_hours: app_commands.Range[float, 0.5, 24.0] = DEFAULT_DURATION_MINUTES
+    / 60,
+    allow_overlap: bool = False,
 ):
     """Function to insert a new event into paps_table table provided it passes a vote"""
+    logger.info(
+        "\n============== make-event command executed from discord! ================ Data received:\n %s \nType: %s, Date: %s, TIME: %s",
+        Interaction.user,
+        game_type,
+        game_date,
+        game_time,
+    )
+    # Some formatting of date and time to acceptable SQL format
+    logger.info("Adjusting time format for %s to HH:MM...", game_time)
+    start_time = parse_time(game_time)
+    day = format_date(
+        game_date, "%d-%m-%Y"
+    )  # Formart EU standard date format to SQL date format.
+    if day is None or start_time is None:
+        await Interaction.response.send_message(
+            "The date must be DD-MM-YYYY and the time HH:MM.", ephemeral=True
+        )
+        return
+    duration_minutes = round(duration_hours * 60)
+    # checked before deferring, a followup is only private if the defer was
+    clash = None
+    if not allow_overlap:
+        clash = _describe_conflicts(
+            guild_of(Interaction), day, start_time, duration_minutes
+        )
+    if clash is not None:
+        await Interaction.response.send_message(clash, ephemeral=True)
+        return
     await Interaction.response.defer()
     try:
-        logger.info(
-            "\n============== make-event command executed from discord! ================ Data received:\n %s \nType: %s, Date: %s, TIME: %s",
-            Interaction.user,
-            game_type,
-            game_date,
-            game_time,
-        )
-
-        # Some formatting of date and time to acceptable SQL format
-        logger.info("Adjusting time format for %s to HH:MM...", game_time)
-        game_time = game_time + ":00"  # Required, add seconds as 00 to query
-        game_time = time.fromisoformat(
-            game_time
-        )  # Convert above to time object to insert to query.
-        game_date = format_date(
-            game_date, "%d-%m-%Y"
-        )  # Formart EU standard date format to SQL date format.
         logger.info("Now initiating vote!")
 
-        # Below, the voting process starts!
-        # Set up some settings:
-        thumbs_up = "👍"
-        thumbs_down = "👎"
-        voting_period = 86400  # in seconds, 86400 seconds = 1 day
-        count_limit_success = 1
-        count_limit_fail = 1
         # Create a neat embed to send with the relevant information:
         embed = discord.Embed(
             title="New event vote created!", color=discord.Color.green()
         )
-        embed.set_author(name=Interaction.user, icon_url=Interaction.user.avatar.url)
+        embed.set_author(
+            name=Interaction.user, icon_url=Interaction.user.display_avatar.url
+        )
         embed.add_field(name="Event Type", value=game_type, inline=False)
-        embed.add_field(name="Event Date", value=game_date, inline=False)
-        embed.add_field(name="Event Time", value=game_time, inline=False)
-        embed.set_footer(text="Vote using 👍 If you can attend, and 👎 if you cannot.")
+        embed.add_field(name="Event Date", value=day, inline=False)
+        embed.add_field(name="Event Time", value=start_time, inline=False)
+        embed.add_field(
+            name="Duration", value=f"{duration_hours:g} hours", inline=False
+        )
+        embed.set_footer(
+            text=f"Vote using {THUMBS_UP} If you can attend, and {THUMBS_DOWN} if you cannot."
+        )
         # Send event details to discord channel.
         logger.info("Vote ready! - Sending vote to Discord.")
-        event_message = await Interaction.followup.send(embed=embed)
+        event_message = await Interaction.followup.send(embed=embed, wait=True)
 
-        # Add thumbs-up and thumbs-down reactions to the message.
-        await event_message.add_reaction(thumbs_up)
-        await event_message.add_reaction(thumbs_down)
-
-        # Set up event handlers to listen for reactions to the message, making sure to ignore the bots "vote".
-        def check(reaction, user):
-            return (
-                user != bot.user
-                and reaction.message.id == event_message.id
-                and str(reaction.emoji) in [thumbs_up, thumbs_down]
-            )
-
-        try:
-            logger.info("Now listening for votes.... fetching coffee while I wait.")
-            # Vote counters here
-            thumbs_up_count = 0
-            thumbs_down_count = 0
-
-            # Below we listen for pass conditions, and react accordingly.
-            while True:
-                reaction, _ = await bot.wait_for(
-                    "reaction_add", timeout=voting_period, check=check
-                )
-                # Itteration counters for the emojis
-                if reaction.emoji == thumbs_up:
-                    thumbs_up_count += 1
-                elif reaction.emoji == thumbs_down:
-                    thumbs_down_count += 1
-
-                # Pass condition reaction(Enough up-votes)
-                if thumbs_up_count >= count_limit_success:
-                    logger.info("Vote passed! Processing event to database...")
-                    conn = create_connection()
-                    cur = conn.cursor()
-
-                    cur.execute(
-                        "INSERT INTO paps_table (game_type, game_date, game_time) VALUES (%s, %s, %s)",
-                        (game_type, game_date, game_time),
-                    )
-                    conn.commit()
-
-                    cur.close()
-                    conn.close()
-                    logger.warning(
-                        "========== Event added succesfully, sending to discord! ========"
-                    )
-                    await Interaction.channel.send(
-                        "The event has received enough votes, and was saved!"
-                    )
-                    break
-
-                # Fail condition reaction(Too many down-votes)
-                if thumbs_down_count >= count_limit_fail:
-                    logger.warning(
-                        "========== Vote failed, too many down-votes... =========="
-                    )
-                    await Interaction.channel.send(
-                        "The event received too many down-votes, and will not be saved!"
-                    )
-                    break
+        # Persist the vote, from here on reactions are counted by on_raw_reaction_add
+        await vote_engine.open_vote(
+            event_message, game_type, day, start_time, duration_minutes
+        )
 
-        # Fail condition(Vote timeout)
-        except asyncio.TimeoutError:
-            logger.warning("======= The voting period has ended(Timeout) ========")
-            await Interaction.channel.send("Voting period has ended")
+        # Add thumbs-up and thumbs-down reactions to the message.
+        await event_message.add_reaction(THUMBS_UP)
+        await event_message.add_reaction(THUMBS_DOWN)
+        logger.info("Now listening for votes.... fetching coffee while I wait.")
     except psycopg2.Error as err:
         logger.error("======= An error has occured: =======\n %s", str(err))
-        await Interaction.channel.send(f"An error has occured: {str(err)}")
+        await reply(Interaction, f"An error has occured: {str(err)}")
 
 
+@app_commands.guild_only()
 @bot.tree.command(name="list-events", description="List planned event(s)")
 @app_commands.describe(
     game_id="ID of event - Unique ID",
     game_type="Type of event - CPR or DND",
     game_date="Date of event - DD-MM-YYYY",
     game_time="Time of event - HH:MM",
+    archived="List archived past events instead of recent and upcoming ones",
 )
+@instrument_command
 async def list_events(
     Interaction: discord.Interaction,
     *,
-    game_id: str = None,
-    game_type: str = None,
-    game_date: str = None,
-    game_time: str = None,
+    game_id: Optional[str] = None,
+    game_type: Optional[str] = None,
+    game_date: Optional[str] = None,
+    game_time: Optional[str] = None,
+    archived: bool = False,
 ):
     """Function to fetch events, and send them to discord."""
     try:
@@ -322,101 +662,69 @@ async def list_events(
             game_date,
             game_time,
         )
-        logger.info("Establishing connection to database...")
-        conn = create_connection()
-        logger.info("Connection established, creating SQL cursor...")
-        cur = conn.cursor()
-
-        # Base query to itterate upon
-        query = (
-            "SELECT game_id, game_type, game_date, game_time FROM paps_table WHERE TRUE"
-        )
-        logger.info("Established base query:\n %s", query)
-
         # Below we check if any filters were provided with the command, and act accordingly.
         logger.info("Fetching data...")
+        if game_type is not None:
+            game_type = game_type.lower()
+        new_date = format_date(game_date, "%d-%m-%Y") if game_date else None
+        new_time = parse_time(game_time) if game_time else None
+        if (game_date and new_date is None) or (game_time and new_time is None):
+            await Interaction.response.send_message(
+                "The date must be DD-MM-YYYY and the time HH:MM.", ephemeral=True
+            )
+            return
+        game_date, game_time = new_date, new_time
+        if not any((game_id, game_type, game_date, game_time)):
+            logger.warning("No valid filter applied...")
+        filters: Dict[str, Any] = {
+            "game_id": game_id,
+            "game_type": game_type,
+            "game_date": game_date,
+            "game_time": game_time,
+            "archived": archived,
+        }
         try:
-            if game_id is not None:
-                query += " AND game_id = '%s'" % (game_id)
-                logger.info("Sending query:\n %s", query)
-                cur.execute(query)
-            elif game_type is not None:
-                game_type = game_type.lower()
-                query += " AND game_type = '%s'" % (game_type)
-                logger.info("Sending query:\n %s", query)
-                cur.execute(query)
-            elif game_date is not None:
-                game_date = format_date(game_date, "%d-%m-%Y")
-                if game_date:
-                    query += " AND game_date = '%s'" % (game_date)
-                    logger.info("Sending query:\n %s", query)
-                    cur.execute(query)
-            elif game_time is not None:
-                query += " AND game_time = '%s'" % (str(game_time))
-                logger.info("Sending query:\n %s", query)
-                cur.execute(query)
-            else:
-                logger.warning("No valid filter applied...")
-                query = (
-                    "SELECT game_id, game_type, game_date, game_time FROM paps_table"
-                )
-                logger.info("Sending query:\n%s", query)
-                cur.execute(query)
-
-            rows = cur.fetchall()
+            page = await repository.find_events(
+                guild_of(Interaction), **filters, limit=PAGE_SIZE
+            )
         except (psycopg2.Error, discord.DiscordException) as err:
-            await Interaction.channel.send(
-                f"An error occurred while executing the query: {str(err)}"
+            await reply(
+                Interaction, f"An error occurred while executing the query: {str(err)}"
             )
             return
-        logger.info("Query sent! Fetch succesfull!")
-        logger.info("Closing connection to database...")
-        cur.close()
-        conn.close()
+        logger.info(
+            "Query sent! Fetch succesfull! Cache stats: %s, coalescing: %s",
+            cache.stats(),
+            repository.page_reads.stats(),
+        )
 
         logger.info("Now processing fetch data...")
         logger.info("Creating discord embed object...")
-        if rows:
-            embed = discord.Embed(title="Events Results:", color=discord.Color.blue())
-            embed.add_field(
-                name="ID - Type - Date - Location", value="\u200b", inline=False
-            )  # Header field
-            for game_id, game_type, game_date, game_time in rows:
-                row_info = f"{game_id} - {game_type} - {game_date} - {game_time}"  # Assemble SQL data
-                embed.add_field(
-                    name="\u200b", value=row_info, inline=False
-                )  # Send SQL data
+        if page.rows:
+            # only the first page is fetched here, the buttons fetch the others on demand
+            pager = EventPager(repository, guild_of(Interaction), filters, page)
             logger.info("Discord embed created, data assembled, sending to discord...")
-            await Interaction.response.send_message(embed=embed)
-            logger.info("======== Discord message sent via Embed! ==========")
-            """ OLD(await confirmation of to use embed)
-        if rows:
-            event_list = "\n".join(
-                f"{game_id} - {game_type} - {game_date} - {game_time}"
-                for game_id, game_type, game_date, game_time in rows
-            )
-            logger.info(
-                "Processing succesfull! Final fetch:\n %s \n Sending to discord...",
-                event_list,
+            await Interaction.response.send_message(
+                embed=events_embed(page, 0), view=pager
             )
-            await Interaction.response.send_message("Results:", ephemeral=True)
-            await Interaction.channel.send(f"Current Events:\nID - TYPE - DATE - TIME\n{event_list}")
-            logger.info("====== Discord message sent! =========")
-            """
+            pager.message = await Interaction.original_response()
+            logger.info("======== Discord message sent via Embed! ==========")
         else:
             logger.warning("========No events found from query...========")
             embed = embed = discord.Embed(
                 title="Events Results:", color=discord.Color.red()
             )
             embed.add_field(name="No events found", value="There were no events found.")
-            await Interaction.channel.send(embed=embed)
+            await reply(Interaction, embed=embed)
     except psycopg2.Error as err:
         logger.error("======== An error has occured: =======\n %s", str(err))
-        await Interaction.channel.send(f"An error occurred: {str(err)}")
+        await reply(Interaction, f"An error occurred: {str(err)}")
 
 
+@app_commands.guild_only()
 @bot.tree.command(name="delete-event", description="Delete an event by event ID")
 @app_commands.describe(game_id="ID of event to delete")
+@instrument_command
 async def delete_event(Interaction: discord.Interaction, game_id: int):
     """A function to delete events from database by game_id"""
     try:
@@ -425,21 +733,12 @@ async def delete_event(Interaction: discord.Interaction, game_id: int):
             Interaction.user,
             game_id,
         )
-        logger.info("Establishing connection...")
-        conn = create_connection()
-        logger.info("Connection succesfull, creating SQL cursor...")
-        cur = conn.cursor()
-
-        query = "DELETE FROM paps_table WHERE game_id = %s" % (game_id)
-        logger.info("Query created: \n %s", query)
-        cur.execute(query, (game_id,))
-        conn.commit()
         logger.info("Sending query...")
-        if cur.rowcount > 0:
+        if await repository.delete_event(guild_of(Interaction), game_id):
             logger.info("Event succesfully deleted!")
             embed = discord.Embed(title="Delete Event", color=discord.Color.red())
             embed.set_author(
-                name=Interaction.user, icon_url=Interaction.user.avatar.url
+                name=Interaction.user, icon_url=Interaction.user.display_avatar.url
             )
             embed.add_field(
                 name="Following event id has been deleted", value=game_id, inline=False
@@ -449,33 +748,34 @@ async def delete_event(Interaction: discord.Interaction, game_id: int):
             logger.warning("No event found by ID: %s", game_id)
             embed = discord.Embed(title="Delete Event", color=discord.Color.red())
             embed.set_author(
-                name=Interaction.user, icon_url=Interaction.user.avatar.url
+                name=Interaction.user, icon_url=Interaction.user.display_avatar.url
             )
             embed.add_field(
                 name="No event was found by that id", value=game_id, inline=False
             )
-            await Interaction.channel.send(embed=embed)
-
-        cur.close()
-        conn.close()
+            await reply(Interaction, embed=embed)
     except psycopg2.Error as err:
-        logger.error(f"========= An error has occured: =========\n{str(err)}")
-        await Interaction.channel.send(f"An error has occured: {str(err)}")
+        logger.error("========= An error has occured: =========\n %s", str(err))
+        await reply(Interaction, f"An error has occured: {str(err)}")
 
 
+@app_commands.guild_only()
 @bot.tree.command(name="edit-event", description="Edit event by event ID")
 @app_commands.describe(
     game_id="Required, unique ID of event to edit",
     game_type="Game type to change event to",
     game_date="Date to change the event to",
     game_time="Time to change the event to",
+    duration_hours="How long the event lasts in hours",
 )
+@instrument_command
 async def edit_event(
     Interaction: discord.Interaction,
     game_id: int,
-    game_type: str = None,
-    game_date: str = None,
-    game_time: str = None,
+    game_type: Optional[str] = None,
+    game_date: Optional[str] = None,
+    game_time: Optional[str] = None,
+    duration_hours: Optional[app_commands.Range[float, 0.5, 24.0]] = None,
 ):
     """A function to edit existing events by id"""
     try:
@@ -487,39 +787,30 @@ async def edit_event(
             game_date,
             game_time,
         )
-        logger.info("Establishing connection to SQL database...")
-        conn = create_connection()
-        logger.info("Connection established, creating cursor...")
-        cur = conn.cursor()
-
-        query = "UPDATE paps_table SET"
-        logger.info("Base query created: %s", query)
-        if game_type:
-            query += " game_type = '%s'," % (game_type)
-            logger.info("Changing game type to: %s", game_type)
-        elif game_date:
-            query += " game_date = '%s'," % (game_date)
-            logger.info("Changing game date to: %s", game_date)
-        elif game_time:
-            query += " game_time = '%s'," % (game_time)
-            logger.info("Changing game time to: %s", game_time)
-        else:
-            Interaction.channel.send("No changes made...")
-
-        # Remove the trailing comma from the query
-        query = query.rstrip(",")
+        if not any((game_type, game_date, game_time, duration_hours)):
+            await Interaction.response.send_message("No changes made...")
+            return
+        new_date = format_date(game_date, "%d-%m-%Y") if game_date else None
+        new_time = parse_time(game_time) if game_time else None
+        if (game_date and new_date is None) or (game_time and new_time is None):
+            await Interaction.response.send_message(
+                "The date must be DD-MM-YYYY and the time HH:MM.", ephemeral=True
+            )
+            return
 
-        query += " WHERE game_id = %s" % (game_id)
-        cur.execute(query)
-        logger.info("Final query:\n %s", query)
         logger.info("Sending query...")
-        conn.commit()
-
-        if cur.rowcount > 0:
+        if await repository.update_event(
+            guild_of(Interaction),
+            game_id,
+            game_type=game_type,
+            game_date=new_date,
+            game_time=new_time,
+            duration_minutes=round(duration_hours * 60) if duration_hours else None,
+        ):
             logger.info("======== Event ID: %s has been updated... ========", game_id)
             embed = discord.Embed(title="Edit Event", color=discord.Color.yellow())
             embed.set_author(
-                name=Interaction.user, icon_url=Interaction.user.avatar.url
+                name=Interaction.user, icon_url=Interaction.user.display_avatar.url
             )
             edit_field = f"{game_id} - {game_type} - {game_date} - {game_time}"
             embed.add_field(
@@ -532,23 +823,650 @@ async def edit_event(
             logger.warning("========= No event found by ID:%s =========", game_id)
             embed = discord.Embed(title="Edit event", color=discord.Color.red())
             embed.set_author(
-                name=Interaction.user, icon_url=Interaction.user.avatar.url
+                name=Interaction.user, icon_url=Interaction.user.display_avatar.url
             )
             edit_field = f"{game_id} - {game_type} - {game_date} - {game_time}"
             embed.add_field(
                 name="No event was found by game ID", value=game_id, inline=False
             )
-            await Interaction.channel.send(embed=embed)
+            await reply(Interaction, embed=embed)
+    except psycopg2.Error as err:
+        logger.error("======== An error has occured: ========\n %s", str(err))
+        await reply(Interaction, f"An error has occured: {str(err)}")
+
+
+@app_commands.guild_only()
+@bot.tree.command(
+    name="make-series", description="Create an event repeating weekly or biweekly"
+)
+@app_commands.describe(
+    game_type="Type of event - CPR or DND",
+    first_date="Date of the first session - DD-MM-YYYY",
+    game_time="Time of every session - HH:MM",
+    every="How often the event repeats",
+    until="Optional, date of the last possible session - DD-MM-YYYY",
+    count="Optional, number of sessions",
+    duration_hours="How long every session lasts in hours, 3 if not given",
+)
+@app_commands.choices(
+    every=[
+        app_commands.Choice(name="weekly", value=1),
+        app_commands.Choice(name="biweekly", value=2),
+    ]
+)
+@instrument_command
+async def make_series(
+    Interaction: discord.Interaction,
+    game_type: str,
+    first_date: str,
+    game_time: str,
+    every: app_commands.Choice[int],
+    until: Optional[str] = None,
+    count: Optional[int] = None,
+    duration_hours: app_commands.Range[float, 0.5, 24.0] = DEFAULT_DURATION_MINUTES
+    / 60,
+):
+    """Store a recurring event as one rule, its sessions are expanded when listed"""
+    try:
+        logger.info(
+            "make-series command received from discord! %s, %s %s from %s at %s",
+            Interaction.user,
+            game_type,
+            every.name,
+            first_date,
+            game_time,
+        )
+        start_date = format_date(first_date, "%d-%m-%Y")
+        until_date = format_date(until, "%d-%m-%Y") if until else None
+        session_time = parse_time(game_time)
+        if start_date is None or session_time is None or (until and not until_date):
+            await Interaction.response.send_message(
+                "Dates must be DD-MM-YYYY and the time HH:MM.", ephemeral=True
+            )
+            return
+        if until_date and count:
+            await Interaction.response.send_message(
+                "Give an end date or a number of sessions, not both.", ephemeral=True
+            )
+            return
+        if (count is not None and count < 1) or (
+            until_date and until_date < start_date
+        ):
+            await Interaction.response.send_message(
+                "That series would not have any sessions.", ephemeral=True
+            )
+            return
+        series_id = await repository.add_series(
+            guild_of(Interaction),
+            game_type,
+            start_date,
+            session_time,
+            every.value,
+            until=until_date,
+            count=count,
+            channel_id=Interaction.channel_id,
+            duration_minutes=round(duration_hours * 60),
+        )
+        if until_date:
+            ends = f"On {until_date}"
+        elif count:
+            ends = f"After {count} session(s)"
+        else:
+            ends = "Never"
+        embed = discord.Embed(
+            title="Recurring event created", color=discord.Color.green()
+        )
+        embed.set_author(
+            name=Interaction.user, icon_url=Interaction.user.display_avatar.url
+        )
+        embed.add_field(name="Series ID", value=series_id, inline=False)
+        embed.add_field(name="Event Type", value=game_type, inline=False)
+        embed.add_field(name="First Date", value=start_date, inline=False)
+        embed.add_field(name="Event Time", value=session_time, inline=False)
+        embed.add_field(
+            name="Duration", value=f"{duration_hours:g} hours", inline=False
+        )
+        embed.add_field(name="Repeats", value=every.name.capitalize(), inline=False)
+        embed.add_field(name="Ends", value=ends, inline=False)
+        embed.set_footer(
+            text="Change or cancel a single session with /edit-occurrence and /cancel-occurrence."
+        )
+        await Interaction.response.send_message(embed=embed)
+    except psycopg2.Error as err:
+        logger.error("======== An error has occured: ========\n %s", str(err))
+        await reply(Interaction, f"An error has occured: {str(err)}")
+
+
+async def _override_occurrence(
+    Interaction: discord.Interaction,
+    series_id: int,
+    occurrence_date: str,
+    title: str,
+    **changes,
+) -> None:
+    """Shared by edit-occurrence and cancel-occurrence"""
+    try:
+        day = format_date(occurrence_date, "%d-%m-%Y")
+        if day is None:
+            await Interaction.response.send_message(
+                "The session date must be DD-MM-YYYY.", ephemeral=True
+            )
+            return
+        if await repository.override_occurrence(
+            guild_of(Interaction), series_id, day, **changes
+        ):
+            logger.info(
+                "Series %s session on %s overridden: %s", series_id, day, changes
+            )
+            embed = discord.Embed(title=title, color=discord.Color.yellow())
+            embed.set_author(
+                name=Interaction.user, icon_url=Interaction.user.display_avatar.url
+            )
+            embed.add_field(name="Series ID", value=series_id, inline=False)
+            embed.add_field(name="Session", value=day, inline=False)
+            for name, value in changes.items():
+                if value is not None and name != "cancelled":
+                    embed.add_field(
+                        name=name.replace("game_", "New ").title(),
+                        value=value,
+                        inline=False,
+                    )
+            await Interaction.response.send_message(embed=embed)
+        else:
+            logger.warning("No session of series %s on %s", series_id, day)
+            await Interaction.response.send_message(
+                f"Series {series_id} has no session on {day}.", ephemeral=True
+            )
+    except psycopg2.Error as err:
+        logger.error("======== An error has occured: ========\n %s", str(err))
+        await reply(Interaction, f"An error has occured: {str(err)}")
+
+
+@app_commands.guild_only()
+@bot.tree.command(
+    name="edit-occurrence", description="Change a single session of a recurring event"
+)
+@app_commands.describe(
+    series_id="ID of the recurring event",
+    occurrence_date="Date the series puts the session on - DD-MM-YYYY",
+    game_type="Game type to change the session to",
+    game_date="Date to move the session to - DD-MM-YYYY",
+    game_time="Time to move the session to - HH:MM",
+)
+@instrument_command
+async def edit_occurrence(
+    Interaction: discord.Interaction,
+    series_id: int,
+    occurrence_date: str,
+    game_type: Optional[str] = None,
+    game_date: Optional[str] = None,
+    game_time: Optional[str] = None,
+):
+    """Override one session of a series, restoring it if it was cancelled"""
+    logger.info(
+        "edit-occurrence command received from discord! %s, series %s on %s",
+        Interaction.user,
+        series_id,
+        occurrence_date,
+    )
+    new_date = format_date(game_date, "%d-%m-%Y") if game_date else None
+    new_time = parse_time(game_time) if game_time else None
+    if (game_date and new_date is None) or (game_time and new_time is None):
+        await Interaction.response.send_message(
+            "Dates must be DD-MM-YYYY and the time HH:MM.", ephemeral=True
+        )
+        return
+    await _override_occurrence(
+        Interaction,
+        series_id,
+        occurrence_date,
+        "Session edited",
+        game_type=game_type,
+        game_date=new_date,
+        game_time=new_time,
+    )
+
+
+@app_commands.guild_only()
+@bot.tree.command(
+    name="cancel-occurrence", description="Cancel a single session of a recurring event"
+)
+@app_commands.describe(
+    series_id="ID of the recurring event",
+    occurrence_date="Date the series puts the session on - DD-MM-YYYY",
+)
+@instrument_command
+async def cancel_occurrence(
+    Interaction: discord.Interaction, series_id: int, occurrence_date: str
+):
+    """Skip one session of a series"""
+    logger.info(
+        "cancel-occurrence command received from discord! %s, series %s on %s",
+        Interaction.user,
+        series_id,
+        occurrence_date,
+    )
+    await _override_occurrence(
+        Interaction, series_id, occurrence_date, "Session cancelled", cancelled=True
+    )
+
+
+@app_commands.guild_only()
+@bot.tree.command(
+    name="delete-series", description="Delete a recurring event and all its sessions"
+)
+@app_commands.describe(series_id="ID of the recurring event to delete")
+@instrument_command
+async def delete_series(Interaction: discord.Interaction, series_id: int):
+    """Delete a series with every override of it"""
+    try:
+        logger.info(
+            "delete-series command received from discord! %s, series %s",
+            Interaction.user,
+            series_id,
+        )
+        if await repository.delete_series(guild_of(Interaction), series_id):
+            embed = discord.Embed(title="Delete Series", color=discord.Color.red())
+            embed.set_author(
+                name=Interaction.user, icon_url=Interaction.user.display_avatar.url
+            )
+            embed.add_field(
+                name="Following series has been deleted", value=series_id, inline=False
+            )
+            await Interaction.response.send_message(embed=embed)
+        else:
+            logger.warning("No series found by ID: %s", series_id)
+            await Interaction.response.send_message(
+                f"No series was found by the id {series_id}.", ephemeral=True
+            )
+    except psycopg2.Error as err:
+        logger.error("========= An error has occured: =========\n %s", str(err))
+        await reply(Interaction, f"An error has occured: {str(err)}")
+
+
+@app_commands.guild_only()
+@bot.tree.command(
+    name="availability", description="Tell the bot when you are free on a weekday"
+)
+@app_commands.describe(
+    weekday="Day of the week",
+    times="When you are free, e.g. 18:00-23:00 or 10:00-12:00, 19:00-24:00 - off to clear the day",
+)
+@app_commands.choices(
+    weekday=[
+        app_commands.Choice(name=name, value=index)
+        for index, name in enumerate(WEEKDAYS)
+    ]
+)
+@instrument_command
+async def set_availability(
+    Interaction: discord.Interaction, weekday: app_commands.Choice[int], times: str
+):
+    """Replace the member's free time on a weekday, used by suggest-slot"""
+    try:
+        logger.info(
+            "availability command received from discord! %s, %s: %s",
+            Interaction.user,
+            weekday.name,
+            times,
+        )
+        ranges = [] if times.strip().lower() == "off" else parse_ranges(times)
+        if ranges is None:
+            await Interaction.response.send_message(
+                "Times must look like 18:00-23:00, separate several with commas.",
+                ephemeral=True,
+            )
+            return
+        await repository.set_availability(
+            guild_of(Interaction), Interaction.user.id, weekday.value, ranges
+        )
+        shown = ", ".join(
+            f"{start // 60:02}:{start % 60:02}-{end // 60:02}:{end % 60:02}"
+            for start, end in ranges
+        )
+        await Interaction.response.send_message(
+            (
+                f"On {weekday.name}s you are free {shown}."
+                if ranges
+                else f"On {weekday.name}s you are not free."
+            ),
+            ephemeral=True,
+        )
+    except psycopg2.Error as err:
+        logger.error("======== An error has occured: ========\n %s", str(err))
+        await reply(Interaction, f"An error has occured: {str(err)}")
+
+
+@app_commands.guild_only()
+@bot.tree.command(
+    name="clear-availability", description="Forget every time you said you are free"
+)
+@instrument_command
+async def clear_availability(Interaction: discord.Interaction):
+    """Remove the member from suggest-slot"""
+    try:
+        logger.info(
+            "clear-availability command received from discord! %s", Interaction.user
+        )
+        removed = await repository.clear_availability(
+            guild_of(Interaction), Interaction.user.id
+        )
+        await Interaction.response.send_message(
+            f"Removed {removed} time range(s).", ephemeral=True
+        )
+    except psycopg2.Error as err:
+        logger.error("======== An error has occured: ========\n %s", str(err))
+        await reply(Interaction, f"An error has occured: {str(err)}")
+
+
+@app_commands.guild_only()
+@bot.tree.command(
+    name="suggest-slot", description="Find times most members are free for an event"
+)
+@app_commands.describe(
+    duration_hours="How long the event lasts in hours, 3 if not given",
+    days="How many days ahead to look, 14 if not given",
+)
+@instrument_command
+async def suggest_slot(
+    Interaction: discord.Interaction,
+    duration_hours: app_commands.Range[float, 0.5, 24.0] = DEFAULT_DURATION_MINUTES
+    / 60,
+    days: app_commands.Range[int, 1, 60] = 14,
+):
+    """Suggest the earliest starts that suit the most members and clash with no event"""
+    try:
+        logger.info(
+            "suggest-slot command received from discord! %s, %s hours within %s days",
+            Interaction.user,
+            duration_hours,
+            days,
+        )
+        availability = await repository.availability(guild_of(Interaction))
+        origin = horizon_start()
+        busy = conflict_index.conflicts(
+            guild_of(Interaction), origin, origin + timedelta(days=days)
+        )
+        slots, members = suggest_slots(
+            availability, busy, origin, days, timedelta(hours=duration_hours)
+        )
+        if not slots:
+            await Interaction.response.send_message(
+                "No free slot found, members set when they are free with /availability.",
+                ephemeral=True,
+            )
+            return
+        embed = discord.Embed(title="Suggested times", color=discord.Color.blue())
+        for slot in slots:
+            embed.add_field(
+                name=f"{slot.start:%A %d-%m-%Y %H:%M} to {slot.end:%H:%M}"
+                f" ({len(slot.free)}/{members} free)",
+                value=", ".join(f"<@{user_id}>" for user_id in slot.free)[:1024],
+                inline=False,
+            )
+        embed.set_footer(text="Create one with /make-event.")
+        await Interaction.response.send_message(embed=embed)
+    except psycopg2.Error as err:
+        logger.error("======== An error has occured: ========\n %s", str(err))
+        await reply(Interaction, f"An error has occured: {str(err)}")
 
-        logger.info("======= Closing connection... ========")
-        cur.close()
-        conn.close()
+
+@app_commands.guild_only()
+@bot.tree.command(name="attendees", description="List who signed up for an event")
+@app_commands.describe(game_id="ID of event")
+@instrument_command
+async def attendees(Interaction: discord.Interaction, game_id: int):
+    """A function to list the signups of an event by game_id"""
+    try:
+        logger.info(
+            "attendees command received from discord! %s, ID: %s",
+            Interaction.user,
+            game_id,
+        )
+        stored = await repository.attendees(guild_of(Interaction), game_id)
+        signups = rsvp.overlay(game_id, stored)
+        embed = discord.Embed(
+            title=f"Attendees of event {game_id}", color=discord.Color.blue()
+        )
+        for status, emoji in (("going", ATTENDING), ("declined", NOT_ATTENDING)):
+            mentions = [f"<@{user_id}>" for user_id, s in signups if s == status]
+            embed.add_field(
+                name=f"{emoji} {status.capitalize()} ({len(mentions)})",
+                value=", ".join(mentions)[:1024] or "Nobody yet",
+                inline=False,
+            )
+        await Interaction.response.send_message(embed=embed)
     except psycopg2.Error as err:
         logger.error("======== An error has occured: ========\n %s", str(err))
-        await Interaction.channel.send(f"An error has occured: {str(err)}")
+        await reply(Interaction, f"An error has occured: {str(err)}")
+
+
+@app_commands.guild_only()
+@bot.tree.command(
+    name="import-events",
+    description="Create many events at once from a CSV or iCalendar file",
+)
+@app_commands.describe(
+    file="A .csv of game_type,game_date,game_time rows (DD-MM-YYYY, HH:MM), or an .ics calendar"
+)
+@instrument_command
+async def import_events(Interaction: discord.Interaction, file: discord.Attachment):
+    """Bulk insert the events of an uploaded file, all of them or none if any row is invalid"""
+    logger.info(
+        "import-events command received from discord! %s, file: %s (%s bytes)",
+        Interaction.user,
+        file.filename,
+        file.size,
+    )
+    if file.size > MAX_IMPORT_BYTES:
+        await Interaction.response.send_message(
+            f"{file.filename} is too large, imports are limited to {MAX_IMPORT_BYTES // 1024} KiB."
+        )
+        return
+    await Interaction.response.defer(thinking=True)
+    try:
+        parsed = parse_import(file.filename, (await file.read()).decode("utf-8-sig"))
+    except (ValueError, discord.DiscordException) as err:
+        logger.warning("Could not read import %s: %s", file.filename, err)
+        await Interaction.followup.send(f"Could not read {file.filename}: {err}")
+        return
+    if parsed.errors:
+        logger.warning("Rejected %s import row(s).", len(parsed.errors))
+        lines = [
+            f"Line {error.line}: {error.reason}"
+            for error in parsed.errors[:MAX_IMPORT_ERRORS]
+        ]
+        if len(parsed.errors) > MAX_IMPORT_ERRORS:
+            lines.append(f"... and {len(parsed.errors) - MAX_IMPORT_ERRORS} more")
+        await Interaction.followup.send(
+            f"Nothing was imported, {len(parsed.errors)} row(s) are invalid:\n"
+            + "\n".join(lines)
+        )
+        return
+    if not parsed.rows:
+        await Interaction.followup.send(f"No events found in {file.filename}.")
+        return
+    try:
+        inserted = await repository.import_events(
+            guild_of(Interaction), parsed.rows, channel_id=Interaction.channel_id
+        )
+    except psycopg2.Error as err:
+        logger.error("======== An error has occured: ========\n %s", str(err))
+        await Interaction.followup.send(f"An error has occured: {str(err)}")
+        return
+    logger.warning("========= Imported %s event(s)! =========", len(inserted))
+    embed = discord.Embed(title="Events imported", color=discord.Color.green())
+    embed.set_author(
+        name=Interaction.user, icon_url=Interaction.user.display_avatar.url
+    )
+    embed.add_field(name="Events", value=len(inserted), inline=False)
+    embed.add_field(name="From", value=min(row[2] for row in inserted), inline=False)
+    embed.add_field(name="To", value=max(row[2] for row in inserted), inline=False)
+    await Interaction.followup.send(embed=embed)
+
+
+@app_commands.guild_only()
+@bot.tree.command(
+    name="export-events", description="Download the events as a CSV or iCalendar file"
+)
+@app_commands.describe(
+    file_format="CSV re-imports with import-events, iCalendar opens in calendar apps",
+    game_type="Only export events of this type",
+)
+@app_commands.choices(
+    file_format=[
+        app_commands.Choice(name="CSV", value="csv"),
+        app_commands.Choice(name="iCalendar", value="ics"),
+    ]
+)
+@instrument_command
+async def export_events(
+    Interaction: discord.Interaction,
+    file_format: app_commands.Choice[str],
+    game_type: Optional[str] = None,
+):
+    """Stream every event of the guild into an attachment"""
+    logger.info(
+        "export-events command received from discord! %s, format: %s, type: %s",
+        Interaction.user,
+        file_format.value,
+        game_type,
+    )
+    await Interaction.response.defer(ephemeral=True, thinking=True)
+    filters = {"game_type": game_type.lower() if game_type is not None else None}
+    await send_export(
+        Interaction, repository, guild_of(Interaction), filters, file_format.value
+    )
+
+
+@app_commands.guild_only()
+@bot.tree.command(
+    name="calendar-feed",
+    description="Get a link to subscribe to this server's events in a calendar app",
+)
+@instrument_command
+async def calendar_feed(Interaction: discord.Interaction):
+    """Reply with the guild's calendar subscription url, only visible to the caller"""
+    logger.info("calendar-feed command received from discord! %s", Interaction.user)
+    if feed_runner is None:
+        await Interaction.response.send_message(
+            "Calendar feeds are turned off for this bot.", ephemeral=True
+        )
+        return
+    url = FEED_BASE_URL.rstrip("/") + feeds.path(guild_of(Interaction))
+    await Interaction.response.send_message(
+        f"Subscribe to this url in your calendar app, keep it to this server:\n{url}",
+        ephemeral=True,
+    )
+
+
+@app_commands.guild_only()
+@app_commands.default_permissions(administrator=True)
+@bot.tree.command(
+    name="resync-commands",
+    description="Admin only, upload the slash commands to discord again",
+)
+@instrument_command
+async def resync_commands(Interaction: discord.Interaction):
+    """Force a command tree sync, for when discord's copy went out of date"""
+    logger.warning("resync-commands command received from %s", Interaction.user)
+    await Interaction.response.defer(ephemeral=True, thinking=True)
+    try:
+        await sync_command_tree(
+            bot.tree, repository, Interaction.application_id, force=True
+        )
+        await Interaction.followup.send(
+            f"Synced {len(bot.tree.get_commands())} command(s).", ephemeral=True
+        )
+    except (psycopg2.Error, discord.DiscordException) as err:
+        logger.error("======== An error has occured: ========\n %s", str(err))
+        await Interaction.followup.send(f"An error has occured: {str(err)}")
+
+
+@app_commands.guild_only()
+@app_commands.default_permissions(administrator=True)
+@bot.tree.command(
+    name="claim-legacy-events",
+    description="Admin only, move the events from before servers were told apart here",
+)
+@instrument_command
+async def claim_legacy_events(Interaction: discord.Interaction):
+    """Move the events and votes stored before guild scoping into the calling guild"""
+    logger.warning("claim-legacy-events command received from %s", Interaction.user)
+    await Interaction.response.defer(ephemeral=True, thinking=True)
+    try:
+        moved = await repository.claim_legacy_events(guild_of(Interaction))
+        await Interaction.followup.send(
+            f"Moved {moved} event(s) to this server.", ephemeral=True
+        )
+    except psycopg2.Error as err:
+        logger.error("======== An error has occured: ========\n %s", str(err))
+        await Interaction.followup.send(
+            f"An error has occured: {str(err)}", ephemeral=True
+        )
+
+
+async def game_type_autocomplete(
+    Interaction: discord.Interaction, current: str
+) -> List[app_commands.Choice[str]]:
+    """Suggest the game types of the guild's events"""
+    return [
+        app_commands.Choice(name=game_type[:100], value=game_type[:100])
+        for game_type in event_index.game_types(guild_of(Interaction), current)
+    ]
+
+
+async def game_date_autocomplete(
+    Interaction: discord.Interaction, current: str
+) -> List[app_commands.Choice[str]]:
+    """Suggest the dates of the guild's events"""
+    return [
+        app_commands.Choice(name=game_date, value=game_date)
+        for game_date in event_index.dates(guild_of(Interaction), current)
+    ]
+
+
+def _event_choice_name(row) -> str:
+    game_id, game_type, game_date, game_time = row
+    return f"{game_id} - {game_type} - {game_date:%d-%m-%Y} {game_time:%H:%M}"[:100]
+
+
+async def game_id_autocomplete(
+    Interaction: discord.Interaction, current: str
+) -> List[app_commands.Choice[int]]:
+    """Suggest the guild's events by id, described by type, date and time"""
+    return [
+        app_commands.Choice(name=_event_choice_name(row), value=row[0])
+        for row in event_index.events(guild_of(Interaction), current)
+    ]
+
+
+async def game_id_text_autocomplete(
+    Interaction: discord.Interaction, current: str
+) -> List[app_commands.Choice[str]]:
+    """Suggest the guild's events by id, for commands that take the id as text"""
+    return [
+        app_commands.Choice(name=_event_choice_name(row), value=str(row[0]))
+        for row in event_index.events(guild_of(Interaction), current)
+    ]
+
+
+list_events.autocomplete("game_id")(game_id_text_autocomplete)
+list_events.autocomplete("game_type")(game_type_autocomplete)
+list_events.autocomplete("game_date")(game_date_autocomplete)
+edit_event.autocomplete("game_id")(game_id_autocomplete)
+edit_event.autocomplete("game_type")(game_type_autocomplete)
+delete_event.autocomplete("game_id")(game_id_autocomplete)
+attendees.autocomplete("game_id")(game_id_autocomplete)
+export_events.autocomplete("game_type")(game_type_autocomplete)
 
 
 def start(token: str) -> None:
     """Function to wake the bot"""
+    configure_logging()
+    if MEMORY_REPORT_INTERVAL:
+        # one frame per block is enough to attribute it to a file
+        tracemalloc.start()
     logger.info("Starting paps-bot ...")
-    bot.run(token)
+    # logging is already routed through the queue, so discord.py must not add its own handler
+    bot.run(token, log_handler=None)
@@ -0,0 +1,155 @@
+"""
+The fixed set of statements behind the hot command paths, prepared once per pooled connection
+"""
+
+import re
+import logging
+from typing import Dict, NamedTuple, Optional, Sequence, Set
+import psycopg2.extensions
+
+# get the bot logger
+logger = logging.getLogger("discord")
+
+EVENT_COLUMNS = "game_id, game_type, game_date, game_time"
+
+
+class Statement(NamedTuple):
+    """A parameterized statement, with $n placeholders, run by name once prepared"""
+
+    name: str
+    sql: str
+    params: int
+
+    @property
+    def execute_sql(self) -> str:
+        """EXECUTE with a psycopg2 placeholder per parameter"""
+        if not self.params:
+            return f"EXECUTE {self.name}"
+        return f"EXECUTE {self.name} ({', '.join(['%s'] * self.params)})"
+
+
+# every statement any connection may prepare, by name
+STATEMENTS: Dict[str, Statement] = {}
+
+
+def _register(name: str, sql: str) -> Statement:
+    params = max((int(n) for n in re.findall(r"\$(\d+)", sql)), default=0)
+    statement = Statement(f"paps_{name}", " ".join(sql.split()), params)
+    STATEMENTS[statement.name] = statement
+    return statement
+
+
+class PreparedConnection(psycopg2.extensions.connection):
+    """A connection remembering which registry statements it has prepared"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prepared: Set[str] = set()
+
+
+def execute(cur, statement: Statement, params: Sequence = ()) -> None:
+    """
+    Run a registry statement, preparing it first if this connection has not.
+    Prepared statements outlive transactions, rolled back ones included, so
+    postgres parses and plans each statement once per connection.
+    """
+    prepared: Optional[Set[str]] = getattr(cur.connection, "prepared", None)
+    if prepared is None:
+        raise TypeError("registry statements need a PreparedConnection")
+    if statement.name not in prepared:
+        logger.debug("Preparing %s on a new connection.", statement.name)
+        cur.execute(f"PREPARE {statement.name} AS {statement.sql}")
+        prepared.add(statement.name)
+    cur.execute(statement.execute_sql, tuple(params))
+
+
+INSERT_EVENT = _register(
+    "insert_event",
+    f"""INSERT INTO paps_table (guild_id, channel_id, game_type, game_date, game_time,
+    duration_minutes) VALUES ($1, $2, $3, $4, $5, $6) RETURNING {EVENT_COLUMNS}""",
+)
+# absent fields are passed as NULL and keep their value
+UPDATE_EVENT = _register(
+    "update_event",
+    f"""UPDATE paps_table SET game_type = COALESCE($3, game_type),
+    game_date = COALESCE($4, game_date), game_time = COALESCE($5, game_time),
+    duration_minutes = COALESCE($6, duration_minutes)
+    WHERE game_id = $1 AND guild_id = $2 RETURNING {EVENT_COLUMNS}, channel_id""",
+)
+DELETE_EVENT = _register(
+    "delete_event", "DELETE FROM paps_table WHERE game_id = $1 AND guild_id = $2"
+)
+SET_EVENT_MESSAGE = _register(
+    "set_event_message", "UPDATE paps_table SET message_id = $2 WHERE game_id = $1"
+)
+INSERT_VOTE = _register(
+    "insert_vote",
+    """INSERT INTO paps_votes (message_id, guild_id, channel_id, game_type, game_date,
+    game_time, count_limit_success, count_limit_fail, deadline, thumbs_up, thumbs_down,
+    duration_minutes) VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, $10, $11, $12)""",
+)
+UPDATE_VOTE_TALLY = _register(
+    "update_vote_tally",
+    """UPDATE paps_votes SET thumbs_up = $2, thumbs_down = $3
+    WHERE message_id = $1 AND status = 'open'""",
+)
+CLOSE_VOTE = _register(
+    "close_vote",
+    """UPDATE paps_votes SET status = $2 WHERE message_id = $1 AND status = 'open'
+    RETURNING guild_id, channel_id, game_type, game_date, game_time, duration_minutes""",
+)
+SELECT_ATTENDEES = _register(
+    "select_attendees",
+    """SELECT a.user_id, a.status FROM paps_attendees a JOIN paps_table p USING (game_id)
+    WHERE a.game_id = $1 AND p.guild_id = $2 ORDER BY a.updated_at""",
+)
+SERIES_COLUMNS = """series_id, guild_id, channel_id, game_type, start_date, game_time,
+interval_weeks, until, count, duration_minutes"""
+SELECT_GUILD_SERIES = _register(
+    "select_guild_series",
+    f"SELECT {SERIES_COLUMNS} FROM paps_series WHERE guild_id = $1",
+)
+SELECT_SERIES_OVERRIDES = _register(
+    "select_series_overrides",
+    """SELECT series_id, occurrence_date, game_type, game_date, game_time, cancelled
+    FROM paps_series_overrides WHERE series_id = ANY($1)""",
+)
+
+
+def _register_event_pages() -> Dict[tuple, Statement]:
+    """A statement per table, filter column and paging direction of list-events"""
+    pages = {}
+    for table, prefix in (("paps_table", "events"), ("paps_archive", "archive")):
+        for column in (None, "game_id", "game_type", "game_date", "game_time"):
+            for mode in ("first", "after", "before"):
+                conditions = ["guild_id = $1"]
+                if column is not None:
+                    conditions.append(f"{column} = ${len(conditions) + 1}")
+                if mode != "first":
+                    n = len(conditions) + 1
+                    op = "<" if mode == "before" else ">"
+                    conditions.append(
+                        f"(game_date, game_time, game_id) {op} (${n}, ${n + 1}, ${n + 2})"
+                    )
+                order = "DESC" if mode == "before" else "ASC"
+                limit = max(
+                    int(n) for n in re.findall(r"\$(\d+)", " ".join(conditions))
+                )
+                pages[(table, column, mode)] = _register(
+                    f"{prefix}_page_{column or 'all'}_{mode}",
+                    f"""SELECT {EVENT_COLUMNS} FROM {table} WHERE {' AND '.join(conditions)}
+                    ORDER BY game_date {order}, game_time {order}, game_id {order}
+                    LIMIT ${limit + 1}""",
+                )
+    return pages
+
+
+EVENT_PAGES = _register_event_pages()
+
+
+def events_page(
+    column: Optional[str], cursor_given: bool, backwards: bool, archived: bool = False
+) -> Statement:
+    """The list-events statement for a filter column and paging direction"""
+    mode = "first" if not cursor_given else "before" if backwards else "after"
+    return EVENT_PAGES[("paps_archive" if archived else "paps_table", column, mode)]
@@ -0,0 +1,195 @@
+"""
+Recurring events, stored as one weekly or biweekly rule per series and expanded on demand
+"""
+
+import heapq
+from datetime import date, datetime, time, timedelta
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+from paps_bot.cache import filter_key
+
+# the shapes of paps_bot.repository, which reads series through this module
+EventRow = Tuple[int, str, date, time]
+PageCursor = Tuple[date, time, int]
+
+# open ended series are expanded at most this far ahead of today
+HORIZON = timedelta(days=366)
+
+
+class Series(NamedTuple):
+    """A recurrence rule, like RRULE:FREQ=WEEKLY;INTERVAL=n with UNTIL or COUNT"""
+
+    series_id: int
+    guild_id: int
+    channel_id: Optional[int]
+    game_type: str
+    start_date: date
+    game_time: time
+    interval_weeks: int
+    until: Optional[date]
+    sessions: Optional[int]  # the count column, tuple.count is a method
+    duration_minutes: int = 180  # DEFAULT_DURATION_MINUTES of paps_bot.repository
+
+
+class Override(NamedTuple):
+    """A change to one occurrence, identified by the date the rule gives it"""
+
+    occurrence_date: date
+    game_type: Optional[str]
+    game_date: Optional[date]
+    game_time: Optional[time]
+    cancelled: bool
+
+
+def page_cursor(row: EventRow) -> PageCursor:
+    """The keyset position of an event row, as in paps_bot.repository"""
+    return (row[2], row[3], row[0])
+
+
+def occurrence_id(series_id: int) -> int:
+    """
+    The game_id occurrences of a series are listed with. Negative, so they
+    sort and page alongside paps_table rows without ever colliding with them.
+    """
+    return -series_id
+
+
+class Recurrence:
+    """A series with its overrides, expanding occurrences lazily and in order"""
+
+    def __init__(self, series: Series, overrides: Iterable[Override] = ()):
+        self.series = series
+        self.overrides: Dict[date, Override] = {o.occurrence_date: o for o in overrides}
+        self.step = timedelta(weeks=series.interval_weeks)
+        last = None
+        if series.sessions is not None:
+            last = series.start_date + self.step * (series.sessions - 1)
+        if series.until is not None and (last is None or series.until < last):
+            last = series.until
+        self.last_date = last
+
+    @property
+    def game_id(self) -> int:
+        """The id the occurrences are listed with"""
+        return occurrence_id(self.series.series_id)
+
+    def is_occurrence(self, day: date) -> bool:
+        """Whether the rule puts an occurrence on the day"""
+        offset = (day - self.series.start_date).days
+        return (
+            offset >= 0
+            and offset % self.step.days == 0
+            and (self.last_date is None or day <= self.last_date)
+        )
+
+    def may_have_type(self, game_type: str) -> bool:
+        """Whether any occurrence can be of the game type"""
+        return self.series.game_type == game_type or any(
+            o.game_type == game_type for o in self.overrides.values()
+        )
+
+    def _row(self, day: date) -> EventRow:
+        series = self.series
+        override = self.overrides.get(day)
+        if override is None:
+            return (self.game_id, series.game_type, day, series.game_time)
+        return (
+            self.game_id,
+            override.game_type or series.game_type,
+            override.game_date or day,
+            override.game_time or series.game_time,
+        )
+
+    def _dates(self, start: date, end: date, reverse: bool) -> Iterator[date]:
+        """The rule's dates within [start, end], before overrides"""
+        first = self.series.start_date
+        if self.last_date is not None and self.last_date < end:
+            end = self.last_date
+        if start < first:
+            start = first
+        if start > end:
+            return
+        step = self.step.days
+        low = -(-(start - first).days // step)
+        high = (end - first).days // step
+        indexes = range(high, low - 1, -1) if reverse else range(low, high + 1)
+        for index in indexes:
+            yield first + timedelta(days=index * step)
+
+    def occurrences(
+        self, start: date, end: date, reverse: bool = False
+    ) -> Iterator[EventRow]:
+        """
+        Occurrences taking place within [start, end] in (date, time) order,
+        after overrides. Only as many dates as are consumed are computed.
+        """
+        # overridden occurrences may have moved into or out of the window
+        moved = sorted(
+            (
+                self._row(o.occurrence_date)
+                for o in self.overrides.values()
+                if not o.cancelled
+                and self.is_occurrence(o.occurrence_date)
+                and start <= (o.game_date or o.occurrence_date) <= end
+            ),
+            key=page_cursor,
+            reverse=reverse,
+        )
+        regular = (
+            self._row(day)
+            for day in self._dates(start, end, reverse)
+            if day not in self.overrides
+        )
+        return heapq.merge(regular, moved, key=page_cursor, reverse=reverse)
+
+    def next_after(self, moment: datetime) -> Optional[EventRow]:
+        """The first occurrence starting after a moment, in the bot's local timezone"""
+        start = moment.date()
+        for row in self.occurrences(start, start + HORIZON):
+            if datetime.combine(row[2], row[3]).astimezone() > moment:
+                return row
+        return None
+
+
+def page_occurrences(
+    recurrences: List[Recurrence],
+    column: Optional[str],
+    value,
+    cursor: Optional[PageCursor],
+    backwards: bool,
+) -> Iterator[EventRow]:
+    """
+    The occurrences of a list-events page in page order, matching the filter
+    and strictly after (or before) the cursor, expanded only as far as read.
+    """
+    value = filter_key(0, column, value)[2]
+    if column == "game_id":
+        recurrences = [r for r in recurrences if r.game_id == value]
+        column = None
+    elif column == "game_type":
+        recurrences = [r for r in recurrences if r.may_have_type(value)]
+    start, end = date.min, date.today() + HORIZON
+    if column == "game_date":
+        if not isinstance(value, date):
+            return
+        start = end = value
+    if cursor is not None:
+        if backwards:
+            end = min(end, cursor[0])
+        else:
+            start = max(start, cursor[0])
+    index = ("game_id", "game_type", "game_date", "game_time").index(
+        column or "game_id"
+    )
+    rows = heapq.merge(
+        *(r.occurrences(start, end, reverse=backwards) for r in recurrences),
+        key=page_cursor,
+        reverse=backwards,
+    )
+    for row in rows:
+        if column is not None and row[index] != value:
+            continue
+        if cursor is not None and (
+            page_cursor(row) >= cursor if backwards else page_cursor(row) <= cursor
+        ):
+            continue
+        yield row
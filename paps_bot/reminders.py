@@ -0,0 +1,208 @@
+"""
+Reminders for upcoming events, driven by a single min-heap scheduler task
+"""
+
+import heapq
+import asyncio
+import logging
+from datetime import date, datetime, timedelta
+from typing import Dict, List, NamedTuple, Optional, Sequence, Set, Tuple
+import discord
+import psycopg2
+from paps_bot.formatting import event_label
+from paps_bot.recurrence import Recurrence, occurrence_id
+from paps_bot.repository import EventChange, EventRepository, EventRow
+
+# get the bot logger
+logger = logging.getLogger("discord")
+
+# rebuild the heap once stale entries (from edits and deletes) outnumber live ones by this much
+COMPACT_SLACK = 64
+
+
+class Reminder(NamedTuple):
+    """A pending reminder for one event"""
+
+    due: datetime
+    guild_id: int
+    channel_id: int
+    row: EventRow
+
+
+def event_start(row: EventRow) -> datetime:
+    """Start of an event, its date and time are in the bot's local timezone"""
+    return datetime.combine(row[2], row[3]).astimezone()
+
+
+class ReminderScheduler:
+    """
+    Holds every pending reminder in a min-heap ordered by due time, and sleeps
+    until the earliest one. Writes update the heap incrementally, so the
+    database is only read once at startup and an idle bot does no work.
+    A recurring series only ever has its next occurrence in the heap, the
+    one after it is expanded when that reminder is sent.
+    """
+
+    def __init__(
+        self, client: discord.Client, repository: EventRepository, lead: timedelta
+    ):
+        self.client = client
+        self.repository = repository
+        self.lead = lead
+        self._heap: List[Tuple[datetime, int]] = []
+        self._pending: Dict[int, Reminder] = {}
+        # series_id -> series with overrides, for the series announced in a channel
+        self._series: Dict[int, Recurrence] = {}
+        self._reloads: Set[asyncio.Task] = set()
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        repository.add_listener(self._on_change)
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    async def start(
+        self,
+        upcoming: Optional[Sequence[Tuple[int, int, EventRow]]] = None,
+        series: Optional[Sequence[Recurrence]] = None,
+    ) -> None:
+        """
+        Load the upcoming events and series, or those of a state snapshot, and
+        start the scheduler task
+        """
+        if upcoming is None or series is None:
+            upcoming = await self.repository.upcoming_events(date.today())
+            series = await self.repository.all_series()
+        now = datetime.now().astimezone()
+        for guild_id, channel_id, row in upcoming:
+            # reminders that came due while the bot was offline are not sent late
+            if event_start(row) - self.lead > now:
+                self.schedule(guild_id, channel_id, row)
+        for recurrence in series:
+            self._track_series(recurrence, now + self.lead)
+        logger.info("Scheduled %s event reminder(s).", len(self._pending))
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Stop the scheduler task"""
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def clear(self) -> None:
+        """Forget every scheduled reminder, before loading them again"""
+        self._pending.clear()
+        self._heap.clear()
+        self._series.clear()
+
+    def snapshot(self) -> List[Tuple[int, int, EventRow]]:
+        """(guild_id, channel_id, row) of every event still to remind about, series aside"""
+        return [
+            (r.guild_id, r.channel_id, r.row)
+            for game_id, r in self._pending.items()
+            if game_id >= 0
+        ]
+
+    def schedule(self, guild_id: int, channel_id: int, row: EventRow) -> None:
+        """Add or move the reminder for an event"""
+        start = event_start(row)
+        if start <= datetime.now().astimezone():
+            self.cancel(row[0])
+            return
+        # events created inside the lead time are reminded about straight away
+        reminder = Reminder(start - self.lead, guild_id, channel_id, row)
+        self._pending[row[0]] = reminder
+        heapq.heappush(self._heap, (reminder.due, row[0]))
+        if reminder.due <= self._heap[0][0]:
+            self._wakeup.set()
+        self._compact()
+
+    def _track_series(self, recurrence: Recurrence, after: datetime) -> None:
+        """Schedule the first occurrence of a series starting after a moment"""
+        series = recurrence.series
+        if series.channel_id is None:
+            return
+        self._series[series.series_id] = recurrence
+        row = recurrence.next_after(after)
+        if row is None:
+            self.cancel(recurrence.game_id)
+        else:
+            self.schedule(series.guild_id, series.channel_id, row)
+
+    async def _reload_series(self, series_id: int) -> None:
+        try:
+            recurrence = await self.repository.get_series(series_id)
+        except psycopg2.Error as err:
+            logger.error("Could not reload series %s for reminders: %s", series_id, err)
+            return
+        if recurrence is None:
+            self._series.pop(series_id, None)
+            self.cancel(occurrence_id(series_id))
+        else:
+            self._track_series(recurrence, datetime.now().astimezone())
+
+    def cancel(self, game_id: int) -> None:
+        """Forget the reminder for an event, its heap entry is dropped lazily"""
+        if self._pending.pop(game_id, None) is not None:
+            self._compact()
+
+    def _compact(self) -> None:
+        if len(self._heap) > 2 * len(self._pending) + COMPACT_SLACK:
+            self._heap = [(r.due, game_id) for game_id, r in self._pending.items()]
+            heapq.heapify(self._heap)
+
+    def _on_change(self, change: EventChange) -> None:
+        if change.action == "series":
+            # the change may move the next occurrence, read the series again
+            task = asyncio.create_task(self._reload_series(-change.game_id))
+            self._reloads.add(task)
+            task.add_done_callback(self._reloads.discard)
+            return
+        if change.action == "delete":
+            self.cancel(change.game_id)
+            return
+        channel_id = change.channel_id
+        if channel_id is None and change.game_id in self._pending:
+            channel_id = self._pending[change.game_id].channel_id
+        if channel_id is not None and change.row is not None:
+            self.schedule(change.guild_id, channel_id, change.row)
+
+    async def _remind(self, reminder: Reminder) -> None:
+        game_id, game_type, game_date, game_time = reminder.row
+        embed = discord.Embed(
+            title="Upcoming event reminder!", color=discord.Color.orange()
+        )
+        embed.add_field(name="Event ID", value=event_label(game_id), inline=False)
+        embed.add_field(name="Event Type", value=game_type, inline=False)
+        embed.add_field(name="Event Date", value=game_date, inline=False)
+        embed.add_field(name="Event Time", value=game_time, inline=False)
+        logger.info("Sending reminder for event %s ...", game_id)
+        try:
+            channel = self.client.get_partial_messageable(reminder.channel_id)
+            await channel.send(embed=embed)
+        except discord.DiscordException as err:
+            logger.error("Could not send reminder for event %s: %s", game_id, err)
+
+    async def _run(self) -> None:
+        """Sleep until the earliest reminder is due, send every due one, repeat"""
+        while True:
+            self._wakeup.clear()
+            now = datetime.now().astimezone()
+            while self._heap and self._heap[0][0] <= now:
+                due, game_id = heapq.heappop(self._heap)
+                reminder = self._pending.get(game_id)
+                # skip entries left behind by edits, deletes and already sent reminders
+                if reminder is not None and reminder.due == due:
+                    del self._pending[game_id]
+                    await self._remind(reminder)
+                    recurrence = self._series.get(-game_id)
+                    if recurrence is not None:
+                        self._track_series(recurrence, event_start(reminder.row))
+            timeout = None
+            if self._heap:
+                timeout = (self._heap[0][0] - now).total_seconds()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
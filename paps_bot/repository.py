@@ -0,0 +1,987 @@
+"""
+Async repository for paps-bot events, every query runs on the connection pool
+"""
+
+import io
+import csv
+import heapq
+import logging
+import itertools
+from datetime import date, datetime, time
+from psycopg2.extras import execute_values
+from typing import (
+    AsyncIterator,
+    Callable,
+    List,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Tuple,
+)
+from paps_bot import queries
+from paps_bot.database import StoragePool
+from paps_bot.cache import EventCache, filter_key, keys_for_row
+from paps_bot.migrations import apply_migrations
+from paps_bot.singleflight import SingleFlight
+from paps_bot.recurrence import (
+    Override,
+    Recurrence,
+    Series,
+    occurrence_id,
+    page_occurrences,
+)
+from paps_bot.sharding import ShardOwnership
+
+# get the bot logger
+logger = logging.getLogger("discord")
+
+EventRow = Tuple[int, str, date, time]
+# events are ordered by (game_date, game_time, game_id), pages are cut at such a key
+PageCursor = Tuple[date, time, int]
+# message_id, guild_id, channel_id, game_type, game_date, game_time,
+# count_limit_success, count_limit_fail, deadline, thumbs_up, thumbs_down, duration_minutes
+VoteRow = Tuple[int, int, int, str, date, time, int, int, datetime, int, int, int]
+# length of events created without one, and of every event from before durations
+DEFAULT_DURATION_MINUTES = 180
+# where migration 3 parked the events and votes from before guild scoping
+LEGACY_GUILD_ID = 0
+
+
+class EventPage(NamedTuple):
+    """One keyset page of events"""
+
+    rows: Sequence[EventRow]
+    has_more: (
+        bool  # whether more rows exist past this page, in the direction it was read
+    )
+
+    @property
+    def first(self) -> Optional[PageCursor]:
+        """Cursor of the first row, to page backwards from"""
+        return page_cursor(self.rows[0]) if self.rows else None
+
+    @property
+    def last(self) -> Optional[PageCursor]:
+        """Cursor of the last row, to page forwards from"""
+        return page_cursor(self.rows[-1]) if self.rows else None
+
+
+def page_cursor(row: EventRow) -> PageCursor:
+    """The keyset position of an event row"""
+    return (row[2], row[3], row[0])
+
+
+class EventChange(NamedTuple):
+    """A committed write to paps_table, or to a recurring series"""
+
+    action: str  # "insert", "update", "delete", or "series" for any change to a series
+    guild_id: int
+    game_id: int  # occurrence_id(series_id) for series
+    row: Optional[EventRow]  # the row after the write, None once deleted and for series
+    channel_id: Optional[int] = None  # where the event was announced, if known
+    duration_minutes: Optional[int] = None  # None if the write left it unchanged
+
+
+def _insert_event(
+    conn,
+    guild_id: int,
+    channel_id: Optional[int],
+    game_type: str,
+    game_date: date,
+    game_time: time,
+    duration_minutes: int = DEFAULT_DURATION_MINUTES,
+) -> int:
+    with conn, conn.cursor() as cur:
+        queries.execute(
+            cur,
+            queries.INSERT_EVENT,
+            (guild_id, channel_id, game_type, game_date, game_time, duration_minutes),
+        )
+        return cur.fetchone()[0]
+
+
+def _copy_events(
+    conn,
+    guild_id: int,
+    channel_id: Optional[int],
+    rows: Sequence[Tuple[str, date, time]],
+) -> List[EventRow]:
+    """COPY the rows into a staging table, then insert them all in the same transaction"""
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)
+    buffer.seek(0)
+    with conn, conn.cursor() as cur:
+        cur.execute("""CREATE TEMPORARY TABLE paps_import (
+            game_type VARCHAR(255) NOT NULL,
+            game_date DATE NOT NULL,
+            game_time TIME NOT NULL
+            ) ON COMMIT DROP""")
+        cur.copy_expert("COPY paps_import FROM STDIN WITH (FORMAT csv)", buffer)
+        # the staging table lets one statement hand back the ids of the new rows
+        cur.execute(
+            """INSERT INTO paps_table (guild_id, channel_id, game_type, game_date, game_time)
+            SELECT %s, %s, game_type, game_date, game_time FROM paps_import
+            RETURNING game_id, game_type, game_date, game_time""",
+            (guild_id, channel_id),
+        )
+        return cur.fetchall()
+
+
+def _events_query(
+    guild_id: int, column: Optional[str], value, archived: bool = False
+) -> Tuple[str, tuple]:
+    table = "paps_archive" if archived else "paps_table"
+    query = f"SELECT game_id, game_type, game_date, game_time FROM {table} WHERE guild_id = %s"
+    params: tuple = (guild_id,)
+    if column is not None:
+        # column names come from the fixed set in EventRepository._pick_filter, never from users
+        query += f" AND {column} = %s"
+        params += (value,)
+    return query, params
+
+
+def _select_events_page(
+    conn,
+    guild_id: int,
+    column: Optional[str],
+    value,
+    cursor: Optional[PageCursor],
+    backwards: bool,
+    limit: int,
+    archived: bool = False,
+) -> EventPage:
+    params: tuple = (guild_id,)
+    if column is not None:
+        params += (value,)
+    if cursor is not None:
+        params += tuple(cursor)
+    # one extra row tells us whether there is another page after this one
+    params += (limit + 1,)
+    statement = queries.events_page(column, cursor is not None, backwards, archived)
+    recurrences = []
+    with conn, conn.cursor() as cur:
+        queries.execute(cur, statement, params)
+        rows = cur.fetchall()
+        # series are never archived, their past sessions are listed with the hot events
+        if not archived:
+            queries.execute(cur, queries.SELECT_GUILD_SERIES, (guild_id,))
+            recurrences = _with_overrides(cur, cur.fetchall())
+    return merge_page(rows, recurrences, column, value, cursor, backwards, limit)
+
+
+def merge_page(
+    rows: List[EventRow],
+    recurrences: List[Recurrence],
+    column: Optional[str],
+    value,
+    cursor: Optional[PageCursor],
+    backwards: bool,
+    limit: int,
+) -> EventPage:
+    """
+    A page from up to limit + 1 stored rows in page order and the guild's
+    series, whose occurrences are expanded only as far as the page reaches
+    """
+    if recurrences:
+        occurrences = page_occurrences(recurrences, column, value, cursor, backwards)
+        merged = heapq.merge(rows, occurrences, key=page_cursor, reverse=backwards)
+        rows = list(itertools.islice(merged, limit + 1))
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if backwards:
+        rows.reverse()
+    return EventPage(tuple(rows), has_more)
+
+
+def _open_event_stream(
+    conn, guild_id: int, column: Optional[str], value, batch: int, archived: bool
+):
+    query, params = _events_query(guild_id, column, value, archived)
+    # a named cursor keeps the result set on the server, rows arrive batch by batch
+    cur = conn.cursor(name="paps_event_stream")
+    cur.itersize = batch
+    cur.execute(query + " ORDER BY game_date, game_time, game_id", params)
+    return cur
+
+
+def _owned_guilds(shards: Optional[Tuple[int, List[int]]]) -> Tuple[str, tuple]:
+    """Condition on guild_id matching the shards of this process, with its params"""
+    if shards is None:
+        return "TRUE", ()
+    # discord's shard formula, see sharding.shard_for_guild
+    return "(guild_id >> 22) %% %s = ANY(%s)", shards
+
+
+def _open_all_events_stream(conn, shards, batch: int):
+    owned, params = _owned_guilds(shards)
+    cur = conn.cursor(name="paps_all_events_stream")
+    cur.itersize = batch
+    cur.execute(
+        "SELECT guild_id, game_id, game_type, game_date, game_time, duration_minutes"
+        f" FROM paps_table WHERE {owned}",
+        params,
+    )
+    return cur
+
+
+def _archive_events(conn, before: date, batch: int) -> List[Tuple[int, int]]:
+    """
+    Move up to batch events dated before a day into paps_archive, with their
+    signups, in one transaction. Returns (guild_id, game_id) of the moved events.
+    """
+    with conn, conn.cursor() as cur:
+        # rows locked by a concurrent edit are left for the next batch
+        cur.execute(
+            """SELECT game_id, game_date FROM paps_table WHERE game_date < %s
+            ORDER BY game_date LIMIT %s FOR UPDATE SKIP LOCKED""",
+            (before, batch),
+        )
+        picked = cur.fetchall()
+        if not picked:
+            return []
+        for year in sorted({game_date.year for _, game_date in picked}):
+            partition = f"paps_archive_{year:04}"
+            cur.execute("SELECT to_regclass(%s)", (partition,))
+            if cur.fetchone()[0] is None:
+                logger.info("Creating archive partition %s.", partition)
+                cur.execute(
+                    f"""CREATE TABLE {partition} PARTITION OF paps_archive
+                    FOR VALUES FROM (%s) TO (%s)""",
+                    (date(year, 1, 1), date(year + 1, 1, 1)),
+                )
+        # every part of the statement sees the signups as they were before the delete
+        cur.execute(
+            """WITH moved AS (
+                DELETE FROM paps_table WHERE game_id = ANY(%s)
+                RETURNING game_id, guild_id, channel_id, game_type, game_date, game_time,
+                duration_minutes, message_id
+            )
+            INSERT INTO paps_archive (game_id, guild_id, channel_id, game_type, game_date,
+            game_time, duration_minutes, message_id, attendees)
+            SELECT m.*, (
+                SELECT jsonb_object_agg(a.user_id, a.status)
+                FROM paps_attendees a WHERE a.game_id = m.game_id
+            ) FROM moved m
+            RETURNING guild_id, game_id""",
+            ([game_id for game_id, _ in picked],),
+        )
+        return cur.fetchall()
+
+
+def _delete_event(conn, guild_id: int, game_id: int) -> bool:
+    with conn, conn.cursor() as cur:
+        queries.execute(cur, queries.DELETE_EVENT, (game_id, guild_id))
+        return cur.rowcount > 0
+
+
+def _claim_legacy_events(
+    conn, guild_id: int
+) -> List[Tuple[EventRow, Optional[int], int]]:
+    """Move every legacy event, vote and archived event to a guild, returns the moved events"""
+    with conn, conn.cursor() as cur:
+        cur.execute(
+            "UPDATE paps_votes SET guild_id = %s WHERE guild_id = %s",
+            (guild_id, LEGACY_GUILD_ID),
+        )
+        cur.execute(
+            "UPDATE paps_archive SET guild_id = %s WHERE guild_id = %s",
+            (guild_id, LEGACY_GUILD_ID),
+        )
+        cur.execute(
+            """UPDATE paps_table SET guild_id = %s WHERE guild_id = %s
+            RETURNING game_id, game_type, game_date, game_time, channel_id, duration_minutes""",
+            (guild_id, LEGACY_GUILD_ID),
+        )
+        return [(row[:4], row[4], row[5]) for row in cur.fetchall()]
+
+
+def _update_event(
+    conn,
+    guild_id: int,
+    game_id: int,
+    game_type: Optional[str],
+    game_date,
+    game_time,
+    duration_minutes: Optional[int],
+) -> Optional[Tuple[EventRow, Optional[int]]]:
+    """Set every given field in one statement, None leaves a field as it is"""
+    with conn, conn.cursor() as cur:
+        queries.execute(
+            cur,
+            queries.UPDATE_EVENT,
+            (game_id, guild_id, game_type, game_date, game_time, duration_minutes),
+        )
+        row = cur.fetchone()
+        return None if row is None else (row[:4], row[4])
+
+
+def _insert_vote(conn, vote: VoteRow) -> None:
+    with conn, conn.cursor() as cur:
+        queries.execute(cur, queries.INSERT_VOTE, vote)
+
+
+def _update_vote_tally(conn, message_id: int, thumbs_up: int, thumbs_down: int) -> None:
+    with conn, conn.cursor() as cur:
+        queries.execute(
+            cur, queries.UPDATE_VOTE_TALLY, (message_id, thumbs_up, thumbs_down)
+        )
+
+
+def _close_vote(conn, message_id: int, status: str) -> bool:
+    with conn, conn.cursor() as cur:
+        queries.execute(cur, queries.CLOSE_VOTE, (message_id, status))
+        return cur.rowcount > 0
+
+
+def _pass_vote(conn, message_id: int) -> Optional[Tuple[int, int, EventRow, int]]:
+    """Close the vote and insert its event in one transaction"""
+    with conn, conn.cursor() as cur:
+        queries.execute(cur, queries.CLOSE_VOTE, (message_id, "passed"))
+        event = cur.fetchone()
+        if event is None:
+            return None
+        queries.execute(cur, queries.INSERT_EVENT, event)
+        return event[0], event[1], cur.fetchone(), event[5]
+
+
+def _select_upcoming_events(
+    conn, since: date, shards
+) -> List[Tuple[int, int, EventRow]]:
+    owned, params = _owned_guilds(shards)
+    with conn, conn.cursor() as cur:
+        cur.execute(
+            f"""SELECT guild_id, channel_id, game_id, game_type, game_date, game_time
+            FROM paps_table WHERE game_date >= %s AND channel_id IS NOT NULL AND {owned}""",
+            (since, *params),
+        )
+        return [(row[0], row[1], row[2:]) for row in cur.fetchall()]
+
+
+def _select_open_votes(conn, shards) -> List[VoteRow]:
+    owned, params = _owned_guilds(shards)
+    with conn, conn.cursor() as cur:
+        cur.execute(
+            f"""SELECT message_id, guild_id, channel_id, game_type, game_date, game_time,
+            count_limit_success, count_limit_fail, deadline, thumbs_up, thumbs_down,
+            duration_minutes FROM paps_votes WHERE status = 'open' AND {owned}""",
+            params,
+        )
+        return cur.fetchall()
+
+
+def _set_event_message(conn, game_id: int, message_id: int) -> None:
+    with conn, conn.cursor() as cur:
+        queries.execute(cur, queries.SET_EVENT_MESSAGE, (game_id, message_id))
+
+
+def _select_event_messages(conn, since: date, shards) -> List[Tuple[int, int]]:
+    owned, params = _owned_guilds(shards)
+    with conn, conn.cursor() as cur:
+        cur.execute(
+            f"""SELECT message_id, game_id FROM paps_table
+            WHERE game_date >= %s AND message_id IS NOT NULL AND {owned}""",
+            (since, *params),
+        )
+        return cur.fetchall()
+
+
+def _write_attendees(
+    conn, upserts: List[Tuple[int, int, str]], removals: List[Tuple[int, int, str]]
+) -> None:
+    """Apply a batch of signups in one transaction, a statement per kind of change"""
+    with conn, conn.cursor() as cur:
+        if upserts:
+            # the join skips signups for events deleted since the reaction arrived
+            execute_values(
+                cur,
+                """INSERT INTO paps_attendees (game_id, user_id, status)
+                SELECT v.game_id, v.user_id, v.status
+                FROM (VALUES %s) AS v (game_id, user_id, status)
+                JOIN paps_table USING (game_id)
+                ON CONFLICT (game_id, user_id)
+                DO UPDATE SET status = EXCLUDED.status, updated_at = now()""",
+                upserts,
+                page_size=len(upserts),
+            )
+        if removals:
+            execute_values(
+                cur,
+                """DELETE FROM paps_attendees a USING (VALUES %s) AS v (game_id, user_id, status)
+                WHERE a.game_id = v.game_id AND a.user_id = v.user_id AND a.status = v.status""",
+                removals,
+                page_size=len(removals),
+            )
+
+
+def _select_attendees(conn, guild_id: int, game_id: int) -> List[Tuple[int, str]]:
+    with conn, conn.cursor() as cur:
+        queries.execute(cur, queries.SELECT_ATTENDEES, (game_id, guild_id))
+        return cur.fetchall()
+
+
+def _fetch_series(cur, condition: str, params: tuple) -> List[Recurrence]:
+    """The series matching a condition on paps_series, with their overrides"""
+    cur.execute(
+        f"SELECT {queries.SERIES_COLUMNS} FROM paps_series WHERE {condition}", params
+    )
+    return _with_overrides(cur, cur.fetchall())
+
+
+def _with_overrides(cur, rows) -> List[Recurrence]:
+    """paps_series rows as series, with their overrides"""
+    series = [Series(*row) for row in rows]
+    if not series:
+        return []
+    queries.execute(
+        cur, queries.SELECT_SERIES_OVERRIDES, ([s.series_id for s in series],)
+    )
+    overrides: dict = {}
+    for row in cur.fetchall():
+        overrides.setdefault(row[0], []).append(Override(*row[1:]))
+    return [Recurrence(s, overrides.get(s.series_id, ())) for s in series]
+
+
+def _insert_series(conn, series: Series) -> int:
+    with conn, conn.cursor() as cur:
+        cur.execute(
+            """INSERT INTO paps_series (guild_id, channel_id, game_type, start_date, game_time,
+            interval_weeks, until, count, duration_minutes)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s) RETURNING series_id""",
+            series[1:],
+        )
+        return cur.fetchone()[0]
+
+
+def _select_series(conn, series_id: int) -> Optional[Recurrence]:
+    with conn, conn.cursor() as cur:
+        found = _fetch_series(cur, "series_id = %s", (series_id,))
+        return found[0] if found else None
+
+
+def _select_guild_series(conn, guild_id: int) -> List[Recurrence]:
+    with conn, conn.cursor() as cur:
+        return _fetch_series(cur, "guild_id = %s", (guild_id,))
+
+
+def _select_all_series(conn, shards) -> List[Recurrence]:
+    owned, params = _owned_guilds(shards)
+    with conn, conn.cursor() as cur:
+        return _fetch_series(cur, owned, params)
+
+
+def _upsert_override(
+    conn, guild_id: int, series_id: int, override: Override
+) -> Optional[Recurrence]:
+    """Store an override of a real occurrence of a guild's series, None if there is none"""
+    with conn, conn.cursor() as cur:
+        found = _fetch_series(
+            cur, "series_id = %s AND guild_id = %s", (series_id, guild_id)
+        )
+        if not found or not found[0].is_occurrence(override.occurrence_date):
+            return None
+        cur.execute(
+            """INSERT INTO paps_series_overrides
+            (series_id, occurrence_date, game_type, game_date, game_time, cancelled)
+            VALUES (%s, %s, %s, %s, %s, %s)
+            ON CONFLICT (series_id, occurrence_date) DO UPDATE SET
+            game_type = COALESCE(EXCLUDED.game_type, paps_series_overrides.game_type),
+            game_date = COALESCE(EXCLUDED.game_date, paps_series_overrides.game_date),
+            game_time = COALESCE(EXCLUDED.game_time, paps_series_overrides.game_time),
+            cancelled = EXCLUDED.cancelled""",
+            (series_id, *override),
+        )
+        return found[0]
+
+
+def _delete_series(conn, guild_id: int, series_id: int) -> bool:
+    with conn, conn.cursor() as cur:
+        cur.execute(
+            "DELETE FROM paps_series WHERE series_id = %s AND guild_id = %s",
+            (series_id, guild_id),
+        )
+        return cur.rowcount > 0
+
+
+def _replace_availability(
+    conn, guild_id: int, user_id: int, weekday: int, ranges: List[Tuple[int, int]]
+) -> None:
+    """Replace a member's availability on a weekday with (start, end) minute ranges"""
+    with conn, conn.cursor() as cur:
+        cur.execute(
+            "DELETE FROM paps_availability WHERE guild_id = %s AND user_id = %s AND weekday = %s",
+            (guild_id, user_id, weekday),
+        )
+        if ranges:
+            execute_values(
+                cur,
+                """INSERT INTO paps_availability
+                (guild_id, user_id, weekday, start_minute, end_minute) VALUES %s""",
+                [(guild_id, user_id, weekday, start, end) for start, end in ranges],
+            )
+
+
+def _delete_availability(conn, guild_id: int, user_id: int) -> int:
+    with conn, conn.cursor() as cur:
+        cur.execute(
+            "DELETE FROM paps_availability WHERE guild_id = %s AND user_id = %s",
+            (guild_id, user_id),
+        )
+        return cur.rowcount
+
+
+def _select_availability(conn, guild_id: int) -> List[Tuple[int, int, int, int]]:
+    with conn, conn.cursor() as cur:
+        cur.execute(
+            """SELECT user_id, weekday, start_minute, end_minute FROM paps_availability
+            WHERE guild_id = %s""",
+            (guild_id,),
+        )
+        return cur.fetchall()
+
+
+def _select_state(conn, key: str) -> Optional[str]:
+    with conn, conn.cursor() as cur:
+        cur.execute("SELECT value FROM paps_bot_state WHERE key = %s", (key,))
+        row = cur.fetchone()
+        return None if row is None else row[0]
+
+
+def _upsert_state(conn, key: str, value: str) -> None:
+    with conn, conn.cursor() as cur:
+        cur.execute(
+            """INSERT INTO paps_bot_state (key, value) VALUES (%s, %s)
+            ON CONFLICT (key) DO UPDATE SET value = EXCLUDED.value, updated_at = now()""",
+            (key, value),
+        )
+
+
+def _select_watermark(conn) -> str:
+    with conn, conn.cursor() as cur:
+        # xmax grows with every transaction that writes, the in-progress list shrinks as they end
+        cur.execute("SELECT txid_current_snapshot()::text")
+        return cur.fetchone()[0]
+
+
+def _insert_state_if_absent(conn, key: str, value: str) -> str:
+    with conn, conn.cursor() as cur:
+        cur.execute(
+            """INSERT INTO paps_bot_state (key, value) VALUES (%s, %s)
+            ON CONFLICT (key) DO NOTHING""",
+            (key, value),
+        )
+        cur.execute("SELECT value FROM paps_bot_state WHERE key = %s", (key,))
+        return cur.fetchone()[0]
+
+
+class EventRepository:
+    """Non-blocking access to the paps_table events, paps_votes and paps_attendees tables"""
+
+    def __init__(
+        self,
+        pool: StoragePool,
+        cache: Optional[EventCache] = None,
+        ownership: Optional[ShardOwnership] = None,
+    ):
+        self.pool = pool
+        self.cache = cache
+        # the guilds whose votes, reminders and signups this process tracks
+        self.ownership = ownership or ShardOwnership()
+        self._shards = self.ownership.query_filter()
+        self._listeners: List[Callable[[EventChange], None]] = []
+        # concurrent identical page reads share one query, until the next write
+        self.page_reads = SingleFlight("find_events")
+        self._writes = 0
+        if cache is not None:
+            self.add_listener(self._invalidate_cache)
+
+    def add_listener(self, listener: Callable[[EventChange], None]) -> None:
+        """Register a callback run after every committed write"""
+        self._listeners.append(listener)
+
+    def publish(self, change: EventChange) -> None:
+        """Tell every listener about a committed write"""
+        self._writes += 1
+        for listener in self._listeners:
+            listener(change)
+
+    def _invalidate_cache(self, change: EventChange) -> None:
+        cache = self.cache
+        if cache is None:
+            return
+        if change.action == "series":
+            # a rule change can add or move occurrences under any of the guild's filters
+            cache.invalidate_guild(change.guild_id)
+        elif change.action == "insert":
+            cache.invalidate(*keys_for_row(change.guild_id, change.row))
+        else:
+            cache.invalidate_game(change.guild_id, change.game_id, change.row)
+
+    @staticmethod
+    def _pick_filter(
+        game_id, game_type, game_date, game_time
+    ) -> Tuple[Optional[str], object]:
+        """The first given filter in id, type, date, time order"""
+        for column, value in (
+            ("game_id", game_id),
+            ("game_type", game_type),
+            ("game_date", game_date),
+            ("game_time", game_time),
+        ):
+            if value is not None:
+                return column, value
+        return None, None
+
+    async def migrate(self) -> int:
+        """Apply pending schema migrations, returns the schema version"""
+        return await self.pool.run(apply_migrations)
+
+    async def add_event(
+        self,
+        guild_id: int,
+        game_type: str,
+        game_date: date,
+        game_time: time,
+        channel_id: Optional[int] = None,
+        duration_minutes: int = DEFAULT_DURATION_MINUTES,
+    ) -> int:
+        """Insert a new event for a guild and return its game_id"""
+        game_id = await self.pool.run(
+            _insert_event,
+            guild_id,
+            channel_id,
+            game_type,
+            game_date,
+            game_time,
+            duration_minutes,
+        )
+        self.publish(
+            EventChange(
+                "insert",
+                guild_id,
+                game_id,
+                (game_id, game_type, game_date, game_time),
+                channel_id,
+                duration_minutes,
+            )
+        )
+        return game_id
+
+    async def import_events(
+        self,
+        guild_id: int,
+        rows: Sequence[Tuple[str, date, time]],
+        channel_id: Optional[int] = None,
+    ) -> List[EventRow]:
+        """Insert many (game_type, game_date, game_time) events at once, all or none"""
+        inserted = await self.pool.run(_copy_events, guild_id, channel_id, rows)
+        for row in inserted:
+            self.publish(
+                EventChange(
+                    "insert",
+                    guild_id,
+                    row[0],
+                    row,
+                    channel_id,
+                    DEFAULT_DURATION_MINUTES,
+                )
+            )
+        return inserted
+
+    async def find_events(
+        self,
+        guild_id: int,
+        game_id: Optional[int] = None,
+        game_type: Optional[str] = None,
+        game_date: Optional[date] = None,
+        game_time: Optional[time] = None,
+        *,
+        after: Optional[PageCursor] = None,
+        before: Optional[PageCursor] = None,
+        limit: int = 10,
+        archived: bool = False,
+    ) -> EventPage:
+        """
+        Fetch one page of a guild's events, filtered by the first given filter
+        in id, type, date, time order. Pages start after, or end before, a cursor.
+        Archived events are only read, uncached, when asked for.
+        """
+        column, value = self._pick_filter(game_id, game_type, game_date, game_time)
+        backwards = before is not None
+        cursor = before if backwards else after
+        args = (guild_id, column, value, cursor, backwards, limit)
+        if archived:
+            return await self.pool.run(_select_events_page, *args, True)
+        key = filter_key(guild_id, column, value)
+        page_key = (cursor, backwards, limit)
+        if self.cache is not None:
+            page = self.cache.get(key, page_key)
+            if page is not None:
+                return page
+        # a read started before the latest write may miss it, so it is not shared after one
+        return await self.page_reads.do(
+            (key, page_key, self._writes), self._read_page, key, page_key, args
+        )
+
+    async def _read_page(self, key, page_key, args) -> EventPage:
+        generation = self.cache.generation if self.cache is not None else 0
+        page = await self.pool.run(_select_events_page, *args)
+        if self.cache is not None:
+            self.cache.put(key, page, generation, page_key)
+        return page
+
+    async def stream_events(
+        self,
+        guild_id: int,
+        game_id: Optional[int] = None,
+        game_type: Optional[str] = None,
+        game_date: Optional[date] = None,
+        game_time: Optional[time] = None,
+        *,
+        batch: int = 500,
+        archived: bool = False,
+    ) -> AsyncIterator[List[EventRow]]:
+        """Yield every matching event in batches, read through a server-side cursor"""
+        column, value = self._pick_filter(game_id, game_type, game_date, game_time)
+        async for rows in self.pool.stream(
+            _open_event_stream, guild_id, column, value, batch, archived, batch=batch
+        ):
+            yield rows
+
+    async def stream_all_events(
+        self, *, batch: int = 2000
+    ) -> AsyncIterator[List[Tuple[int, EventRow, int]]]:
+        """
+        Yield (guild_id, row, duration_minutes) of every event of the owned
+        guilds in batches, unordered
+        """
+        async for rows in self.pool.stream(
+            _open_all_events_stream, self._shards, batch, batch=batch
+        ):
+            yield [(row[0], row[1:5], row[5]) for row in rows]
+
+    async def archive_events(self, before: date, batch: int) -> int:
+        """Move one batch of events dated before a day to the archive, returns how many"""
+        moved = await self.pool.run(_archive_events, before, batch)
+        for guild_id, game_id in moved:
+            self.publish(EventChange("delete", guild_id, game_id, None))
+        return len(moved)
+
+    async def delete_event(self, guild_id: int, game_id: int) -> bool:
+        """Delete a guild's event by game_id, returns whether a row was deleted"""
+        deleted = await self.pool.run(_delete_event, guild_id, game_id)
+        if deleted:
+            self.publish(EventChange("delete", guild_id, game_id, None))
+        return deleted
+
+    async def claim_legacy_events(self, guild_id: int) -> int:
+        """Hand the events from before guild scoping to a guild, returns how many"""
+        moved = await self.pool.run(_claim_legacy_events, guild_id)
+        for row, channel_id, duration_minutes in moved:
+            self.publish(EventChange("delete", LEGACY_GUILD_ID, row[0], None))
+            self.publish(
+                EventChange(
+                    "insert", guild_id, row[0], row, channel_id, duration_minutes
+                )
+            )
+        return len(moved)
+
+    async def update_event(
+        self,
+        guild_id: int,
+        game_id: int,
+        game_type: Optional[str] = None,
+        game_date: Optional[date] = None,
+        game_time: Optional[time] = None,
+        duration_minutes: Optional[int] = None,
+    ) -> bool:
+        """Change every given field of a guild's event, returns whether a row was updated"""
+        if not any((game_type, game_date, game_time, duration_minutes)):
+            return False
+        updated = await self.pool.run(
+            _update_event,
+            guild_id,
+            game_id,
+            game_type or None,
+            game_date or None,
+            game_time or None,
+            duration_minutes,
+        )
+        if updated is None:
+            return False
+        row, channel_id = updated
+        self.publish(
+            EventChange("update", guild_id, game_id, row, channel_id, duration_minutes)
+        )
+        return True
+
+    async def add_vote(self, vote: VoteRow) -> None:
+        """Persist a newly opened vote"""
+        await self.pool.run(_insert_vote, vote)
+
+    async def update_vote_tally(
+        self, message_id: int, thumbs_up: int, thumbs_down: int
+    ) -> None:
+        """Store the current tallies of an open vote"""
+        await self.pool.run(_update_vote_tally, message_id, thumbs_up, thumbs_down)
+
+    async def close_vote(self, message_id: int, status: str) -> bool:
+        """Mark an open vote as failed or expired, returns whether it was still open"""
+        return await self.pool.run(_close_vote, message_id, status)
+
+    async def pass_vote(self, message_id: int) -> Optional[int]:
+        """Mark an open vote as passed and save its event, returns the new game_id"""
+        passed = await self.pool.run(_pass_vote, message_id)
+        if passed is None:
+            return None
+        guild_id, channel_id, row, duration_minutes = passed
+        self.publish(
+            EventChange("insert", guild_id, row[0], row, channel_id, duration_minutes)
+        )
+        return row[0]
+
+    async def add_series(
+        self,
+        guild_id: int,
+        game_type: str,
+        start_date: date,
+        game_time: time,
+        interval_weeks: int,
+        *,
+        until: Optional[date] = None,
+        count: Optional[int] = None,
+        channel_id: Optional[int] = None,
+        duration_minutes: int = DEFAULT_DURATION_MINUTES,
+    ) -> int:
+        """Store a weekly or biweekly series ending at a date, after count occurrences, or never"""
+        series = Series(
+            0,
+            guild_id,
+            channel_id,
+            game_type,
+            start_date,
+            game_time,
+            interval_weeks,
+            until,
+            count,
+            duration_minutes,
+        )
+        series_id = await self.pool.run(_insert_series, series)
+        self.publish(
+            EventChange("series", guild_id, occurrence_id(series_id), None, channel_id)
+        )
+        return series_id
+
+    async def get_series(self, series_id: int) -> Optional[Recurrence]:
+        """A series with its overrides, None if it does not exist"""
+        return await self.pool.run(_select_series, series_id)
+
+    async def guild_series(self, guild_id: int) -> Sequence[Recurrence]:
+        """Every series of a guild with its overrides"""
+        return await self.pool.run(_select_guild_series, guild_id)
+
+    async def all_series(self) -> Sequence[Recurrence]:
+        """Every series of the owned guilds with its overrides"""
+        return await self.pool.run(_select_all_series, self._shards)
+
+    async def override_occurrence(
+        self,
+        guild_id: int,
+        series_id: int,
+        occurrence_date: date,
+        *,
+        game_type: Optional[str] = None,
+        game_date: Optional[date] = None,
+        game_time: Optional[time] = None,
+        cancelled: bool = False,
+    ) -> bool:
+        """
+        Change or cancel the occurrence the series puts on occurrence_date,
+        returns False if the guild has no such series or occurrence
+        """
+        override = Override(occurrence_date, game_type, game_date, game_time, cancelled)
+        recurrence = await self.pool.run(
+            _upsert_override, guild_id, series_id, override
+        )
+        if recurrence is None:
+            return False
+        self.publish(
+            EventChange(
+                "series",
+                guild_id,
+                occurrence_id(series_id),
+                None,
+                recurrence.series.channel_id,
+            )
+        )
+        return True
+
+    async def delete_series(self, guild_id: int, series_id: int) -> bool:
+        """Delete a guild's series and all of its occurrences"""
+        deleted = await self.pool.run(_delete_series, guild_id, series_id)
+        if deleted:
+            self.publish(
+                EventChange("series", guild_id, occurrence_id(series_id), None)
+            )
+        return deleted
+
+    async def upcoming_events(self, since: date) -> Sequence[Tuple[int, int, EventRow]]:
+        """(guild_id, channel_id, row) of every event on or after a date, across owned guilds"""
+        return await self.pool.run(_select_upcoming_events, since, self._shards)
+
+    async def open_votes(self) -> Sequence[VoteRow]:
+        """Every vote of the owned guilds that has not been decided yet"""
+        return await self.pool.run(_select_open_votes, self._shards)
+
+    async def set_event_message(self, game_id: int, message_id: int) -> None:
+        """Remember which discord message announces an event"""
+        await self.pool.run(_set_event_message, game_id, message_id)
+
+    async def event_messages(self, since: date) -> Sequence[Tuple[int, int]]:
+        """(message_id, game_id) of every announced event of the owned guilds on or after a date"""
+        return await self.pool.run(_select_event_messages, since, self._shards)
+
+    async def write_attendees(
+        self,
+        upserts: List[Tuple[int, int, str]],
+        removals: List[Tuple[int, int, str]],
+    ) -> None:
+        """Store a batch of (game_id, user_id, status) signups and withdrawals"""
+        await self.pool.run(_write_attendees, upserts, removals)
+
+    async def attendees(self, guild_id: int, game_id: int) -> Sequence[Tuple[int, str]]:
+        """(user_id, status) of everyone who responded to a guild's event"""
+        return await self.pool.run(_select_attendees, guild_id, game_id)
+
+    async def set_availability(
+        self,
+        guild_id: int,
+        user_id: int,
+        weekday: int,
+        ranges: List[Tuple[int, int]],
+    ) -> None:
+        """Replace when a member is free on a weekday, as (start, end) minutes of the day"""
+        await self.pool.run(_replace_availability, guild_id, user_id, weekday, ranges)
+
+    async def clear_availability(self, guild_id: int, user_id: int) -> int:
+        """Forget a member's availability, returns how many ranges were removed"""
+        return await self.pool.run(_delete_availability, guild_id, user_id)
+
+    async def availability(self, guild_id: int) -> Sequence[Tuple[int, int, int, int]]:
+        """(user_id, weekday, start_minute, end_minute) of every member of a guild"""
+        return await self.pool.run(_select_availability, guild_id)
+
+    async def get_state(self, key: str) -> Optional[str]:
+        """A persisted bot state value, None if it was never set"""
+        return await self.pool.run(_select_state, key)
+
+    async def set_state(self, key: str, value: str) -> None:
+        """Persist a bot state value"""
+        await self.pool.run(_upsert_state, key, value)
+
+    async def init_state(self, key: str, value: str) -> str:
+        """Persist a bot state value unless one is set, returns the value that is"""
+        return await self.pool.run(_insert_state_if_absent, key, value)
+
+    async def watermark(self) -> str:
+        """A value that changes whenever a write is committed, to tell whether a state snapshot is current"""
+        return await self.pool.run(_select_watermark)
@@ -0,0 +1,68 @@
+"""
+Moves past events out of paps_table into the date-partitioned archive, in the background
+"""
+
+import asyncio
+import logging
+from datetime import date, timedelta
+from typing import Optional
+import psycopg2
+from paps_bot.metrics import ARCHIVED_EVENTS
+from paps_bot.repository import EventRepository
+
+# get the bot logger
+logger = logging.getLogger("discord")
+
+
+class ArchiveJob:
+    """
+    Every interval, moves the events dated more than keep ago to the
+    archive, a batch per transaction, so paps_table and its indexes only hold
+    recent and upcoming events however long the bot runs.
+    """
+
+    def __init__(
+        self,
+        repository: EventRepository,
+        keep: timedelta,
+        interval: float = 3600.0,
+        batch: int = 500,
+    ):
+        self.repository = repository
+        self.keep = keep
+        self.interval = interval
+        self.batch = batch
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self) -> None:
+        """Start the archive task"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Stop the archive task, a batch in flight still commits or rolls back whole"""
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def run_once(self) -> int:
+        """Archive every event past the retention horizon, returns how many were moved"""
+        before = date.today() - self.keep
+        moved = 0
+        while True:
+            count = await self.repository.archive_events(before, self.batch)
+            moved += count
+            ARCHIVED_EVENTS.inc(count)
+            if count < self.batch:
+                break
+        if moved:
+            logger.info("Archived %s event(s) dated before %s.", moved, before)
+        return moved
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.run_once()
+            except psycopg2.Error as err:
+                logger.error("Could not archive past events: %s", err)
+            await asyncio.sleep(self.interval)
@@ -0,0 +1,155 @@
+"""
+Attendee signups on event messages, buffered in memory and written behind in batches
+"""
+
+import asyncio
+import logging
+from datetime import date
+from typing import Dict, List, Optional, Sequence, Tuple
+import psycopg2
+import discord
+from paps_bot.repository import EventChange, EventRepository
+
+# get the bot logger
+logger = logging.getLogger("discord")
+
+ATTENDING = "✅"
+NOT_ATTENDING = "❌"
+STATUS_BY_EMOJI = {ATTENDING: "going", NOT_ATTENDING: "declined"}
+
+
+class RsvpTracker:
+    """
+    Routes reactions on event messages to signups with one dict lookup.
+    The latest reaction per (event, user) wins in memory, and the buffer is
+    written in one transaction every flush_interval seconds, or sooner once
+    flush_size changes are waiting, so a burst of reactions costs a handful
+    of round trips.
+    """
+
+    def __init__(
+        self,
+        client: discord.Client,
+        repository: EventRepository,
+        flush_interval: float = 2.0,
+        flush_size: int = 200,
+    ):
+        self.client = client
+        self.repository = repository
+        self.flush_interval = flush_interval
+        self.flush_size = flush_size
+        self._messages: Dict[int, int] = {}
+        # (game_id, user_id) -> (status, whether it was given or withdrawn)
+        self._pending: Dict[Tuple[int, int], Tuple[str, bool]] = {}
+        self._dirty = asyncio.Event()
+        self._flush_now = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        repository.add_listener(self._on_change)
+
+    async def start(self, messages: Optional[Dict[int, int]] = None) -> None:
+        """
+        Load the messages of upcoming events, or those of a state snapshot,
+        and start the flusher
+        """
+        if messages is None:
+            messages = dict(await self.repository.event_messages(date.today()))
+        self._messages.update(messages)
+        logger.info("Tracking signups on %s event message(s).", len(self._messages))
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Stop the flusher and write out whatever is still buffered"""
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        await self.flush()
+
+    def snapshot(self) -> Dict[int, int]:
+        """Every tracked signup message id, with its game_id"""
+        return dict(self._messages)
+
+    async def track_message(self, game_id: int, message: discord.Message) -> None:
+        """Make a message the signup sheet of an event, and add the signup reactions"""
+        await self.repository.set_event_message(game_id, message.id)
+        self._messages[message.id] = game_id
+        await message.add_reaction(ATTENDING)
+        await message.add_reaction(NOT_ATTENDING)
+
+    def _on_change(self, change: EventChange) -> None:
+        if change.action != "delete":
+            return
+        for key in [key for key in self._pending if key[0] == change.game_id]:
+            del self._pending[key]
+        for message_id in [m for m, g in self._messages.items() if g == change.game_id]:
+            del self._messages[message_id]
+
+    def handle_reaction(
+        self, payload: discord.RawReactionActionEvent, added: bool
+    ) -> None:
+        """Buffer a signup change from a reaction on an event message"""
+        game_id = self._messages.get(payload.message_id)
+        user = self.client.user
+        if game_id is None or user is None or payload.user_id == user.id:
+            return
+        status = STATUS_BY_EMOJI.get(str(payload.emoji))
+        if status is None:
+            return
+        key = (game_id, payload.user_id)
+        if added:
+            self._pending[key] = (status, True)
+        elif self._pending.get(key, (status,))[0] == status:
+            # only withdraw the signup the removed reaction stood for
+            self._pending[key] = (status, False)
+        self._dirty.set()
+        if len(self._pending) >= self.flush_size:
+            self._flush_now.set()
+
+    async def flush(self) -> int:
+        """Write every buffered signup change, returns how many were written"""
+        async with self._flush_lock:
+            if not self._pending:
+                return 0
+            batch, self._pending = self._pending, {}
+            upserts = [(g, u, s) for (g, u), (s, given) in batch.items() if given]
+            removals = [(g, u, s) for (g, u), (s, given) in batch.items() if not given]
+            try:
+                await self.repository.write_attendees(upserts, removals)
+            except psycopg2.Error as err:
+                logger.error("Could not store signups, retrying later: %s", err)
+                # keep changes that arrived while writing, they are newer
+                batch.update(self._pending)
+                self._pending = batch
+                return 0
+            logger.info("Stored %s signup change(s).", len(batch))
+            return len(batch)
+
+    def overlay(
+        self, game_id: int, stored: Sequence[Tuple[int, str]]
+    ) -> List[Tuple[int, str]]:
+        """Apply not yet written signup changes to the stored (user_id, status) rows"""
+        statuses = dict(stored)
+        for (pending_game, user_id), (status, given) in self._pending.items():
+            if pending_game != game_id:
+                continue
+            if given:
+                statuses[user_id] = status
+            elif statuses.get(user_id) == status:
+                del statuses[user_id]
+        return list(statuses.items())
+
+    async def _run(self) -> None:
+        """Once a change is buffered, wait out the coalescing window and flush"""
+        while True:
+            await self._dirty.wait()
+            try:
+                await asyncio.wait_for(self._flush_now.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._dirty.clear()
+            self._flush_now.clear()
+            await self.flush()
+            if self._pending:
+                # the write failed, or more changes arrived while it ran
+                self._dirty.set()
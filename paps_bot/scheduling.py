@@ -0,0 +1,366 @@
+"""
+Overlap checks against a per-guild interval index, and free slot suggestions from availability bitsets
+
+The bitsets are plain Python ints rather than NumPy arrays: a week of
+half-hour buckets is a few hundred bits, which CPython already shifts, ands
+and ors a machine word at a time, without adding a dependency.
+"""
+
+import asyncio
+import logging
+from bisect import bisect_left, insort
+from datetime import datetime, time, timedelta
+from typing import (
+    Dict,
+    Iterable,
+    List,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+)
+import psycopg2
+from paps_bot.recurrence import Recurrence
+from paps_bot.repository import (
+    DEFAULT_DURATION_MINUTES,
+    EventChange,
+    EventRepository,
+    EventRow,
+)
+
+# get the bot logger
+logger = logging.getLogger("discord")
+
+# slot suggestions work on buckets of this length
+BUCKET = timedelta(minutes=30)
+# at most this many suggestions are made
+MAX_SUGGESTIONS = 5
+
+
+def event_span(row: EventRow, duration_minutes: int) -> Tuple[datetime, datetime]:
+    """Start and end of an event, naive in the bot's local time"""
+    start = datetime.combine(row[2], row[3])
+    return start, start + timedelta(minutes=duration_minutes)
+
+
+class GuildSpans:
+    """
+    The events of one guild as start-sorted arrays. An event overlapping
+    [start, end) must begin after start minus the longest duration held, so
+    an overlap check is a bisect plus the few events starting in that window.
+    """
+
+    def __init__(self):
+        self.starts: List[Tuple[datetime, int]] = []
+        self.spans: Dict[int, Tuple[datetime, datetime, EventRow]] = {}
+        # only grows, a stale value merely widens the window searched
+        self.longest = timedelta(0)
+
+    def add(self, row: EventRow, duration_minutes: int) -> None:
+        """Index an event, replacing its previous span"""
+        self.remove(row[0])
+        start, end = event_span(row, duration_minutes)
+        self.spans[row[0]] = (start, end, row)
+        insort(self.starts, (start, row[0]))
+        self.longest = max(self.longest, end - start)
+
+    def remove(self, game_id: int) -> Optional[int]:
+        """Forget an event, returns its duration in minutes if it was indexed"""
+        span = self.spans.pop(game_id, None)
+        if span is None:
+            return None
+        del self.starts[bisect_left(self.starts, (span[0], game_id))]
+        return int((span[1] - span[0]).total_seconds() // 60)
+
+    def overlapping(
+        self, start: datetime, end: datetime
+    ) -> List[Tuple[datetime, datetime, EventRow]]:
+        """Spans of the events overlapping [start, end), in start order"""
+        found = []
+        for i in range(
+            bisect_left(self.starts, (start - self.longest,)),
+            bisect_left(self.starts, (end,)),
+        ):
+            span = self.spans[self.starts[i][1]]
+            if span[1] > start:
+                found.append(span)
+        return found
+
+
+class ConflictIndex:
+    """
+    Start and end of every event and series of every owned guild, loaded
+    once at startup and kept in sync by the repository's write notifications.
+    """
+
+    def __init__(self, repository: EventRepository):
+        self.repository = repository
+        self._guilds: Dict[int, GuildSpans] = {}
+        # game_id -> guild_id, to find the guild of an update or delete
+        self._owners: Dict[int, int] = {}
+        # guild_id -> {series_id: series}
+        self._series: Dict[int, Dict[int, Recurrence]] = {}
+        self._reloads: Set[asyncio.Task] = set()
+        repository.add_listener(self._on_change)
+
+    def __len__(self) -> int:
+        return len(self._owners)
+
+    async def load(
+        self,
+        events: Optional[Sequence[Tuple[int, EventRow, int]]] = None,
+        series: Optional[Sequence[Recurrence]] = None,
+    ) -> None:
+        """Index every stored event and series, or those of a state snapshot"""
+        if events is None or series is None:
+            stored: List[Tuple[int, EventRow, int]] = []
+            async for rows in self.repository.stream_all_events():
+                stored.extend(rows)
+            events, series = stored, await self.repository.all_series()
+        for guild_id, row, duration_minutes in events:
+            self._add(guild_id, row, duration_minutes)
+        for recurrence in series:
+            self._add_series(recurrence)
+        logger.info("Indexed %s event(s) for conflict checks.", len(self._owners))
+
+    @property
+    def settled(self) -> bool:
+        """Whether no series change is still being read"""
+        return not self._reloads
+
+    def snapshot(self) -> Tuple[List[Tuple[int, EventRow, int]], List[Recurrence]]:
+        """(guild_id, row, duration_minutes) of every indexed event, and every series"""
+        events = [
+            (guild_id, row, int((end - start).total_seconds() // 60))
+            for guild_id, guild in self._guilds.items()
+            for start, end, row in guild.spans.values()
+        ]
+        series = [r for by_id in self._series.values() for r in by_id.values()]
+        return events, series
+
+    def clear(self) -> None:
+        """Forget every indexed event and series, before loading them again"""
+        self._guilds.clear()
+        self._owners.clear()
+        self._series.clear()
+
+    def _add(self, guild_id: int, row: EventRow, duration_minutes: int) -> None:
+        self._owners[row[0]] = guild_id
+        self._guilds.setdefault(guild_id, GuildSpans()).add(row, duration_minutes)
+
+    def _add_series(self, recurrence: Recurrence) -> None:
+        series = recurrence.series
+        self._series.setdefault(series.guild_id, {})[series.series_id] = recurrence
+
+    async def _reload_series(self, guild_id: int, series_id: int) -> None:
+        try:
+            recurrence = await self.repository.get_series(series_id)
+        except psycopg2.Error as err:
+            logger.error("Could not reload series %s for conflicts: %s", series_id, err)
+            return
+        if recurrence is None:
+            self._series.get(guild_id, {}).pop(series_id, None)
+        else:
+            self._add_series(recurrence)
+
+    def _on_change(self, change: EventChange) -> None:
+        if change.action == "series":
+            task = asyncio.create_task(
+                self._reload_series(change.guild_id, -change.game_id)
+            )
+            self._reloads.add(task)
+            task.add_done_callback(self._reloads.discard)
+            return
+        guild_id = self._owners.pop(change.game_id, None)
+        previous = None
+        if guild_id is not None:
+            previous = self._guilds[guild_id].remove(change.game_id)
+        if change.row is not None:
+            duration = change.duration_minutes or previous or DEFAULT_DURATION_MINUTES
+            self._add(change.guild_id, change.row, duration)
+
+    def conflicts(
+        self, guild_id: int, start: datetime, end: datetime
+    ) -> List[Tuple[datetime, datetime, EventRow]]:
+        """Events and series occurrences of a guild overlapping [start, end), by start"""
+        found = []
+        guild = self._guilds.get(guild_id)
+        if guild is not None:
+            found.extend(guild.overlapping(start, end))
+        for recurrence in self._series.get(guild_id, {}).values():
+            length = timedelta(minutes=recurrence.series.duration_minutes)
+            # an occurrence overlapping the window starts at most its length before it
+            first = (start - length).date()
+            for row in recurrence.occurrences(first, end.date()):
+                begins, ends = event_span(row, recurrence.series.duration_minutes)
+                if begins < end and ends > start:
+                    found.append((begins, ends, row))
+        found.sort(key=lambda span: span[0])
+        return found
+
+
+def _touched(origin: datetime, start: datetime, end: datetime, buckets: int) -> int:
+    """The buckets a time range touches at all, clipped to the horizon"""
+    first = max(0, (start - origin) // BUCKET)
+    last = min(buckets, -((origin - end) // BUCKET))
+    return _bits(first, last)
+
+
+def _inside(origin: datetime, start: datetime, end: datetime, buckets: int) -> int:
+    """The buckets a time range covers whole, clipped to the horizon"""
+    first = max(0, -((origin - start) // BUCKET))
+    last = min(buckets, (end - origin) // BUCKET)
+    return _bits(first, last)
+
+
+def _bits(first: int, last: int) -> int:
+    """Bits first to last - 1 set"""
+    return ((1 << (last - first)) - 1) << first if last > first else 0
+
+
+def availability_mask(
+    ranges: Iterable[Tuple[int, int, int]], origin: datetime, days: int
+) -> int:
+    """
+    A member's free buckets over the horizon as an int, bit i is the i-th
+    bucket, from weekly (weekday, start_minute, end_minute) ranges.
+    """
+    buckets = days * (timedelta(days=1) // BUCKET)
+    by_weekday: Dict[int, List[Tuple[int, int]]] = {}
+    for weekday, start_minute, end_minute in ranges:
+        by_weekday.setdefault(weekday, []).append((start_minute, end_minute))
+    mask = 0
+    for offset in range(days + 1):
+        day = origin.date() + timedelta(days=offset)
+        midnight = datetime.combine(day, time())
+        for start_minute, end_minute in by_weekday.get(day.weekday(), ()):
+            mask |= _inside(
+                origin,
+                midnight + timedelta(minutes=start_minute),
+                midnight + timedelta(minutes=end_minute),
+                buckets,
+            )
+    return mask
+
+
+def runs(mask: int, length: int) -> int:
+    """Bits i of mask where bits i to i + length - 1 are all set, by doubling shifts"""
+    covered = 1
+    while covered < length:
+        step = min(covered, length - covered)
+        mask &= mask >> step
+        covered += step
+    return mask
+
+
+def add_to_counter(slices: List[int], mask: int) -> None:
+    """
+    Add one to every bucket set in mask, on a bit-sliced counter: slices[b]
+    holds bit b of every bucket's count, so all buckets add in parallel.
+    """
+    carry = mask
+    for b, value in enumerate(slices):
+        if not carry:
+            return
+        slices[b], carry = value ^ carry, value & carry
+    if carry:
+        slices.append(carry)
+
+
+def at_least(slices: List[int], count: int, universe: int) -> int:
+    """Buckets whose bit-sliced count is at least count"""
+    if count.bit_length() > len(slices):
+        return 0
+    greater, equal = 0, universe
+    for b in range(len(slices) - 1, -1, -1):
+        if count >> b & 1:
+            equal &= slices[b]
+        else:
+            greater |= equal & slices[b]
+            equal &= ~slices[b]
+    return greater | equal
+
+
+class Slot(NamedTuple):
+    """A suggested start, with who is free for the whole event"""
+
+    start: datetime
+    end: datetime
+    free: List[int]
+
+
+def suggest_slots(
+    availability: Iterable[Tuple[int, int, int, int]],
+    busy: List[Tuple[datetime, datetime, EventRow]],
+    origin: datetime,
+    days: int,
+    duration: timedelta,
+    limit: int = MAX_SUGGESTIONS,
+) -> Tuple[List[Slot], int]:
+    """
+    The earliest non-overlapping starts after origin, free of other events,
+    at which the most members are free for the whole duration. Members' free time is an
+    int bitset over the horizon, so intersections and counts run on whole
+    machine words instead of bucket by bucket. Returns the slots and the
+    number of members who declared availability.
+    """
+    buckets = days * (timedelta(days=1) // BUCKET)
+    universe = (1 << buckets) - 1
+    length = -int(-duration // BUCKET)
+    ranges: Dict[int, List[Tuple[int, int, int]]] = {}
+    for user_id, weekday, start_minute, end_minute in availability:
+        ranges.setdefault(user_id, []).append((weekday, start_minute, end_minute))
+    # starts whose whole duration is free of other events and inside the horizon
+    taken = 0
+    for start, end, _ in busy:
+        taken |= _touched(origin, start, end, buckets)
+    open_starts = runs(universe & ~taken, length)
+    starts_by_member: Dict[int, int] = {}
+    slices: List[int] = []
+    for user_id, member_ranges in ranges.items():
+        member = runs(availability_mask(member_ranges, origin, days), length)
+        member &= open_starts
+        if member:
+            starts_by_member[user_id] = member
+            add_to_counter(slices, member)
+    slots: List[Slot] = []
+    for count in range(len(starts_by_member), 0, -1):
+        candidates = at_least(slices, count, universe)
+        while candidates and len(slots) < limit:
+            lowest = candidates & -candidates
+            index = lowest.bit_length() - 1
+            start = origin + index * BUCKET
+            free = [u for u, starts in starts_by_member.items() if starts & lowest]
+            slots.append(Slot(start, start + duration, free))
+            # later suggestions must not overlap this one
+            blocked = _bits(max(0, index - length + 1), index + length)
+            candidates &= ~blocked
+            slices[:] = [value & ~blocked for value in slices]
+        if len(slots) == limit:
+            break
+    slots.sort(key=lambda slot: slot.start)
+    return slots, len(ranges)
+
+
+def horizon_start(now: Optional[datetime] = None) -> datetime:
+    """The start of the first whole bucket from now, naive local time"""
+    now = now or datetime.now()
+    midnight = datetime.combine(now.date(), time())
+    return midnight - ((midnight - now) // BUCKET) * BUCKET
+
+
+def parse_ranges(text: str) -> Optional[List[Tuple[int, int]]]:
+    """'18:00-23:00, 10:00-12:00' as minutes of the day, 24:00 may end a range, None if invalid"""
+    ranges = []
+    for part in text.split(","):
+        bounds = []
+        for value in part.split("-"):
+            hours, _, minutes = value.strip().partition(":")
+            if not (hours.isdigit() and minutes.isdigit() and int(minutes) < 60):
+                return None
+            bounds.append(int(hours) * 60 + int(minutes))
+        if len(bounds) != 2 or not 0 <= bounds[0] < bounds[1] <= 24 * 60:
+            return None
+        ranges.append((bounds[0], bounds[1]))
+    return sorted(ranges)
@@ -0,0 +1,76 @@
+"""
+Which guilds this process owns when the bot's shards are split over several processes
+"""
+
+import os
+from typing import List, Optional, Sequence, Tuple
+
+
+def shard_for_guild(guild_id: int, shard_count: int) -> int:
+    """The shard discord delivers a guild's events on"""
+    return (guild_id >> 22) % shard_count
+
+
+def split_shards(shard_count: int, workers: int) -> List[List[int]]:
+    """Spread the shards over the workers in contiguous, nearly equal runs"""
+    if not 1 <= workers <= shard_count:
+        raise ValueError("need at least one shard per worker")
+    base, extra = divmod(shard_count, workers)
+    runs, start = [], 0
+    for worker in range(workers):
+        size = base + (1 if worker < extra else 0)
+        runs.append(list(range(start, start + size)))
+        start += size
+    return runs
+
+
+class ShardOwnership:
+    """
+    The shards run by this process. Without an explicit shard count the
+    process runs every shard and owns every guild.
+    """
+
+    def __init__(
+        self,
+        shard_ids: Optional[Sequence[int]] = None,
+        shard_count: Optional[int] = None,
+    ):
+        if shard_ids is not None:
+            if shard_count is None:
+                raise ValueError("shard_ids need a shard_count")
+            if any(not 0 <= s < shard_count for s in shard_ids):
+                raise ValueError(f"shard ids must be in 0..{shard_count - 1}")
+        self.shard_ids = sorted(shard_ids) if shard_ids is not None else None
+        self.shard_count = shard_count
+
+    @property
+    def owns_everything(self) -> bool:
+        """Whether this process runs all shards"""
+        return self.shard_ids is None or len(self.shard_ids) == self.shard_count
+
+    def owns_shard(self, shard_id: int) -> bool:
+        """Whether this process runs the shard"""
+        return self.shard_ids is None or shard_id in self.shard_ids
+
+    def owns_guild(self, guild_id: int) -> bool:
+        """Whether this process receives the guild's events"""
+        # shard_ids never come without a shard_count, see __init__
+        if self.owns_everything or self.shard_count is None:
+            return True
+        return self.owns_shard(shard_for_guild(guild_id, self.shard_count))
+
+    def query_filter(self) -> Optional[Tuple[int, List[int]]]:
+        """(shard_count, shard_ids) for queries to restrict to owned guilds, None for all"""
+        if self.owns_everything or self.shard_ids is None or self.shard_count is None:
+            return None
+        return self.shard_count, self.shard_ids
+
+
+def ownership_from_env() -> ShardOwnership:
+    """Read SHARD_COUNT and SHARD_IDS (comma separated), both optional"""
+    shard_count = os.getenv("SHARD_COUNT")
+    shard_ids = os.getenv("SHARD_IDS")
+    return ShardOwnership(
+        [int(s) for s in shard_ids.split(",") if s.strip()] if shard_ids else None,
+        int(shard_count) if shard_count else None,
+    )
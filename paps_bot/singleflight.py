@@ -0,0 +1,51 @@
+"""
+Coalescing of identical concurrent reads into a single in-flight call
+"""
+
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable
+from paps_bot.metrics import COALESCED_CALLS
+
+
+class SingleFlight:
+    """
+    The first caller for a key starts the call, everyone asking for the same
+    key while it runs awaits that call's result instead of starting their own.
+    The call runs as its own task, so a cancelled caller does not cancel it
+    for the others.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.calls = 0
+        self.coalesced = 0
+        self._in_flight: Dict[Hashable, asyncio.Task] = {}
+
+    def __len__(self) -> int:
+        return len(self._in_flight)
+
+    async def do(
+        self, key: Hashable, func: Callable[..., Awaitable[Any]], *args
+    ) -> Any:
+        """Return func(*args), shared with the concurrent callers of the same key"""
+        task = self._in_flight.get(key)
+        if task is None:
+            self.calls += 1
+            task = asyncio.ensure_future(func(*args))
+            self._in_flight[key] = task
+            task.add_done_callback(lambda done: self._finish(key, done))
+        else:
+            self.coalesced += 1
+            COALESCED_CALLS.inc(call=self.name)
+        return await asyncio.shield(task)
+
+    def _finish(self, key: Hashable, task: asyncio.Task) -> None:
+        if self._in_flight.get(key) is task:
+            del self._in_flight[key]
+        if not task.cancelled():
+            # every caller may have been cancelled, don't warn about an unretrieved error
+            task.exception()
+
+    def stats(self) -> Dict[str, int]:
+        """Calls started, and calls answered by one that was already in flight"""
+        return {"calls": self.calls, "coalesced": self.coalesced}
@@ -0,0 +1,74 @@
+"""
+In-memory state handed from a stopping bot to the next one, so it starts warm
+"""
+
+import os
+import zlib
+import pickle
+import logging
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+from paps_bot.recurrence import Recurrence
+from paps_bot.repository import EventRow, VoteRow
+
+# get the bot logger
+logger = logging.getLogger("discord")
+
+# bump whenever StateSnapshot or anything it holds changes shape
+SNAPSHOT_FORMAT = 1
+
+
+class StateSnapshot(NamedTuple):
+    """Everything a bot loads at startup, as of a repository watermark"""
+
+    watermark: str  # EventRepository.watermark() when the state was taken
+    shards: Optional[Tuple[int, List[int]]]  # ShardOwnership.query_filter()
+    events: List[Tuple[int, EventRow, int]]  # (guild_id, row, duration_minutes)
+    series: List[Recurrence]
+    votes: List[VoteRow]
+    upcoming: List[Tuple[int, int, EventRow]]  # events still to remind about
+    messages: Dict[int, int]  # signup message id -> game_id
+    cache: List[Tuple[Any, float, Dict[Any, Any]]]  # EventCache.snapshot()
+
+
+def write_snapshot(path: str, snapshot: StateSnapshot) -> int:
+    """Write a snapshot atomically, returns its size in bytes"""
+    data = zlib.compress(
+        pickle.dumps((SNAPSHOT_FORMAT, snapshot), pickle.HIGHEST_PROTOCOL)
+    )
+    partial = path + ".tmp"
+    with open(partial, "wb") as file:
+        file.write(data)
+    os.replace(partial, path)
+    return len(data)
+
+
+def read_snapshot(path: str) -> Optional[StateSnapshot]:
+    """
+    Read and remove the snapshot, so it is never restored twice. The file is
+    only ever written by the bot itself, pickle is trusted to load it.
+    """
+    try:
+        with open(path, "rb") as file:
+            data = file.read()
+    except FileNotFoundError:
+        return None
+    finally:
+        if os.path.exists(path):
+            os.remove(path)
+    try:
+        version, snapshot = pickle.loads(zlib.decompress(data))
+    except (
+        zlib.error,
+        pickle.UnpicklingError,
+        EOFError,
+        AttributeError,
+        ImportError,
+        TypeError,
+        ValueError,
+    ) as err:
+        logger.warning("Ignoring unreadable state snapshot %s: %s", path, err)
+        return None
+    if version != SNAPSHOT_FORMAT:
+        logger.info("Ignoring state snapshot of format %s.", version)
+        return None
+    return snapshot
@@ -0,0 +1,963 @@
+"""
+Embedded SQLite storage for a single bot process, answering the repository's query functions by name
+"""
+
+import os
+import json
+import queue
+import asyncio
+import inspect
+import logging
+import sqlite3
+import threading
+import functools
+import concurrent.futures
+from datetime import date, datetime, time
+from functools import lru_cache
+from time import perf_counter
+from typing import AsyncIterator, Callable, Dict, List, Optional, Tuple
+import psycopg2
+from paps_bot import queries, repository
+from paps_bot.database import fetch_batches
+from paps_bot.metrics import DB_ERRORS, DB_POOL_WAIT, DB_QUERY_DURATION
+from paps_bot.recurrence import Override, Recurrence, Series
+from paps_bot.repository import (
+    DEFAULT_DURATION_MINUTES,
+    EventPage,
+    LEGACY_GUILD_ID,
+    EventRow,
+    PageCursor,
+    VoteRow,
+    merge_page,
+)
+
+# get the bot logger
+logger = logging.getLogger("discord")
+
+# dates and times are stored as ISO text, which sorts like the values do, and
+# read back by the name of their column, see _convert_row
+CONVERTERS: Dict[str, Callable] = {
+    "game_date": date.fromisoformat,
+    "start_date": date.fromisoformat,
+    "until": date.fromisoformat,
+    "occurrence_date": date.fromisoformat,
+    "game_time": time.fromisoformat,
+    "deadline": datetime.fromisoformat,
+    "cancelled": bool,
+}
+
+NOW = "(strftime('%Y-%m-%d %H:%M:%f', 'now'))"
+
+# (version, description, statements) like paps_bot.migrations, kept in PRAGMA user_version
+MIGRATIONS: List[Tuple[int, str, Tuple[str, ...]]] = [
+    (
+        1,
+        "create the schema of postgreSQL migrations 1 to 11",
+        (
+            # AUTOINCREMENT never hands out the id of a deleted or archived event again
+            f"""CREATE TABLE paps_table (
+            game_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            guild_id INTEGER NOT NULL,
+            channel_id INTEGER,
+            game_type TEXT NOT NULL,
+            game_date DATE NOT NULL,
+            game_time TIME NOT NULL,
+            duration_minutes INTEGER NOT NULL DEFAULT {DEFAULT_DURATION_MINUTES}
+            CHECK (duration_minutes > 0),
+            message_id INTEGER UNIQUE
+            )""",
+            "CREATE INDEX paps_table_guild_date_time_id_idx ON paps_table (guild_id, game_date, game_time, game_id)",
+            "CREATE INDEX paps_table_guild_type_idx ON paps_table (guild_id, game_type)",
+            "CREATE INDEX paps_table_guild_time_idx ON paps_table (guild_id, game_time)",
+            "CREATE INDEX paps_table_game_date_idx ON paps_table (game_date)",
+            f"""CREATE TABLE paps_votes (
+            message_id INTEGER PRIMARY KEY,
+            guild_id INTEGER NOT NULL,
+            channel_id INTEGER NOT NULL,
+            game_type TEXT NOT NULL,
+            game_date DATE NOT NULL,
+            game_time TIME NOT NULL,
+            count_limit_success INTEGER NOT NULL,
+            count_limit_fail INTEGER NOT NULL,
+            deadline TIMESTAMP NOT NULL,
+            thumbs_up INTEGER NOT NULL DEFAULT 0,
+            thumbs_down INTEGER NOT NULL DEFAULT 0,
+            duration_minutes INTEGER NOT NULL DEFAULT {DEFAULT_DURATION_MINUTES}
+            CHECK (duration_minutes > 0),
+            status TEXT NOT NULL DEFAULT 'open'
+            )""",
+            "CREATE INDEX paps_votes_open_idx ON paps_votes (deadline) WHERE status = 'open'",
+            f"""CREATE TABLE paps_attendees (
+            game_id INTEGER NOT NULL REFERENCES paps_table (game_id) ON DELETE CASCADE,
+            user_id INTEGER NOT NULL,
+            status TEXT NOT NULL,
+            updated_at TIMESTAMP NOT NULL DEFAULT {NOW},
+            PRIMARY KEY (game_id, user_id)
+            )""",
+            f"""CREATE TABLE paps_bot_state (
+            key TEXT PRIMARY KEY,
+            value TEXT NOT NULL,
+            updated_at TIMESTAMP NOT NULL DEFAULT {NOW}
+            )""",
+            f"""CREATE TABLE paps_series (
+            series_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            guild_id INTEGER NOT NULL,
+            channel_id INTEGER,
+            game_type TEXT NOT NULL,
+            start_date DATE NOT NULL,
+            game_time TIME NOT NULL,
+            interval_weeks INTEGER NOT NULL CHECK (interval_weeks IN (1, 2)),
+            until DATE,
+            count INTEGER CHECK (count > 0),
+            duration_minutes INTEGER NOT NULL DEFAULT {DEFAULT_DURATION_MINUTES}
+            CHECK (duration_minutes > 0),
+            CHECK (until IS NULL OR count IS NULL)
+            )""",
+            "CREATE INDEX paps_series_guild_idx ON paps_series (guild_id)",
+            """CREATE TABLE paps_series_overrides (
+            series_id INTEGER NOT NULL REFERENCES paps_series ON DELETE CASCADE,
+            occurrence_date DATE NOT NULL,
+            game_type TEXT,
+            game_date DATE,
+            game_time TIME,
+            cancelled BOOLEAN NOT NULL DEFAULT 0,
+            PRIMARY KEY (series_id, occurrence_date)
+            )""",
+            """CREATE TABLE paps_availability (
+            guild_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            weekday INTEGER NOT NULL CHECK (weekday BETWEEN 0 AND 6),
+            start_minute INTEGER NOT NULL CHECK (start_minute BETWEEN 0 AND 1439),
+            end_minute INTEGER NOT NULL CHECK (end_minute BETWEEN 1 AND 1440),
+            CHECK (start_minute < end_minute),
+            PRIMARY KEY (guild_id, user_id, weekday, start_minute)
+            )""",
+            # one table rather than partitions, a single node archive stays small
+            f"""CREATE TABLE paps_archive (
+            game_id INTEGER PRIMARY KEY,
+            guild_id INTEGER NOT NULL,
+            channel_id INTEGER,
+            game_type TEXT NOT NULL,
+            game_date DATE NOT NULL,
+            game_time TIME NOT NULL,
+            duration_minutes INTEGER NOT NULL,
+            message_id INTEGER,
+            attendees TEXT,
+            archived_at TIMESTAMP NOT NULL DEFAULT {NOW}
+            )""",
+            "CREATE INDEX paps_archive_guild_date_time_id_idx ON paps_archive (guild_id, game_date, game_time, game_id)",
+            # the writer counts its commits here, see SQLitePool._commit
+            """CREATE TABLE paps_change_counter (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            changes INTEGER NOT NULL
+            )""",
+            "INSERT INTO paps_change_counter (id, changes) VALUES (1, 0)",
+        ),
+    ),
+]
+
+
+class SQLiteError(psycopg2.DatabaseError):
+    """An sqlite3 error, raised as a psycopg2 one, which every caller handles"""
+
+
+def _as_error(err: Exception) -> psycopg2.Error:
+    """An error raised on a database thread, as the psycopg2.Error callers handle"""
+    return err if isinstance(err, psycopg2.Error) else SQLiteError(str(err))
+
+
+def _guarded(func, *args):
+    """Call a blocking function, raising whatever fails as a psycopg2.Error"""
+    try:
+        return func(*args)
+    except Exception as err:  # pylint: disable=broad-except
+        raise _as_error(err) from err
+
+
+def _iso(value):
+    """A date, time or datetime as the ISO text it is stored as, anything else as it is"""
+    return value.isoformat() if isinstance(value, (date, time)) else value
+
+
+def _as_date(value) -> Optional[date]:
+    """A date, also from ISO text, which postgreSQL would cast"""
+    return date.fromisoformat(value) if isinstance(value, str) else value
+
+
+def _as_time(value) -> Optional[time]:
+    """A time, also from ISO text, which postgreSQL would cast"""
+    return time.fromisoformat(value) if isinstance(value, str) else value
+
+
+# the filter columns the repository takes dates and times for
+FILTER_TYPES: Dict[str, Callable] = {"game_date": _as_date, "game_time": _as_time}
+
+
+@lru_cache(maxsize=None)
+def _converters(description) -> Tuple[Tuple[int, Callable], ...]:
+    """The positions of a result's columns stored as text, with their converter"""
+    return tuple(
+        (i, CONVERTERS[column[0]])
+        for i, column in enumerate(description)
+        if column[0] in CONVERTERS
+    )
+
+
+def _convert_row(cursor: sqlite3.Cursor, row: tuple) -> tuple:
+    """Row factory of every connection, turning stored ISO text back into values"""
+    converters = _converters(cursor.description)
+    if not converters:
+        return row
+    values = list(row)
+    for i, convert in converters:
+        if values[i] is not None:
+            values[i] = convert(values[i])
+    return tuple(values)
+
+
+# the repository's query functions, by name, as this backend implements them
+_READS: Dict[str, Callable] = {}
+_WRITES: Dict[str, Callable] = {}
+_STREAMS: Dict[str, Callable] = {}
+
+
+def _read(func: Callable) -> Callable:
+    _READS[func.__name__] = func
+    return func
+
+
+def _write(func: Callable) -> Callable:
+    _WRITES[func.__name__] = func
+    return func
+
+
+def _stream(func: Callable) -> Callable:
+    _STREAMS[func.__name__] = func
+    return func
+
+
+def _ids(values) -> str:
+    """A list of ids as one JSON parameter, read back with json_each"""
+    return json.dumps(list(values))
+
+
+@_write
+def apply_migrations(conn) -> int:
+    """Bring the schema up to date, returns the resulting schema version"""
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    for migration_version, description, statements in MIGRATIONS:
+        if migration_version <= version:
+            continue
+        logger.info("Applying schema migration %s: %s", migration_version, description)
+        for statement in statements:
+            conn.execute(statement)
+        # part of the write's transaction, like the schema changes
+        conn.execute(f"PRAGMA user_version = {migration_version:d}")
+        version = migration_version
+    return version
+
+
+@_write
+def _insert_event(
+    conn,
+    guild_id: int,
+    channel_id: Optional[int],
+    game_type: str,
+    game_date: date,
+    game_time: time,
+    duration_minutes: int = DEFAULT_DURATION_MINUTES,
+) -> int:
+    return conn.execute(
+        """INSERT INTO paps_table (guild_id, channel_id, game_type, game_date, game_time,
+        duration_minutes) VALUES (?, ?, ?, ?, ?, ?) RETURNING game_id""",
+        (
+            guild_id,
+            channel_id,
+            game_type,
+            _iso(_as_date(game_date)),
+            _iso(_as_time(game_time)),
+            duration_minutes,
+        ),
+    ).fetchone()[0]
+
+
+@_write
+def _copy_events(
+    conn, guild_id: int, channel_id: Optional[int], rows
+) -> List[EventRow]:
+    """Insert the rows one by one, inside the batch's single transaction"""
+    inserted = []
+    for game_type, game_date, game_time in rows:
+        inserted.append(
+            conn.execute(
+                f"""INSERT INTO paps_table (guild_id, channel_id, game_type, game_date,
+                game_time) VALUES (?, ?, ?, ?, ?) RETURNING {queries.EVENT_COLUMNS}""",
+                (
+                    guild_id,
+                    channel_id,
+                    game_type,
+                    _iso(_as_date(game_date)),
+                    _iso(_as_time(game_time)),
+                ),
+            ).fetchone()
+        )
+    return inserted
+
+
+@lru_cache(maxsize=None)
+def _page_sql(table: str, column: Optional[str], mode: str) -> str:
+    """The list-events query of queries.EVENT_PAGES, with sqlite placeholders"""
+    conditions = ["guild_id = ?"]
+    if column is not None:
+        conditions.append(f"{column} = ?")
+    if mode != "first":
+        op = "<" if mode == "before" else ">"
+        conditions.append(f"(game_date, game_time, game_id) {op} (?, ?, ?)")
+    order = "DESC" if mode == "before" else "ASC"
+    return f"""SELECT {queries.EVENT_COLUMNS} FROM {table} WHERE {' AND '.join(conditions)}
+    ORDER BY game_date {order}, game_time {order}, game_id {order} LIMIT ?"""
+
+
+@_read
+def _select_events_page(
+    conn,
+    guild_id: int,
+    column: Optional[str],
+    value,
+    cursor: Optional[PageCursor],
+    backwards: bool,
+    limit: int,
+    archived: bool = False,
+) -> EventPage:
+    params: tuple = (guild_id,)
+    if column is not None:
+        # typed as postgreSQL would cast it, series occurrences are matched against it too
+        value = FILTER_TYPES.get(column, _iso)(value)
+        params += (_iso(value),)
+    if cursor is not None:
+        params += tuple(map(_iso, cursor))
+    params += (limit + 1,)
+    mode = "first" if cursor is None else "before" if backwards else "after"
+    table = "paps_archive" if archived else "paps_table"
+    rows = conn.execute(_page_sql(table, column, mode), params).fetchall()
+    recurrences = []
+    if not archived:
+        recurrences = _fetch_series(conn, "guild_id = ?", (guild_id,))
+    return merge_page(rows, recurrences, column, value, cursor, backwards, limit)
+
+
+@_stream
+def _open_event_stream(
+    conn, guild_id: int, column: Optional[str], value, batch: int, archived: bool
+):
+    table = "paps_archive" if archived else "paps_table"
+    query = f"SELECT {queries.EVENT_COLUMNS} FROM {table} WHERE guild_id = ?"
+    params: tuple = (guild_id,)
+    if column is not None:
+        # column names come from the fixed set in EventRepository._pick_filter, never from users
+        query += f" AND {column} = ?"
+        params += (_iso(FILTER_TYPES.get(column, _iso)(value)),)
+    cur = conn.cursor()
+    cur.arraysize = batch
+    return cur.execute(query + " ORDER BY game_date, game_time, game_id", params)
+
+
+def _owned_guilds(shards: Optional[Tuple[int, List[int]]]) -> Tuple[str, tuple]:
+    """Condition on guild_id matching the shards of this process, with its params"""
+    if shards is None:
+        return "1", ()
+    # discord's shard formula, see sharding.shard_for_guild
+    return "(guild_id >> 22) % ? IN (SELECT value FROM json_each(?))", (
+        shards[0],
+        _ids(shards[1]),
+    )
+
+
+@_stream
+def _open_all_events_stream(conn, shards, batch: int):
+    owned, params = _owned_guilds(shards)
+    cur = conn.cursor()
+    cur.arraysize = batch
+    return cur.execute(
+        "SELECT guild_id, game_id, game_type, game_date, game_time, duration_minutes"
+        f" FROM paps_table WHERE {owned}",
+        params,
+    )
+
+
+@_write
+def _archive_events(conn, before: date, batch: int) -> List[Tuple[int, int]]:
+    """Move up to batch events dated before a day into paps_archive, with their signups"""
+    picked = [
+        row[0]
+        for row in conn.execute(
+            "SELECT game_id FROM paps_table WHERE game_date < ? ORDER BY game_date LIMIT ?",
+            (_iso(before), batch),
+        )
+    ]
+    if not picked:
+        return []
+    conn.execute(
+        """INSERT INTO paps_archive (game_id, guild_id, channel_id, game_type, game_date,
+        game_time, duration_minutes, message_id, attendees)
+        SELECT p.game_id, p.guild_id, p.channel_id, p.game_type, p.game_date, p.game_time,
+        p.duration_minutes, p.message_id, (
+            SELECT json_group_object(a.user_id, a.status)
+            FROM paps_attendees a WHERE a.game_id = p.game_id
+            HAVING count(*) > 0
+        ) FROM paps_table p WHERE p.game_id IN (SELECT value FROM json_each(?))""",
+        (_ids(picked),),
+    )
+    return conn.execute(
+        """DELETE FROM paps_table WHERE game_id IN (SELECT value FROM json_each(?))
+        RETURNING guild_id, game_id""",
+        (_ids(picked),),
+    ).fetchall()
+
+
+@_write
+def _delete_event(conn, guild_id: int, game_id: int) -> bool:
+    return (
+        conn.execute(
+            "DELETE FROM paps_table WHERE game_id = ? AND guild_id = ?",
+            (game_id, guild_id),
+        ).rowcount
+        > 0
+    )
+
+
+@_write
+def _claim_legacy_events(
+    conn, guild_id: int
+) -> List[Tuple[EventRow, Optional[int], int]]:
+    for table in ("paps_votes", "paps_archive"):
+        conn.execute(
+            f"UPDATE {table} SET guild_id = ? WHERE guild_id = ?",
+            (guild_id, LEGACY_GUILD_ID),
+        )
+    rows = conn.execute(
+        """UPDATE paps_table SET guild_id = ? WHERE guild_id = ?
+        RETURNING game_id, game_type, game_date, game_time, channel_id, duration_minutes""",
+        (guild_id, LEGACY_GUILD_ID),
+    ).fetchall()
+    return [(row[:4], row[4], row[5]) for row in rows]
+
+
+@_write
+def _update_event(
+    conn,
+    guild_id: int,
+    game_id: int,
+    game_type: Optional[str],
+    game_date,
+    game_time,
+    duration_minutes: Optional[int],
+) -> Optional[Tuple[EventRow, Optional[int]]]:
+    """Set every given field in one statement, None leaves a field as it is"""
+    row = conn.execute(
+        f"""UPDATE paps_table SET game_type = COALESCE(?, game_type),
+        game_date = COALESCE(?, game_date), game_time = COALESCE(?, game_time),
+        duration_minutes = COALESCE(?, duration_minutes)
+        WHERE game_id = ? AND guild_id = ? RETURNING {queries.EVENT_COLUMNS}, channel_id""",
+        (
+            game_type,
+            _iso(_as_date(game_date)),
+            _iso(_as_time(game_time)),
+            duration_minutes,
+            game_id,
+            guild_id,
+        ),
+    ).fetchone()
+    return None if row is None else (row[:4], row[4])
+
+
+@_write
+def _insert_vote(conn, vote: VoteRow) -> None:
+    conn.execute(
+        """INSERT INTO paps_votes (message_id, guild_id, channel_id, game_type, game_date,
+        game_time, count_limit_success, count_limit_fail, deadline, thumbs_up, thumbs_down,
+        duration_minutes) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+        tuple(map(_iso, vote)),
+    )
+
+
+@_write
+def _update_vote_tally(conn, message_id: int, thumbs_up: int, thumbs_down: int) -> None:
+    conn.execute(
+        """UPDATE paps_votes SET thumbs_up = ?, thumbs_down = ?
+        WHERE message_id = ? AND status = 'open'""",
+        (thumbs_up, thumbs_down, message_id),
+    )
+
+
+def _close(conn, message_id: int, status: str):
+    return conn.execute(
+        """UPDATE paps_votes SET status = ? WHERE message_id = ? AND status = 'open'
+        RETURNING guild_id, channel_id, game_type, game_date, game_time, duration_minutes""",
+        (status, message_id),
+    ).fetchone()
+
+
+@_write
+def _close_vote(conn, message_id: int, status: str) -> bool:
+    return _close(conn, message_id, status) is not None
+
+
+@_write
+def _pass_vote(conn, message_id: int) -> Optional[Tuple[int, int, EventRow, int]]:
+    """Close the vote and insert its event, in the same transaction"""
+    event = _close(conn, message_id, "passed")
+    if event is None:
+        return None
+    row = conn.execute(
+        f"""INSERT INTO paps_table (guild_id, channel_id, game_type, game_date, game_time,
+        duration_minutes) VALUES (?, ?, ?, ?, ?, ?) RETURNING {queries.EVENT_COLUMNS}""",
+        tuple(map(_iso, event)),
+    ).fetchone()
+    return event[0], event[1], row, event[5]
+
+
+@_read
+def _select_upcoming_events(
+    conn, since: date, shards
+) -> List[Tuple[int, int, EventRow]]:
+    owned, params = _owned_guilds(shards)
+    rows = conn.execute(
+        f"""SELECT guild_id, channel_id, game_id, game_type, game_date, game_time
+        FROM paps_table WHERE game_date >= ? AND channel_id IS NOT NULL AND {owned}""",
+        (_iso(since), *params),
+    )
+    return [(row[0], row[1], row[2:]) for row in rows]
+
+
+@_read
+def _select_open_votes(conn, shards) -> List[VoteRow]:
+    owned, params = _owned_guilds(shards)
+    return conn.execute(
+        f"""SELECT message_id, guild_id, channel_id, game_type, game_date, game_time,
+        count_limit_success, count_limit_fail, deadline, thumbs_up, thumbs_down,
+        duration_minutes FROM paps_votes WHERE status = 'open' AND {owned}""",
+        params,
+    ).fetchall()
+
+
+@_write
+def _set_event_message(conn, game_id: int, message_id: int) -> None:
+    conn.execute(
+        "UPDATE paps_table SET message_id = ? WHERE game_id = ?", (message_id, game_id)
+    )
+
+
+@_read
+def _select_event_messages(conn, since: date, shards) -> List[Tuple[int, int]]:
+    owned, params = _owned_guilds(shards)
+    return conn.execute(
+        f"""SELECT message_id, game_id FROM paps_table
+        WHERE game_date >= ? AND message_id IS NOT NULL AND {owned}""",
+        (_iso(since), *params),
+    ).fetchall()
+
+
+@_write
+def _write_attendees(
+    conn, upserts: List[Tuple[int, int, str]], removals: List[Tuple[int, int, str]]
+) -> None:
+    """Apply a batch of signups, a statement per kind of change"""
+    # the condition skips signups for events deleted since the reaction arrived
+    conn.executemany(
+        f"""INSERT INTO paps_attendees (game_id, user_id, status)
+        SELECT ?1, ?2, ?3 WHERE EXISTS (SELECT 1 FROM paps_table WHERE game_id = ?1)
+        ON CONFLICT (game_id, user_id)
+        DO UPDATE SET status = excluded.status, updated_at = {NOW}""",
+        upserts,
+    )
+    conn.executemany(
+        "DELETE FROM paps_attendees WHERE game_id = ? AND user_id = ? AND status = ?",
+        removals,
+    )
+
+
+@_read
+def _select_attendees(conn, guild_id: int, game_id: int) -> List[Tuple[int, str]]:
+    return conn.execute(
+        """SELECT a.user_id, a.status FROM paps_attendees a JOIN paps_table p USING (game_id)
+        WHERE a.game_id = ? AND p.guild_id = ? ORDER BY a.updated_at, a.rowid""",
+        (game_id, guild_id),
+    ).fetchall()
+
+
+def _fetch_series(conn, condition: str, params: tuple) -> List[Recurrence]:
+    """The series matching a condition on paps_series, with their overrides"""
+    series = [
+        Series(*row)
+        for row in conn.execute(
+            f"SELECT {queries.SERIES_COLUMNS} FROM paps_series WHERE {condition}",
+            params,
+        )
+    ]
+    if not series:
+        return []
+    overrides: dict = {}
+    for row in conn.execute(
+        """SELECT series_id, occurrence_date, game_type, game_date, game_time, cancelled
+        FROM paps_series_overrides WHERE series_id IN (SELECT value FROM json_each(?))""",
+        (_ids(s.series_id for s in series),),
+    ):
+        overrides.setdefault(row[0], []).append(Override(*row[1:]))
+    return [Recurrence(s, overrides.get(s.series_id, ())) for s in series]
+
+
+@_write
+def _insert_series(conn, series: Series) -> int:
+    return conn.execute(
+        """INSERT INTO paps_series (guild_id, channel_id, game_type, start_date, game_time,
+        interval_weeks, until, count, duration_minutes)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?) RETURNING series_id""",
+        tuple(map(_iso, series[1:])),
+    ).fetchone()[0]
+
+
+@_read
+def _select_series(conn, series_id: int) -> Optional[Recurrence]:
+    found = _fetch_series(conn, "series_id = ?", (series_id,))
+    return found[0] if found else None
+
+
+@_read
+def _select_guild_series(conn, guild_id: int) -> List[Recurrence]:
+    return _fetch_series(conn, "guild_id = ?", (guild_id,))
+
+
+@_read
+def _select_all_series(conn, shards) -> List[Recurrence]:
+    owned, params = _owned_guilds(shards)
+    return _fetch_series(conn, owned, params)
+
+
+@_write
+def _upsert_override(
+    conn, guild_id: int, series_id: int, override: Override
+) -> Optional[Recurrence]:
+    """Store an override of a real occurrence of a guild's series, None if there is none"""
+    found = _fetch_series(conn, "series_id = ? AND guild_id = ?", (series_id, guild_id))
+    if not found or not found[0].is_occurrence(override.occurrence_date):
+        return None
+    conn.execute(
+        """INSERT INTO paps_series_overrides
+        (series_id, occurrence_date, game_type, game_date, game_time, cancelled)
+        VALUES (?, ?, ?, ?, ?, ?)
+        ON CONFLICT (series_id, occurrence_date) DO UPDATE SET
+        game_type = COALESCE(excluded.game_type, paps_series_overrides.game_type),
+        game_date = COALESCE(excluded.game_date, paps_series_overrides.game_date),
+        game_time = COALESCE(excluded.game_time, paps_series_overrides.game_time),
+        cancelled = excluded.cancelled""",
+        (series_id, *map(_iso, override)),
+    )
+    return found[0]
+
+
+@_write
+def _delete_series(conn, guild_id: int, series_id: int) -> bool:
+    return (
+        conn.execute(
+            "DELETE FROM paps_series WHERE series_id = ? AND guild_id = ?",
+            (series_id, guild_id),
+        ).rowcount
+        > 0
+    )
+
+
+@_write
+def _replace_availability(
+    conn, guild_id: int, user_id: int, weekday: int, ranges: List[Tuple[int, int]]
+) -> None:
+    """Replace a member's availability on a weekday with (start, end) minute ranges"""
+    conn.execute(
+        "DELETE FROM paps_availability WHERE guild_id = ? AND user_id = ? AND weekday = ?",
+        (guild_id, user_id, weekday),
+    )
+    conn.executemany(
+        """INSERT INTO paps_availability
+        (guild_id, user_id, weekday, start_minute, end_minute) VALUES (?, ?, ?, ?, ?)""",
+        [(guild_id, user_id, weekday, start, end) for start, end in ranges],
+    )
+
+
+@_write
+def _delete_availability(conn, guild_id: int, user_id: int) -> int:
+    return conn.execute(
+        "DELETE FROM paps_availability WHERE guild_id = ? AND user_id = ?",
+        (guild_id, user_id),
+    ).rowcount
+
+
+@_read
+def _select_availability(conn, guild_id: int) -> List[Tuple[int, int, int, int]]:
+    return conn.execute(
+        """SELECT user_id, weekday, start_minute, end_minute FROM paps_availability
+        WHERE guild_id = ?""",
+        (guild_id,),
+    ).fetchall()
+
+
+@_read
+def _select_state(conn, key: str) -> Optional[str]:
+    row = conn.execute(
+        "SELECT value FROM paps_bot_state WHERE key = ?", (key,)
+    ).fetchone()
+    return None if row is None else row[0]
+
+
+@_write
+def _upsert_state(conn, key: str, value: str) -> None:
+    conn.execute(
+        f"""INSERT INTO paps_bot_state (key, value) VALUES (?, ?)
+        ON CONFLICT (key) DO UPDATE SET value = excluded.value, updated_at = {NOW}""",
+        (key, value),
+    )
+
+
+@_write
+def _insert_state_if_absent(conn, key: str, value: str) -> str:
+    conn.execute(
+        """INSERT INTO paps_bot_state (key, value) VALUES (?, ?)
+        ON CONFLICT (key) DO NOTHING""",
+        (key, value),
+    )
+    return conn.execute(
+        "SELECT value FROM paps_bot_state WHERE key = ?", (key,)
+    ).fetchone()[0]
+
+
+@_read
+def _select_watermark(conn) -> str:
+    return str(conn.execute("SELECT changes FROM paps_change_counter").fetchone()[0])
+
+
+# every query function the repository hands to its pool, checked against this backend's
+_MISSING = {
+    name
+    for name, func in vars(repository).items()
+    if inspect.isfunction(func)
+    and list(inspect.signature(func).parameters)[:1] == ["conn"]
+} - (_READS.keys() | _WRITES.keys() | _STREAMS.keys())
+if _MISSING:
+    raise NotImplementedError(
+        f"{', '.join(sorted(_MISSING))} has no sqlite implementation"
+    )
+
+
+class SQLitePool:
+    """
+    Drop-in for ConnectionPool on one SQLite file in WAL mode, for a bot run
+    as a single process. Reads run on reader threads with a connection each,
+    and see the last commit without waiting for writes. Every write goes to
+    one writer thread, which commits all the writes that queued up while its
+    previous commit was syncing as one transaction, each in a savepoint of its
+    own so a failing write rolls back alone. Callers only hear back once the
+    commit holding their write is done.
+    """
+
+    # no other process shares the file, so there is nobody to tell writes apart from
+    application_name: Optional[str] = None
+
+    def __init__(
+        self,
+        path: str,
+        *,
+        readers: int = 4,
+        max_batch: int = 64,
+        busy_timeout: float = 10.0,
+    ):
+        if readers < 1 or max_batch < 1:
+            raise ValueError("readers and max_batch must be at least 1")
+        self.path = path
+        self.readers = readers
+        self.max_batch = max_batch
+        self.busy_timeout = busy_timeout
+        self._readers: "asyncio.Queue[sqlite3.Connection]" = asyncio.Queue()
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=readers, thread_name_prefix="paps-sqlite-read"
+        )
+        self._writes: "queue.SimpleQueue" = queue.SimpleQueue()
+        self._writer: Optional[threading.Thread] = None
+        self._closed = False
+
+    def connect(self, query_only: bool = False) -> sqlite3.Connection:
+        """Open a connection, blocking, with transactions managed by hand"""
+        conn = sqlite3.connect(
+            self.path,
+            timeout=self.busy_timeout,
+            isolation_level=None,
+            check_same_thread=False,
+            cached_statements=256,
+        )
+        conn.row_factory = _convert_row
+        conn.execute("PRAGMA journal_mode = WAL")
+        # in WAL mode a commit survives the process crashing, only an OS crash may lose the last ones
+        conn.execute("PRAGMA synchronous = NORMAL")
+        conn.execute("PRAGMA foreign_keys = ON")
+        if query_only:
+            conn.execute("PRAGMA query_only = ON")
+        return conn
+
+    async def in_thread(self, func, *args):
+        """Run a blocking function on a reader thread, any error raised as a psycopg2 one"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._executor, functools.partial(_guarded, func, *args)
+        )
+
+    async def open(self) -> None:
+        """Start the writer thread and open the reader connections"""
+        logger.info(
+            "Opening SQLite database %s (%s readers)...", self.path, self.readers
+        )
+        ready: concurrent.futures.Future = concurrent.futures.Future()
+        self._writer = threading.Thread(
+            target=self._write_loop, args=(ready,), name="paps-sqlite-write"
+        )
+        self._writer.start()
+        # the writer switches the file to WAL before readers open it
+        await asyncio.wrap_future(ready)
+        for _ in range(self.readers):
+            self._readers.put_nowait(await self.in_thread(self.connect, True))
+
+    async def close(self) -> None:
+        """Commit the queued writes, stop the writer and close every connection"""
+        self._closed = True
+        if self._writer is not None:
+            self._writes.put(None)
+            await asyncio.to_thread(self._writer.join)
+            self._writer = None
+        while not self._readers.empty():
+            await self.in_thread(self._readers.get_nowait().close)
+        self._executor.shutdown(wait=False)
+        logger.info("SQLite database closed.")
+
+    async def _reader(self) -> sqlite3.Connection:
+        if self._closed:
+            raise SQLiteError("the database is closed")
+        waited = perf_counter()
+        conn = await self._readers.get()
+        DB_POOL_WAIT.observe(perf_counter() - waited)
+        return conn
+
+    @staticmethod
+    def _read(conn: sqlite3.Connection, func, args):
+        # one snapshot for every statement of the call
+        conn.execute("BEGIN")
+        try:
+            return func(conn, *args)
+        finally:
+            conn.execute("COMMIT")
+
+    async def run(self, func, *args):
+        """Answer func(conn, *args) with this backend's function of that name"""
+        name = func.__name__
+        query = name.lstrip("_")
+        try:
+            with DB_QUERY_DURATION.time(query=query):
+                if name in _WRITES:
+                    if self._closed:
+                        raise SQLiteError("the database is closed")
+                    future: concurrent.futures.Future = concurrent.futures.Future()
+                    self._writes.put((_WRITES[name], args, future))
+                    return await asyncio.wrap_future(future)
+                conn = await self._reader()
+                try:
+                    return await self.in_thread(self._read, conn, _READS[name], args)
+                finally:
+                    self._readers.put_nowait(conn)
+        except psycopg2.Error:
+            DB_ERRORS.inc(query=query)
+            raise
+
+    async def stream(self, open_cursor, *args, batch: int) -> AsyncIterator[list]:
+        """Fetch batches from the cursor this backend's open_cursor(conn, *args) returns"""
+        name = open_cursor.__name__
+        conn = await self._reader()
+        try:
+            cur = await self.in_thread(_STREAMS[name], conn, *args)
+            async for rows in fetch_batches(self, cur, batch):
+                yield rows
+        except psycopg2.Error:
+            DB_ERRORS.inc(query=name.lstrip("_"))
+            raise
+        finally:
+            self._readers.put_nowait(conn)
+
+    def _write_loop(self, ready: concurrent.futures.Future) -> None:
+        try:
+            conn = self.connect()
+        except sqlite3.Error as err:
+            ready.set_exception(SQLiteError(str(err)))
+            return
+        ready.set_result(None)
+        stopping = False
+        try:
+            while not stopping:
+                item = self._writes.get()
+                batch = []
+                while item is not None:
+                    batch.append(item)
+                    if len(batch) == self.max_batch:
+                        break
+                    try:
+                        item = self._writes.get_nowait()
+                    except queue.Empty:
+                        break
+                stopping = item is None
+                if batch:
+                    self._commit(conn, batch)
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _commit(conn: sqlite3.Connection, batch: list) -> None:
+        """Run a batch of writes in one transaction, then tell their callers"""
+        outcomes = []
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            for func, args, future in batch:
+                if not future.set_running_or_notify_cancel():
+                    continue
+                conn.execute("SAVEPOINT paps_write")
+                try:
+                    outcomes.append((future, True, func(conn, *args)))
+                except Exception as err:  # pylint: disable=broad-except
+                    conn.execute("ROLLBACK TO paps_write")
+                    outcomes.append((future, False, _as_error(err)))
+                conn.execute("RELEASE paps_write")
+            # once per transaction, so the watermark moves with every commit that wrote
+            if any(succeeded for _, succeeded, _ in outcomes):
+                conn.execute("UPDATE paps_change_counter SET changes = changes + 1")
+            conn.execute("COMMIT")
+        except sqlite3.Error as err:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            logger.error("Could not commit %s write(s): %s", len(batch), err)
+            for _, _, future in batch:
+                if not future.done():
+                    future.set_exception(_as_error(err))
+            return
+        for future, succeeded, value in outcomes:
+            if succeeded:
+                future.set_result(value)
+            else:
+                future.set_exception(value)
+
+    def stats(self) -> Dict[str, int]:
+        """Open, idle and borrowed reader connection counts"""
+        idle = self._readers.qsize()
+        return {"size": self.readers, "idle": idle, "in_use": self.readers - idle}
+
+
+def create_sqlite_pool_from_env_vars() -> SQLitePool:
+    """Build the storage of DB_BACKEND=sqlite, a single file at DB_PATH"""
+    return SQLitePool(
+        os.getenv("DB_PATH", "paps-bot.sqlite3"),
+        readers=int(os.getenv("DB_POOL_MAX_SIZE", "4")),
+        max_batch=int(os.getenv("DB_WRITE_BATCH", "64")),
+        busy_timeout=float(os.getenv("DB_POOL_TIMEOUT", "10")),
+    )
@@ -0,0 +1,291 @@
+"""
+CSV and iCalendar import and export of events
+"""
+
+import io
+import csv
+from datetime import date, datetime, time, timezone, tzinfo
+from typing import (
+    IO,
+    AsyncIterator,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Tuple,
+    Union,
+)
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+from paps_bot.formatting import format_date
+from paps_bot.repository import EventRow
+
+# the same formats the slash commands accept
+DATE_FORMAT = "%d-%m-%Y"
+TIME_FORMAT = "%H:%M"
+CSV_HEADER = ("game_type", "game_date", "game_time")
+MAX_GAME_TYPE_LENGTH = 255
+ICS_DATETIME_FORMAT = "%Y%m%dT%H%M%S"
+
+# one validated row to import
+ImportRow = Tuple[str, date, time]
+
+
+class RejectedRow(NamedTuple):
+    """A rejected row, by its line in the uploaded file"""
+
+    line: int
+    reason: str
+
+
+class ParsedImport(NamedTuple):
+    """The valid rows of an upload, and why the others were rejected"""
+
+    rows: List[ImportRow]
+    errors: List[RejectedRow]
+
+
+def _validate(
+    line: int, game_type: str, game_date: Optional[date], game_time: Optional[time]
+) -> Union[ImportRow, RejectedRow]:
+    game_type = game_type.strip()
+    if not game_type:
+        return RejectedRow(line, "missing game type")
+    if len(game_type) > MAX_GAME_TYPE_LENGTH:
+        return RejectedRow(line, "game type is too long")
+    if game_date is None:
+        return RejectedRow(line, "missing or invalid date")
+    if game_time is None:
+        return RejectedRow(line, "missing or invalid time")
+    return game_type, game_date, game_time
+
+
+def _add(parsed: ParsedImport, checked: Union[ImportRow, RejectedRow]) -> None:
+    if isinstance(checked, RejectedRow):
+        parsed.errors.append(checked)
+    else:
+        parsed.rows.append(checked)
+
+
+def _parse_time(value: str) -> Optional[time]:
+    try:
+        return datetime.strptime(value.strip(), TIME_FORMAT).time()
+    except ValueError:
+        return None
+
+
+def parse_csv(text: str) -> ParsedImport:
+    """
+    Rows of game_type,game_date,game_time with dates as DD-MM-YYYY and times
+    as HH:MM, the header line is optional
+    """
+    parsed = ParsedImport([], [])
+    for line, record in enumerate(csv.reader(io.StringIO(text)), start=1):
+        if not record or not any(field.strip() for field in record):
+            continue
+        if line == 1 and tuple(f.strip().lower() for f in record) == CSV_HEADER:
+            continue
+        if len(record) != len(CSV_HEADER):
+            parsed.errors.append(
+                RejectedRow(line, f"expected {len(CSV_HEADER)} columns")
+            )
+            continue
+        game_type, game_date, game_time = record
+        _add(
+            parsed,
+            _validate(
+                line,
+                game_type,
+                format_date(game_date.strip(), DATE_FORMAT),
+                _parse_time(game_time),
+            ),
+        )
+    return parsed
+
+
+def _unfold(text: str) -> Iterator[Tuple[int, str]]:
+    """Content lines of an iCalendar file with their line numbers, continuations joined"""
+    current, start = None, 0
+    for number, raw in enumerate(text.splitlines(), start=1):
+        if raw[:1] in (" ", "\t") and current is not None:
+            current += raw[1:]
+            continue
+        if current is not None:
+            yield start, current
+        current, start = raw, number
+    if current is not None:
+        yield start, current
+
+
+def _parse_ics_start(
+    params: List[str], value: str
+) -> Tuple[Optional[date], Optional[time]]:
+    """DTSTART as a date and time in the bot's local timezone"""
+    if "VALUE=DATE" in (param.upper() for param in params):
+        # all-day events have no time to meet at
+        return _parse_ics_date(value), None
+    try:
+        start = datetime.strptime(value.rstrip("Z"), ICS_DATETIME_FORMAT)
+    except ValueError:
+        return None, None
+    zone: Optional[tzinfo] = None
+    if value.endswith("Z"):
+        zone = timezone.utc
+    for param in params:
+        name, _, tzid = param.partition("=")
+        if name.upper() == "TZID":
+            try:
+                zone = ZoneInfo(tzid.strip('"'))
+            except (ZoneInfoNotFoundError, ValueError):
+                return None, None
+    if zone is not None:
+        # floating times are already local, zoned ones are converted to local
+        start = start.replace(tzinfo=zone).astimezone().replace(tzinfo=None)
+    return start.date(), start.time()
+
+
+def _parse_ics_date(value: str) -> Optional[date]:
+    try:
+        return datetime.strptime(value, "%Y%m%d").date()
+    except ValueError:
+        return None
+
+
+def _unescape(value: str) -> str:
+    return (
+        value.replace("\\n", " ")
+        .replace("\\N", " ")
+        .replace("\\,", ",")
+        .replace("\\;", ";")
+        .replace("\\\\", "\\")
+    )
+
+
+def parse_ics(text: str) -> ParsedImport:
+    """Every VEVENT, its SUMMARY is the game type and DTSTART the date and time"""
+    parsed = ParsedImport([], [])
+    # the line the current VEVENT began on, None outside of one
+    begin: Optional[int] = None
+    summary = ""
+    start: Optional[Tuple[Optional[date], Optional[time]]] = None
+    for line, content in _unfold(text):
+        name, _, value = content.partition(":")
+        name, *params = name.split(";")
+        name = name.upper()
+        if name == "BEGIN" and value.upper() == "VEVENT":
+            begin, summary, start = line, "", None
+        elif begin is None:
+            continue
+        elif name == "SUMMARY":
+            summary = _unescape(value)
+        elif name == "DTSTART":
+            start = _parse_ics_start(params, value)
+        elif name == "END" and value.upper() == "VEVENT":
+            if start is None:
+                parsed.errors.append(RejectedRow(begin, "missing DTSTART"))
+            else:
+                _add(parsed, _validate(begin, summary, *start))
+            begin = None
+    return parsed
+
+
+def parse_import(filename: str, text: str) -> ParsedImport:
+    """Parse an uploaded file by its extension, .csv or .ics"""
+    if filename.lower().endswith(".ics"):
+        return parse_ics(text)
+    if filename.lower().endswith(".csv"):
+        return parse_csv(text)
+    raise ValueError("only .csv and .ics files can be imported")
+
+
+def _ics_escape(value: str) -> str:
+    return (
+        value.replace("\\", "\\\\")
+        .replace(";", "\\;")
+        .replace(",", "\\,")
+        .replace("\n", "\\n")
+    )
+
+
+ICS_HEADER = "BEGIN:VCALENDAR\r\nVERSION:2.0\r\nPRODID:-//paps-bot//events//EN\r\n"
+ICS_FOOTER = "END:VCALENDAR\r\n"
+
+
+def ics_stamp(moment: datetime) -> str:
+    """An aware datetime as an iCalendar UTC date-time"""
+    return moment.astimezone(timezone.utc).strftime(ICS_DATETIME_FORMAT) + "Z"
+
+
+def ics_event(row: EventRow, stamp: str) -> str:
+    """The VEVENT of an event row, its start is floating local time like the bot's"""
+    game_id, game_type, game_date, game_time = row
+    start = datetime.combine(game_date, game_time).strftime(ICS_DATETIME_FORMAT)
+    # every occurrence of a series carries the series' id, the date tells them apart
+    uid = game_id if game_id >= 0 else f"series{-game_id}-{game_date:%Y%m%d}"
+    return (
+        "BEGIN:VEVENT\r\n"
+        f"UID:{uid}@paps-bot\r\n"
+        f"DTSTAMP:{stamp}\r\n"
+        f"DTSTART:{start}\r\n"
+        f"SUMMARY:{_ics_escape(game_type)}\r\n"
+        "END:VEVENT\r\n"
+    )
+
+
+class EventWriter:
+    """Writes exported events to a binary file batch by batch, in txt, csv or ics"""
+
+    def __init__(self, file: IO[bytes], file_format: str):
+        if file_format not in ("txt", "csv", "ics"):
+            raise ValueError(f"unknown export format {file_format}")
+        self.file = file
+        self.file_format = file_format
+        self.count = 0
+
+    def __enter__(self) -> "EventWriter":
+        if self.file_format == "txt":
+            self.file.write(b"ID - Type - Date - Time\n")
+        elif self.file_format == "csv":
+            self.file.write(",".join(CSV_HEADER).encode() + b"\r\n")
+        else:
+            self.file.write(ICS_HEADER.encode())
+        return self
+
+    def __exit__(self, *exc) -> None:
+        if exc[0] is None and self.file_format == "ics":
+            self.file.write(ICS_FOOTER.encode())
+
+    def write(self, rows: Sequence[EventRow]) -> None:
+        """Append a batch of event rows"""
+        if self.file_format == "txt":
+            chunk = "".join(
+                f"{game_id} - {game_type} - {game_date} - {game_time}\n"
+                for game_id, game_type, game_date, game_time in rows
+            )
+        elif self.file_format == "csv":
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            for _, game_type, game_date, game_time in rows:
+                writer.writerow(
+                    (
+                        game_type,
+                        game_date.strftime(DATE_FORMAT),
+                        game_time.strftime(TIME_FORMAT),
+                    )
+                )
+            chunk = buffer.getvalue()
+        else:
+            stamp = ics_stamp(datetime.now(timezone.utc))
+            chunk = "".join(ics_event(row, stamp) for row in rows)
+        self.file.write(chunk.encode())
+        self.count += len(rows)
+
+
+async def write_events(
+    batches: AsyncIterator[List[EventRow]], file: IO[bytes], file_format: str
+) -> int:
+    """Write streamed batches of events to a file as they arrive, returns the event count"""
+    with EventWriter(file, file_format) as writer:
+        async for rows in batches:
+            writer.write(rows)
+    return writer.count
@@ -0,0 +1,159 @@
+"""
+Discord UI components for paps-bot, such as the paginated event list
+"""
+
+import io
+import logging
+import tempfile
+from typing import Any, Dict, Optional, cast
+import psycopg2
+import discord
+from paps_bot.formatting import event_label
+from paps_bot.repository import EventPage, EventRepository
+from paps_bot.transfer import write_events
+
+# get the bot logger
+logger = logging.getLogger("discord")
+
+# Discord allows 25 fields per embed, one of which is the header
+PAGE_SIZE = 10
+# spool exports in memory up to this size before spilling to a temporary file
+EXPORT_SPOOL_SIZE = 1024 * 1024
+
+
+def events_embed(page: EventPage, page_number: int) -> discord.Embed:
+    """Build the embed listing one page of events"""
+    embed = discord.Embed(title="Events Results:", color=discord.Color.blue())
+    embed.add_field(
+        name="ID - Type - Date - Location", value="\u200b", inline=False
+    )  # Header field
+    for game_id, game_type, game_date, game_time in page.rows:
+        row_info = f"{event_label(game_id)} - {game_type} - {game_date} - {game_time}"
+        embed.add_field(name="\u200b", value=row_info, inline=False)
+    embed.set_footer(text=f"Page {page_number + 1}")
+    return embed
+
+
+class EventPager(discord.ui.View):
+    """
+    Previous/next buttons for the list-events embed. Each click fetches a
+    single keyset page, so neither latency nor memory grows with the table.
+    """
+
+    def __init__(
+        self,
+        repository: EventRepository,
+        guild_id: int,
+        filters: Dict[str, Any],
+        page: EventPage,
+    ):
+        super().__init__(timeout=300)
+        self.repository = repository
+        self.guild_id = guild_id
+        self.filters = filters
+        self.page = page
+        self.page_number = 0
+        self.message: Optional[discord.Message] = None
+        self._update_buttons(has_next=page.has_more)
+
+    def _update_buttons(self, has_next: bool) -> None:
+        self.previous_page.disabled = self.page_number == 0
+        self.next_page.disabled = not has_next
+
+    async def _show(
+        self, interaction: discord.Interaction, page: EventPage, has_next: bool
+    ) -> None:
+        self.page = page
+        self._update_buttons(has_next)
+        await interaction.response.edit_message(
+            embed=events_embed(page, self.page_number), view=self
+        )
+
+    async def on_timeout(self) -> None:
+        """Grey out the buttons once the view stops listening"""
+        for item in self.children:
+            if isinstance(item, discord.ui.Button):
+                item.disabled = True
+        if self.message is not None:
+            try:
+                await self.message.edit(view=self)
+            except discord.DiscordException:
+                pass
+
+    @discord.ui.button(label="Previous", style=discord.ButtonStyle.secondary)
+    async def previous_page(
+        self, interaction: discord.Interaction, _button: discord.ui.Button
+    ):
+        """Show the page before the current one"""
+        try:
+            page = await self.repository.find_events(
+                self.guild_id, **self.filters, before=self.page.first, limit=PAGE_SIZE
+            )
+        except psycopg2.Error as err:
+            logger.error("======== An error has occured: =======\n %s", str(err))
+            await interaction.response.send_message(
+                f"An error occurred: {str(err)}", ephemeral=True
+            )
+            return
+        self.page_number = max(self.page_number - 1, 0)
+        if not page.has_more:
+            # events were deleted before this page, so it is now the first one
+            self.page_number = 0
+        await self._show(interaction, page, has_next=True)
+
+    @discord.ui.button(label="Next", style=discord.ButtonStyle.primary)
+    async def next_page(
+        self, interaction: discord.Interaction, _button: discord.ui.Button
+    ):
+        """Show the page after the current one"""
+        try:
+            page = await self.repository.find_events(
+                self.guild_id, **self.filters, after=self.page.last, limit=PAGE_SIZE
+            )
+        except psycopg2.Error as err:
+            logger.error("======== An error has occured: =======\n %s", str(err))
+            await interaction.response.send_message(
+                f"An error occurred: {str(err)}", ephemeral=True
+            )
+            return
+        self.page_number += 1
+        await self._show(interaction, page, has_next=page.has_more)
+
+    @discord.ui.button(label="Export", style=discord.ButtonStyle.secondary)
+    async def export(
+        self, interaction: discord.Interaction, _button: discord.ui.Button
+    ):
+        """Send every matching event as a text attachment"""
+        await interaction.response.defer(ephemeral=True, thinking=True)
+        await send_export(interaction, self.repository, self.guild_id, self.filters)
+
+
+async def send_export(
+    interaction: discord.Interaction,
+    repository: EventRepository,
+    guild_id: int,
+    filters: Dict[str, Any],
+    file_format: str = "txt",
+) -> None:
+    """
+    Stream every matching event from a server-side cursor into an attachment,
+    as a followup to an already deferred interaction
+    """
+    with tempfile.SpooledTemporaryFile(max_size=EXPORT_SPOOL_SIZE) as export:
+        try:
+            count = await write_events(
+                repository.stream_events(guild_id, **filters), export, file_format
+            )
+        except psycopg2.Error as err:
+            logger.error("======== An error has occured: =======\n %s", str(err))
+            await interaction.followup.send(f"An error occurred: {str(err)}")
+            return
+        export.seek(0)
+        logger.info("Exporting %s event(s) to discord...", count)
+        await interaction.followup.send(
+            f"Exported {count} event(s).",
+            # a binary file object, whether still in memory or spilled to disk
+            file=discord.File(
+                cast(io.BufferedIOBase, export), filename=f"events.{file_format}"
+            ),
+        )
@@ -0,0 +1,248 @@
+"""
+Durable event votes, routed from a single reaction handler and expired by one scheduler task
+"""
+
+import heapq
+import asyncio
+import logging
+from dataclasses import dataclass
+from datetime import date, datetime, time, timedelta, timezone
+from typing import Dict, List, Optional, Sequence, Tuple
+import psycopg2
+import discord
+from paps_bot.repository import DEFAULT_DURATION_MINUTES, EventRepository, VoteRow
+from paps_bot.rsvp import RsvpTracker
+
+# get the bot logger
+logger = logging.getLogger("discord")
+
+THUMBS_UP = "👍"
+THUMBS_DOWN = "👎"
+VOTING_PERIOD = timedelta(days=1)
+COUNT_LIMIT_SUCCESS = 1
+COUNT_LIMIT_FAIL = 1
+
+
+@dataclass
+class Vote:
+    """An open vote on a proposed event"""
+
+    message_id: int
+    guild_id: int
+    channel_id: int
+    game_type: str
+    game_date: date
+    game_time: time
+    count_limit_success: int
+    count_limit_fail: int
+    deadline: datetime
+    thumbs_up: int = 0
+    thumbs_down: int = 0
+    duration_minutes: int = DEFAULT_DURATION_MINUTES
+
+    @classmethod
+    def from_row(cls, row: VoteRow) -> "Vote":
+        """Build a vote from a paps_votes row"""
+        return cls(*row)
+
+    def as_row(self) -> VoteRow:
+        """The paps_votes row for this vote"""
+        return (
+            self.message_id,
+            self.guild_id,
+            self.channel_id,
+            self.game_type,
+            self.game_date,
+            self.game_time,
+            self.count_limit_success,
+            self.count_limit_fail,
+            self.deadline,
+            self.thumbs_up,
+            self.thumbs_down,
+            self.duration_minutes,
+        )
+
+    def outcome(self) -> Optional[str]:
+        """'passed' or 'failed' once a threshold is reached, otherwise None"""
+        if self.thumbs_up >= self.count_limit_success:
+            return "passed"
+        if self.thumbs_down >= self.count_limit_fail:
+            return "failed"
+        return None
+
+
+class VoteEngine:
+    """
+    Keeps every open vote in a dict keyed by message id, so each reaction is
+    routed with one lookup, and expires votes from a deadline min-heap.
+    """
+
+    def __init__(
+        self,
+        client: discord.Client,
+        repository: EventRepository,
+        rsvp: Optional[RsvpTracker] = None,
+    ):
+        self.client = client
+        self.repository = repository
+        self.rsvp = rsvp
+        self._open: Dict[int, Vote] = {}
+        self._deadlines: List[Tuple[datetime, int]] = []
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        # one tally write per vote at a time, so an older count never lands last
+        self._tally_locks: Dict[int, asyncio.Lock] = {}
+
+    def __len__(self) -> int:
+        return len(self._open)
+
+    def _track(self, vote: Vote) -> None:
+        self._open[vote.message_id] = vote
+        heapq.heappush(self._deadlines, (vote.deadline, vote.message_id))
+        # the new deadline may be sooner than the one the scheduler sleeps towards
+        self._wakeup.set()
+
+    async def resume(self, rows: Optional[Sequence[VoteRow]] = None) -> None:
+        """
+        Load every open vote from the database, or the rows of a state
+        snapshot, and start the expiry scheduler
+        """
+        if rows is None:
+            rows = await self.repository.open_votes()
+        for row in rows:
+            if row[0] not in self._open:
+                self._track(Vote.from_row(row))
+        logger.info("Resumed %s open vote(s).", len(self._open))
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._expire_loop())
+
+    async def stop(self) -> None:
+        """Stop the expiry scheduler, open votes stay persisted"""
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def snapshot(self) -> List[VoteRow]:
+        """The rows of every open vote, tallies included"""
+        return [vote.as_row() for vote in self._open.values()]
+
+    async def open_vote(
+        self,
+        message: discord.Message,
+        game_type: str,
+        game_date: date,
+        game_time: time,
+        duration_minutes: int = DEFAULT_DURATION_MINUTES,
+    ) -> Vote:
+        """Persist a new vote for the given message and start routing reactions to it"""
+        if message.guild is None:
+            raise ValueError("votes are only held in guild channels")
+        vote = Vote(
+            message_id=message.id,
+            guild_id=message.guild.id,
+            channel_id=message.channel.id,
+            game_type=game_type,
+            game_date=game_date,
+            game_time=game_time,
+            count_limit_success=COUNT_LIMIT_SUCCESS,
+            count_limit_fail=COUNT_LIMIT_FAIL,
+            deadline=datetime.now(timezone.utc) + VOTING_PERIOD,
+            duration_minutes=duration_minutes,
+        )
+        await self.repository.add_vote(vote.as_row())
+        self._track(vote)
+        return vote
+
+    async def handle_reaction(
+        self, payload: discord.RawReactionActionEvent, added: bool
+    ) -> None:
+        """Count a reaction added to or removed from an open vote message"""
+        vote = self._open.get(payload.message_id)
+        user = self.client.user
+        if vote is None or user is None or payload.user_id == user.id:
+            return
+        step = 1 if added else -1
+        emoji = str(payload.emoji)
+        if emoji == THUMBS_UP:
+            vote.thumbs_up = max(vote.thumbs_up + step, 0)
+        elif emoji == THUMBS_DOWN:
+            vote.thumbs_down = max(vote.thumbs_down + step, 0)
+        else:
+            return
+
+        outcome = vote.outcome()
+        if outcome is None:
+            await self._write_tally(vote)
+            return
+        # stop routing before awaiting anything, so the vote is only decided once
+        self._forget(vote)
+        channel = self.client.get_partial_messageable(vote.channel_id)
+        try:
+            if outcome == "passed":
+                logger.info("Vote passed! Processing event to database...")
+                game_id = await self.repository.pass_vote(vote.message_id)
+                logger.warning(
+                    "========== Event added succesfully, sending to discord! ========"
+                )
+                message = await channel.send(
+                    "The event has received enough votes, and was saved! "
+                    "Sign up below if you are attending."
+                )
+                if game_id is not None and self.rsvp is not None:
+                    await self.rsvp.track_message(game_id, message)
+            else:
+                await self.repository.close_vote(vote.message_id, "failed")
+                logger.warning(
+                    "========== Vote failed, too many down-votes... =========="
+                )
+                await channel.send(
+                    "The event received too many down-votes, and will not be saved!"
+                )
+        except (psycopg2.Error, discord.DiscordException) as err:
+            logger.error("======= An error has occured: =======\n %s", str(err))
+
+    async def _write_tally(self, vote: Vote) -> None:
+        """Store the vote's counts, as they are once the previous write is done"""
+        lock = self._tally_locks.setdefault(vote.message_id, asyncio.Lock())
+        async with lock:
+            # reactions counted while waiting are included, the last write is the latest count
+            try:
+                await self.repository.update_vote_tally(
+                    vote.message_id, vote.thumbs_up, vote.thumbs_down
+                )
+            except (psycopg2.Error, discord.DiscordException) as err:
+                logger.error("======= An error has occured: =======\n %s", str(err))
+
+    def _forget(self, vote: Vote) -> None:
+        del self._open[vote.message_id]
+        # writes still waiting keep their lock, and only touch open votes
+        self._tally_locks.pop(vote.message_id, None)
+
+    async def _expire(self, vote: Vote) -> None:
+        self._forget(vote)
+        logger.warning("======= The voting period has ended(Timeout) ========")
+        try:
+            if await self.repository.close_vote(vote.message_id, "expired"):
+                channel = self.client.get_partial_messageable(vote.channel_id)
+                await channel.send("Voting period has ended")
+        except (psycopg2.Error, discord.DiscordException) as err:
+            logger.error("======= An error has occured: =======\n %s", str(err))
+
+    async def _expire_loop(self) -> None:
+        """Sleep until the nearest deadline, expire due votes, repeat"""
+        while True:
+            self._wakeup.clear()
+            now = datetime.now(timezone.utc)
+            while self._deadlines and self._deadlines[0][0] <= now:
+                _, message_id = heapq.heappop(self._deadlines)
+                vote = self._open.get(message_id)
+                # decided votes are dropped lazily as their deadline comes up
+                if vote is not None:
+                    await self._expire(vote)
+            timeout = None
+            if self._deadlines:
+                timeout = (self._deadlines[0][0] - now).total_seconds()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
@@ -0,0 +1,16 @@
+"""
+Shared setup for the tests
+"""
+
+import os
+
+# the bot module builds a postgreSQL pool on import unless DB_BACKEND=sqlite,
+# the tests never connect to it
+for name, value in (
+    ("DB_HOST", "localhost"),
+    ("DB_NAME", "paps"),
+    ("DB_USER", "paps"),
+    ("DB_PASSWORD", "paps"),
+    ("DB_PORT", "5432"),
+):
+    os.environ.setdefault(name, value)
@@ -0,0 +1,43 @@
+"""
+Tests for the prefix index behind autocomplete
+"""
+
+from paps_bot.autocomplete import PrefixIndex
+
+
+def test_search_is_case_insensitive_and_sorted():
+    index = PrefixIndex()
+    for value in ("Dnd", "cpr", "DnD Oneshot", "chess"):
+        index.add(value)
+    assert index.search("d") == ["Dnd", "DnD Oneshot"]
+    assert index.search("C") == ["chess", "cpr"]
+    assert index.search("") == ["chess", "cpr", "Dnd", "DnD Oneshot"]
+    assert not index.search("x")
+
+
+def test_values_keep_their_first_spelling():
+    index = PrefixIndex()
+    index.add("Dnd")
+    index.add("DND")
+    assert len(index) == 1
+    assert index.search("dnd") == ["Dnd"]
+
+
+def test_values_are_counted_until_the_last_is_removed():
+    index = PrefixIndex()
+    index.add("dnd")
+    index.add("dnd")
+    index.remove("dnd")
+    assert index.search("d") == ["dnd"]
+    index.remove("dnd")
+    assert not index.search("d")
+    assert len(index) == 0
+    index.remove("dnd")
+
+
+def test_search_stops_at_the_limit():
+    index = PrefixIndex()
+    for i in range(30):
+        index.add(f"game {i:02}")
+    assert index.search("game", limit=3) == ["game 00", "game 01", "game 02"]
+    assert len(index.search("game")) == 25
@@ -0,0 +1,14 @@
+"""
+Smoke test of the offline benchmark harness on the in-memory backend
+"""
+
+import asyncio
+from benchmarks.commands import main, parse_args
+
+
+def test_every_scenario_runs_without_errors():
+    results = asyncio.run(main(parse_args(["--events", "50", "--operations", "20"])))
+    assert results
+    for result in results:
+        assert result.errors == 0, result.name
+        assert len(result.latencies) == 20
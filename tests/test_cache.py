@@ -0,0 +1,101 @@
+"""
+Tests for the event cache keys and invalidation
+"""
+
+from datetime import date, time
+from paps_bot.cache import EventCache, filter_key, keys_for_row
+from paps_bot.repository import EventPage
+
+GUILD = 1
+ROW = (5, "dnd", date(2030, 1, 7), time(18, 0))
+
+
+def test_filter_key_normalises_equal_filters():
+    assert filter_key(GUILD, "game_id", "5") == filter_key(GUILD, "game_id", 5)
+    assert filter_key(GUILD, "game_time", "18:00") == filter_key(
+        GUILD, "game_time", time(18, 0)
+    )
+    assert filter_key(GUILD, "game_date", "2030-01-07") == filter_key(
+        GUILD, "game_date", date(2030, 1, 7)
+    )
+    assert filter_key(GUILD, None, "ignored") == (GUILD, None, None)
+
+
+def test_filter_key_keeps_unparseable_values():
+    assert filter_key(GUILD, "game_id", "five") == (GUILD, "game_id", "five")
+
+
+def test_keys_for_row_cover_every_filter():
+    assert set(keys_for_row(GUILD, ROW)) == {
+        (GUILD, None, None),
+        (GUILD, "game_id", 5),
+        (GUILD, "game_type", "dnd"),
+        (GUILD, "game_date", date(2030, 1, 7)),
+        (GUILD, "game_time", time(18, 0)),
+    }
+
+
+def test_get_returns_the_stored_page():
+    cache = EventCache()
+    page = EventPage([ROW], False)
+    key = filter_key(GUILD, "game_type", "dnd")
+    cache.put(key, page, cache.generation, page=(None, 10))
+    assert cache.get(key, (None, 10)) is page
+    assert cache.get(key, ("other", 10)) is None
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+
+def test_put_drops_reads_that_raced_a_write():
+    cache = EventCache()
+    key = filter_key(GUILD, None, None)
+    generation = cache.generation
+    cache.invalidate(filter_key(GUILD, "game_id", 9))
+    cache.put(key, EventPage([ROW], False), generation)
+    assert cache.get(key) is None
+
+
+def test_expired_entries_are_misses():
+    cache = EventCache(ttl=0)
+    key = filter_key(GUILD, None, None)
+    cache.put(key, EventPage([ROW], False), cache.generation)
+    assert cache.get(key) is None
+    assert len(cache) == 0
+
+
+def test_least_recently_used_entries_are_evicted():
+    cache = EventCache(max_entries=2)
+    keys = [filter_key(GUILD, "game_id", i) for i in range(3)]
+    cache.put(keys[0], EventPage([], False), cache.generation)
+    cache.put(keys[1], EventPage([], False), cache.generation)
+    cache.get(keys[0])
+    cache.put(keys[2], EventPage([], False), cache.generation)
+    assert cache.get(keys[1]) is None
+    assert cache.get(keys[0]) is not None
+    assert cache.stats()["evictions"] == 1
+
+
+def test_invalidate_game_drops_old_and_new_matches():
+    cache = EventCache()
+    holding = filter_key(GUILD, "game_type", "dnd")
+    moved_to = filter_key(GUILD, "game_type", "cpr")
+    unrelated = filter_key(GUILD, "game_type", "chess")
+    other_guild = filter_key(2, "game_type", "dnd")
+    cache.put(holding, EventPage([ROW], False), cache.generation)
+    cache.put(moved_to, EventPage([], False), cache.generation)
+    cache.put(unrelated, EventPage([], False), cache.generation)
+    cache.put(other_guild, EventPage([ROW], False), cache.generation)
+    cache.invalidate_game(GUILD, 5, (5, "cpr", ROW[2], ROW[3]))
+    assert cache.get(holding) is None
+    assert cache.get(moved_to) is None
+    assert cache.get(unrelated) is not None
+    assert cache.get(other_guild) is not None
+
+
+def test_invalidate_guild_keeps_other_guilds():
+    cache = EventCache()
+    cache.put(filter_key(GUILD, None, None), EventPage([], False), cache.generation)
+    cache.put(filter_key(2, None, None), EventPage([], False), cache.generation)
+    cache.invalidate_guild(GUILD)
+    assert cache.get(filter_key(GUILD, None, None)) is None
+    assert cache.get(filter_key(2, None, None)) is not None
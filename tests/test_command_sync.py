@@ -0,0 +1,66 @@
+"""
+Tests for syncing the command tree only when its fingerprint changed
+"""
+
+import asyncio
+from paps_bot.command_sync import command_tree_fingerprint, sync_command_tree
+
+
+class StubCommand:
+    def __init__(self, name, description="a command"):
+        self.payload = {"name": name, "description": description, "type": 1}
+
+    def to_dict(self):
+        return dict(self.payload)
+
+
+class StubTree:
+    """Counts the uploads to discord"""
+
+    def __init__(self, *commands):
+        self.commands = list(commands)
+        self.syncs = 0
+
+    def get_commands(self):
+        return self.commands
+
+    async def sync(self):
+        self.syncs += 1
+        return self.commands
+
+
+class StubRepository:
+    def __init__(self):
+        self.state = {}
+
+    async def get_state(self, key):
+        return self.state.get(key)
+
+    async def set_state(self, key, value):
+        self.state[key] = value
+
+
+def test_the_fingerprint_ignores_registration_order():
+    hello, vote = StubCommand("hello"), StubCommand("vote")
+    assert command_tree_fingerprint(StubTree(hello, vote)) == command_tree_fingerprint(
+        StubTree(vote, hello)
+    )
+    assert command_tree_fingerprint(StubTree(hello)) != command_tree_fingerprint(
+        StubTree(StubCommand("hello", "changed"))
+    )
+
+
+def test_unchanged_trees_are_not_uploaded_again():
+    async def scenario():
+        repository = StubRepository()
+        tree = StubTree(StubCommand("hello"))
+        assert await sync_command_tree(tree, repository, 1)
+        assert not await sync_command_tree(tree, repository, 1)
+        assert await sync_command_tree(tree, repository, 1, force=True)
+        # another bot sharing the database keeps its own fingerprint
+        assert await sync_command_tree(tree, repository, 2)
+        tree.commands.append(StubCommand("vote"))
+        assert await sync_command_tree(tree, repository, 1)
+        assert tree.syncs == 4
+
+    asyncio.run(scenario())
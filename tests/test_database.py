@@ -0,0 +1,110 @@
+"""
+Tests for the pooled, non-blocking database connections
+"""
+
+import asyncio
+import psycopg2
+import pytest
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE, TRANSACTION_STATUS_INTRANS
+from paps_bot import database
+from paps_bot.database import ConnectionPool, PoolTimeout
+
+
+class FakeConnection:
+    def __init__(self):
+        self.closed = 0
+        self.status = TRANSACTION_STATUS_IDLE
+        self.rollbacks = 0
+
+    def get_transaction_status(self):
+        return self.status
+
+    def rollback(self):
+        self.rollbacks += 1
+        self.status = TRANSACTION_STATUS_IDLE
+
+    def close(self):
+        self.closed = 1
+
+
+@pytest.fixture(name="connections")
+def fake_connect(monkeypatch):
+    opened = []
+
+    def connect(*args, **kwargs):
+        opened.append(FakeConnection())
+        return opened[-1]
+
+    monkeypatch.setattr(database.psycopg2, "connect", connect)
+    return opened
+
+
+def test_run_hands_a_pooled_connection_to_the_function(connections):
+    async def scenario():
+        pool = ConnectionPool("dsn", min_size=1, max_size=2)
+        await pool.open()
+        try:
+            assert await pool.run(lambda conn, value: (conn, value), 7) == (
+                connections[0],
+                7,
+            )
+            # the idle connection is reused
+            await pool.run(lambda conn: None)
+            assert len(connections) == 1
+        finally:
+            await pool.close()
+        assert connections[0].closed
+
+    asyncio.run(scenario())
+
+
+def test_acquire_times_out_when_every_connection_is_borrowed(connections):
+    async def scenario():
+        pool = ConnectionPool("dsn", min_size=0, max_size=1, acquire_timeout=0.05)
+        try:
+            async with pool.connection():
+                with pytest.raises(PoolTimeout):
+                    async with pool.connection():
+                        pass
+            async with pool.connection() as conn:
+                assert conn is connections[0]
+        finally:
+            await pool.close()
+
+    asyncio.run(scenario())
+
+
+def test_broken_connections_are_dropped_and_replaced(connections):
+    async def scenario():
+        pool = ConnectionPool("dsn", min_size=0, max_size=1)
+        try:
+            with pytest.raises(psycopg2.OperationalError):
+                async with pool.connection():
+                    raise psycopg2.OperationalError("server closed the connection")
+            assert connections[0].closed
+            async with pool.connection() as conn:
+                assert conn is connections[1]
+        finally:
+            await pool.close()
+
+    asyncio.run(scenario())
+
+
+def test_open_transactions_are_rolled_back_on_checkin(connections):
+    async def scenario():
+        pool = ConnectionPool("dsn", min_size=0, max_size=1)
+        try:
+            async with pool.connection() as conn:
+                conn.status = TRANSACTION_STATUS_INTRANS
+            assert conn.rollbacks == 1
+            async with pool.connection() as again:
+                assert again is conn
+        finally:
+            await pool.close()
+
+    asyncio.run(scenario())
+
+
+def test_invalid_pool_sizes_are_rejected():
+    with pytest.raises(ValueError):
+        ConnectionPool("dsn", min_size=3, max_size=2)
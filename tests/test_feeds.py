@@ -0,0 +1,114 @@
+"""
+Tests for the in-memory calendar feeds and their conditional GET handling
+"""
+
+import asyncio
+from datetime import date, time
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import make_mocked_request
+from paps_bot.feeds import CalendarFeeds
+from paps_bot.recurrence import Recurrence, Series
+from paps_bot.repository import EventChange
+
+GUILD = 1
+ROW = (1, "dnd", date(2030, 1, 7), time(18, 0))
+
+
+class StubRepository:
+    """Streams the given rows and series, counting the reads"""
+
+    def __init__(self, rows, series=()):
+        self.rows = rows
+        self.series = {recurrence.series.series_id: recurrence for recurrence in series}
+        self.reads = 0
+        self.listeners = []
+
+    def add_listener(self, listener):
+        self.listeners.append(listener)
+
+    async def stream_events(self, guild_id):
+        self.reads += 1
+        await asyncio.sleep(0.01)
+        yield self.rows
+
+    async def guild_series(self, guild_id):
+        return list(self.series.values())
+
+    async def get_series(self, series_id):
+        return self.series.get(series_id)
+
+    def publish(self, change):
+        for listener in self.listeners:
+            listener(change)
+
+
+def get(feeds, guild_id=GUILD, token=None, **headers):
+    token = token or feeds.token(guild_id)
+    request = make_mocked_request(
+        "GET",
+        f"/feeds/{guild_id}/{token}.ics",
+        headers=headers,
+        match_info={"guild_id": str(guild_id), "token": token},
+    )
+    return feeds.handle(request)
+
+
+def test_concurrent_first_polls_read_the_feed_once():
+    async def scenario():
+        repository = StubRepository([ROW])
+        feeds = CalendarFeeds(repository, secret="secret")
+        first, second = await asyncio.gather(get(feeds), get(feeds))
+        assert repository.reads == 1
+        assert first.body == second.body
+        assert b"UID:1@paps-bot" in first.body
+
+    asyncio.run(scenario())
+
+
+def test_writes_update_the_feed_and_its_etag():
+    async def scenario():
+        repository = StubRepository([ROW])
+        feeds = CalendarFeeds(repository, secret="secret")
+        response = await get(feeds)
+        etag = response.headers["ETag"]
+        assert (await get(feeds, **{"If-None-Match": etag})).status == 304
+        repository.publish(
+            EventChange("insert", GUILD, 2, (2, "cpr", date(2030, 1, 8), time(19, 0)))
+        )
+        response = await get(feeds, **{"If-None-Match": etag})
+        assert response.status == 200
+        assert b"UID:2@paps-bot" in response.body
+        repository.publish(EventChange("delete", GUILD, 1, None))
+        assert b"UID:1@paps-bot" not in (await get(feeds)).body
+        assert repository.reads == 1
+
+    asyncio.run(scenario())
+
+
+def test_series_sessions_follow_their_rule():
+    async def scenario():
+        series = Series(5, GUILD, None, "dnd", date.today(), time(18, 0), 1, None, 2)
+        repository = StubRepository([], [Recurrence(series)])
+        feeds = CalendarFeeds(repository, secret="secret")
+        body = (await get(feeds)).body
+        assert body.count(b"UID:series5-") == 2
+        repository.series[5] = Recurrence(series._replace(sessions=3))
+        repository.publish(EventChange("series", GUILD, -5, None))
+        await asyncio.sleep(0.01)
+        assert (await get(feeds)).body.count(b"UID:series5-") == 3
+        del repository.series[5]
+        repository.publish(EventChange("series", GUILD, -5, None))
+        await asyncio.sleep(0.01)
+        assert b"UID:series5-" not in (await get(feeds)).body
+
+    asyncio.run(scenario())
+
+
+def test_wrong_tokens_are_not_found():
+    async def scenario():
+        feeds = CalendarFeeds(StubRepository([ROW]), secret="secret")
+        with pytest.raises(web.HTTPNotFound):
+            await get(feeds, token=feeds.token(2))
+
+    asyncio.run(scenario())
@@ -0,0 +1,19 @@
+"""
+Tests for the memory footprint by subsystem
+"""
+
+from paps_bot.footprint import rss_bytes, subsystem
+
+
+def test_files_are_attributed_to_their_subsystem():
+    assert subsystem("/app/paps_bot/cache.py") == "paps_bot.cache"
+    assert subsystem("/venv/lib/site-packages/discord/state.py") == "discord"
+    assert subsystem("C:\\venv\\psycopg2\\extras.py") == "psycopg2"
+    # the innermost known directory wins
+    assert subsystem("/discord/paps_bot/rsvp.py") == "paps_bot.rsvp"
+    assert subsystem("/usr/lib/python3.11/asyncio/tasks.py") == "other"
+    assert subsystem("paps_bot") == "other"
+
+
+def test_rss_is_read_where_proc_exists():
+    assert rss_bytes() >= 0
@@ -0,0 +1,38 @@
+"""
+Tests for the gateway intents and caches the bot connects with
+"""
+
+import pytest
+from paps_bot.gateway import FULL, gateway_options, gateway_options_from_env
+
+
+def test_lean_mode_keeps_only_guilds_and_reactions():
+    options = gateway_options()
+    intents = options["intents"]
+    assert intents.guilds and intents.guild_reactions
+    assert not (intents.members or intents.message_content or intents.messages)
+    assert not options["member_cache_flags"].joined
+    assert options["chunk_guilds_at_startup"] is False
+    assert options["max_messages"] is None
+
+
+def test_extra_intents_bring_their_member_cache_and_chunking():
+    options = gateway_options(extra_intents=["members"])
+    assert options["intents"].members
+    assert options["member_cache_flags"].joined
+    assert options["chunk_guilds_at_startup"] is True
+    with pytest.raises(ValueError):
+        gateway_options(extra_intents=["everything"])
+    with pytest.raises(ValueError):
+        gateway_options("huge")
+
+
+def test_full_mode_and_the_message_cache_from_env(monkeypatch):
+    monkeypatch.setenv("GATEWAY_MODE", FULL)
+    monkeypatch.setenv("MESSAGE_CACHE_SIZE", "0")
+    options = gateway_options_from_env()
+    assert options["intents"].message_content and options["intents"].members
+    assert "member_cache_flags" not in options
+    assert options["max_messages"] is None
+    monkeypatch.setenv("MESSAGE_CACHE_SIZE", "50")
+    assert gateway_options_from_env()["max_messages"] == 50
@@ -0,0 +1,51 @@
+"""
+Tests for the per call site log sampling
+"""
+
+import logging
+from paps_bot import logs
+from paps_bot.logs import SamplingFilter
+
+
+def record(lineno, level=logging.INFO):
+    return logging.LogRecord("discord", level, "bot.py", lineno, "msg", None, None)
+
+
+def test_records_past_the_burst_are_dropped():
+    sampler = SamplingFilter(rate=0.001, burst=2)
+    assert [sampler.filter(record(1)) for _ in range(4)] == [True, True, False, False]
+    assert sampler.dropped == 2
+
+
+def test_call_sites_are_sampled_apart():
+    sampler = SamplingFilter(rate=0.001, burst=1)
+    assert sampler.filter(record(1))
+    assert not sampler.filter(record(1))
+    assert sampler.filter(record(2))
+
+
+def test_warnings_and_a_zero_rate_are_never_sampled():
+    sampler = SamplingFilter(rate=0.001, burst=1)
+    assert all(sampler.filter(record(1, logging.WARNING)) for _ in range(5))
+    unlimited = SamplingFilter(rate=0)
+    assert all(unlimited.filter(record(1)) for _ in range(5))
+
+
+def test_tokens_refill_over_time(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(logs.time, "monotonic", lambda: now[0])
+    sampler = SamplingFilter(rate=2, burst=1)
+    assert sampler.filter(record(1))
+    assert not sampler.filter(record(1))
+    now[0] += 0.5
+    assert sampler.filter(record(1))
+
+
+def test_least_recently_used_sites_are_forgotten():
+    sampler = SamplingFilter(rate=0.001, burst=1, max_sites=2)
+    assert sampler.filter(record(1))
+    assert sampler.filter(record(2))
+    assert sampler.filter(record(3))
+    # site 1 was forgotten, it starts over with a full bucket
+    assert sampler.filter(record(1))
+    assert not sampler.filter(record(3))
@@ -0,0 +1,104 @@
+"""
+Tests for the Prometheus metrics and their text exposition
+"""
+
+import asyncio
+from types import SimpleNamespace
+import pytest
+from paps_bot import metrics
+from paps_bot.metrics import (
+    COMMAND_ERRORS,
+    COMMANDS_IN_FLIGHT,
+    RESTARTING_MESSAGE,
+    CommandDrain,
+    Counter,
+    Gauge,
+    Histogram,
+    Registry,
+    instrument_command,
+)
+
+
+def test_counters_and_gauges_render_one_sample_per_label_set():
+    registry = Registry()
+    counter = registry.register(Counter("jobs_total", "Jobs run", ["kind"]))
+    counter.inc(kind="a")
+    counter.inc(2, kind='say "hi"')
+    registry.gauge_callback("queue_size", "Queued jobs", lambda: 3)
+    assert registry.render() == (
+        "# HELP jobs_total Jobs run\n"
+        "# TYPE jobs_total counter\n"
+        'jobs_total{kind="a"} 1\n'
+        'jobs_total{kind="say \\"hi\\""} 2\n'
+        "# HELP queue_size Queued jobs\n"
+        "# TYPE queue_size gauge\n"
+        "queue_size 3\n"
+    )
+    with pytest.raises(ValueError):
+        registry.register(Gauge("jobs_total", "Again"))
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = Histogram("latency", "Latency", buckets=(0.1, 1))
+    for value in (0.05, 0.1, 0.5, 2):
+        histogram.observe(value)
+    assert histogram.samples() == [
+        ("latency_bucket", '{le="0.1"}', 2),
+        ("latency_bucket", '{le="1.0"}', 3),
+        ("latency_bucket", '{le="+Inf"}', 4),
+        ("latency_sum", "", 2.65),
+        ("latency_count", "", 4),
+    ]
+
+
+def test_instrumented_commands_count_their_errors():
+    interaction = SimpleNamespace(user=SimpleNamespace(id=10), guild_id=1)
+
+    @instrument_command
+    async def broken_command(Interaction):
+        assert COMMANDS_IN_FLIGHT._values[("broken_command",)] == 1
+        raise RuntimeError("boom")
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(broken_command(interaction))
+    assert COMMAND_ERRORS._values[("broken_command",)] == 1
+    assert COMMANDS_IN_FLIGHT._values[("broken_command",)] == 0
+
+
+def test_draining_waits_for_running_commands_and_turns_new_ones_away():
+    async def scenario():
+        drain = CommandDrain()
+        drain.begin()
+        drain.begin()
+        asyncio.get_running_loop().call_later(0.01, drain.end)
+        assert not await drain.drain(0.05)
+        assert drain.draining and drain.in_flight == 1
+        asyncio.get_running_loop().call_later(0.01, drain.end)
+        assert await drain.drain(1)
+
+    asyncio.run(scenario())
+
+
+class StubResponse:
+    def __init__(self):
+        self.sent = []
+
+    async def send_message(self, *args, **kwargs):
+        self.sent.append((args, kwargs))
+
+
+def test_commands_are_answered_with_a_notice_while_draining(monkeypatch):
+    response = StubResponse()
+    interaction = SimpleNamespace(
+        user=SimpleNamespace(id=10), guild_id=1, response=response
+    )
+    drain = CommandDrain()
+    drain.draining = True
+    monkeypatch.setattr(metrics, "DRAIN", drain)
+
+    @instrument_command
+    async def late_command(Interaction):
+        raise AssertionError("not while draining")
+
+    asyncio.run(late_command(interaction))
+    assert response.sent == [((RESTARTING_MESSAGE,), {"ephemeral": True})]
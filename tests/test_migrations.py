@@ -0,0 +1,95 @@
+"""
+Tests for the versioned schema migration runner
+"""
+
+from paps_bot import migrations
+from paps_bot.migrations import MIGRATIONS, apply_migrations
+
+
+class FakeCursor:
+    def __init__(self, database):
+        self.database = database
+        self.result = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def execute(self, statement, params=()):
+        self.database.statements.append(statement)
+        if statement.startswith("SELECT version FROM schema_version"):
+            self.result = [(version,) for version in sorted(self.database.versions)]
+        elif statement.startswith("SELECT 1 FROM schema_version"):
+            # the version may have been applied by another process meanwhile
+            self.database.versions |= self.database.racing
+            self.result = [(1,)] if params[0] in self.database.versions else []
+        elif statement.startswith("INSERT INTO schema_version"):
+            self.database.versions.add(params[0])
+
+    def fetchall(self):
+        return self.result
+
+    def fetchone(self):
+        return self.result[0] if self.result else None
+
+
+class FakeDatabase:
+    """Just enough of a psycopg2 connection to record the migration statements"""
+
+    def __init__(self, versions=(), racing=()):
+        self.versions = set(versions)
+        self.racing = set(racing)
+        self.statements = []
+        self.commits = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.commits += 1
+        return False
+
+    def cursor(self):
+        return FakeCursor(self)
+
+
+def test_migrations_are_numbered_in_order():
+    versions = [version for version, _, _ in MIGRATIONS]
+    assert versions == list(range(1, len(MIGRATIONS) + 1))
+    assert all(description and statements for _, description, statements in MIGRATIONS)
+
+
+def test_a_new_database_gets_every_migration():
+    database = FakeDatabase()
+    assert apply_migrations(database) == len(MIGRATIONS)
+    assert database.versions == set(range(1, len(MIGRATIONS) + 1))
+    for _, _, statements in MIGRATIONS:
+        assert all(statement in database.statements for statement in statements)
+    # one transaction to read the versions, then one per migration
+    assert database.commits == len(MIGRATIONS) + 1
+
+
+def test_only_pending_migrations_run(monkeypatch):
+    monkeypatch.setattr(
+        migrations,
+        "MIGRATIONS",
+        [(1, "first", ("CREATE first",)), (2, "second", ("CREATE second",))],
+    )
+    database = FakeDatabase(versions={1})
+    assert apply_migrations(database) == 2
+    assert "CREATE first" not in database.statements
+    assert "CREATE second" in database.statements
+
+
+def test_migrations_applied_by_another_process_are_skipped(monkeypatch):
+    monkeypatch.setattr(
+        migrations,
+        "MIGRATIONS",
+        [(1, "first", ("CREATE first",)), (2, "second", ("CREATE second",))],
+    )
+    database = FakeDatabase(racing={1})
+    assert apply_migrations(database) == 2
+    assert "CREATE first" not in database.statements
+    assert "CREATE second" in database.statements
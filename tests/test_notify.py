@@ -0,0 +1,160 @@
+"""
+Tests for applying the event changes other processes notify
+"""
+
+import os
+import json
+import asyncio
+from datetime import date, time
+from types import SimpleNamespace
+import psycopg2
+from paps_bot.notify import ChangeListener, parse_notification
+from paps_bot.repository import EventChange
+from paps_bot.sharding import ShardOwnership
+
+ROW = (1, "dnd", date(2030, 1, 7), time(18, 0))
+
+
+def payload(action="insert", origin="other", guild_id=1):
+    return json.dumps(
+        {
+            "action": action,
+            "origin": origin,
+            "guild_id": guild_id,
+            "channel_id": 10,
+            "game_id": 1,
+            "game_type": "dnd",
+            "game_date": "2030-01-07",
+            "game_time": "18:00:00",
+        }
+    )
+
+
+class StubCache:
+    def __init__(self):
+        self.clears = 0
+
+    def clear(self):
+        self.clears += 1
+
+
+class StubRepository:
+    def __init__(self, ownership=None):
+        self.cache = StubCache()
+        self.ownership = ownership or ShardOwnership()
+        self.published = []
+
+    def publish(self, change):
+        self.published.append(change)
+
+
+class FakeConnection:
+    """Watched through one end of a pipe, so the loop has a real socket to add"""
+
+    def __init__(self, fds):
+        self.fds = fds
+        self.autocommit = False
+        self.notifies = []
+
+    def cursor(self):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def execute(self, query):
+        pass
+
+    def fetchone(self):
+        return ("100:100:",)
+
+    def fileno(self):
+        return self.fds[0]
+
+    def poll(self):
+        raise psycopg2.OperationalError("server closed the connection")
+
+    def close(self):
+        pass
+
+
+class StubPool:
+    application_name = "me"
+
+    def __init__(self, fds):
+        self.fds = fds
+
+    def connect(self):
+        return FakeConnection(self.fds)
+
+    async def in_thread(self, func, *args):
+        return func(*args)
+
+
+def test_parse_notification():
+    assert parse_notification(payload()) == (
+        "other",
+        EventChange("insert", 1, 1, ROW, 10),
+    )
+    assert parse_notification(payload("delete"))[1].row is None
+
+
+def test_only_other_processes_writes_to_owned_guilds_are_applied():
+    repository = StubRepository(ShardOwnership([0], 2))
+    listener = ChangeListener(StubPool(None), repository)
+    listener._apply(payload(origin="me"))
+    listener._apply("not json")
+    # guild 1 is on shard (1 >> 22) % 2 == 0, guild 1 << 22 on shard 1
+    listener._apply(payload(guild_id=1 << 22))
+    listener._apply(payload())
+    assert repository.published == [EventChange("insert", 1, 1, ROW, 10)]
+
+
+def test_a_reconnect_clears_the_cache_and_reloads():
+    async def scenario():
+        fds = os.pipe()
+        repository = StubRepository()
+        reloads = []
+
+        async def reload():
+            reloads.append(len(reloads))
+            if len(reloads) == 1:
+                raise psycopg2.OperationalError("not yet")
+
+        listener = ChangeListener(
+            StubPool(fds), repository, reconnect_delay=0, on_reconnect=reload
+        )
+        await listener.start()
+        # the connection breaks, found when its socket turns readable
+        listener._on_readable()
+        await asyncio.sleep(0.01)
+        assert repository.cache.clears == 1
+        assert reloads == [0, 1]
+        # reloaded, a snapshot may be trusted again
+        assert await listener.watermark() == "100:100:"
+        await listener.stop()
+        for fd in fds:
+            os.close(fd)
+
+    asyncio.run(scenario())
+
+
+def test_the_watermark_is_read_after_the_queued_notifications():
+    async def scenario():
+        fds = os.pipe()
+        repository = StubRepository()
+        listener = ChangeListener(StubPool(fds), repository)
+        await listener.start()
+        listener._conn.notifies.append(SimpleNamespace(payload=payload()))
+        assert await listener.watermark() == "100:100:"
+        assert repository.published == [EventChange("insert", 1, 1, ROW, 10)]
+        listener.missed = True
+        assert await listener.watermark() is None
+        await listener.stop()
+        for fd in fds:
+            os.close(fd)
+
+    asyncio.run(scenario())
@@ -0,0 +1,66 @@
+"""
+Tests for the prepared statement registry
+"""
+
+import re
+from types import SimpleNamespace
+import pytest
+from paps_bot import queries
+
+
+class FakeCursor:
+    """Records every statement run on it"""
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.executed = []
+
+    def execute(self, query, params=None):
+        self.executed.append((query, params))
+
+
+def prepared_connection():
+    # what PreparedConnection adds to a psycopg2 connection
+    return SimpleNamespace(prepared=set())
+
+
+def test_statements_are_prepared_once_per_connection():
+    cur = FakeCursor(prepared_connection())
+    queries.execute(cur, queries.DELETE_EVENT, (7, 1))
+    queries.execute(cur, queries.DELETE_EVENT, (8, 1))
+    assert cur.executed == [
+        (f"PREPARE paps_delete_event AS {queries.DELETE_EVENT.sql}", None),
+        ("EXECUTE paps_delete_event (%s, %s)", (7, 1)),
+        ("EXECUTE paps_delete_event (%s, %s)", (8, 1)),
+    ]
+    assert cur.connection.prepared == {"paps_delete_event"}
+
+
+def test_a_reconnected_connection_prepares_again():
+    first = FakeCursor(prepared_connection())
+    queries.execute(first, queries.DELETE_EVENT, (7, 1))
+    # a broken connection is replaced by a new one, without its statements
+    second = FakeCursor(prepared_connection())
+    queries.execute(second, queries.DELETE_EVENT, (7, 1))
+    assert [query.split()[0] for query, _ in second.executed] == ["PREPARE", "EXECUTE"]
+
+
+def test_plain_connections_are_refused():
+    with pytest.raises(TypeError):
+        queries.execute(FakeCursor(object()), queries.DELETE_EVENT, (7, 1))
+
+
+def test_every_statement_takes_as_many_parameters_as_it_uses():
+    assert all(name.startswith("paps_") for name in queries.STATEMENTS)
+    for statement in queries.STATEMENTS.values():
+        used = {int(n) for n in re.findall(r"\$(\d+)", statement.sql)}
+        assert used == set(range(1, statement.params + 1)), statement.name
+
+
+def test_event_pages_by_filter_and_direction():
+    first = queries.events_page(None, False, False)
+    assert first.params == 2 and "ASC" in first.sql
+    before = queries.events_page("game_type", True, True)
+    assert "(game_date, game_time, game_id) < ($3, $4, $5)" in before.sql
+    assert "DESC" in before.sql and before.params == 6
+    assert "> ($3, $4, $5)" in queries.events_page("game_id", True, False).sql
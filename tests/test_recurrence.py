@@ -0,0 +1,82 @@
+"""
+Tests for the expansion of recurring series into occurrences
+"""
+
+from datetime import date, datetime, time
+from paps_bot.recurrence import Override, Recurrence, Series
+
+# a Monday
+START = date(2030, 1, 7)
+
+
+def weekly(interval_weeks=1, until=None, sessions=None):
+    return Series(
+        1, 10, None, "dnd", START, time(18, 0), interval_weeks, until, sessions
+    )
+
+
+def days(rows):
+    return [row[2] for row in rows]
+
+
+def test_occurrences_stop_after_the_session_count():
+    recurrence = Recurrence(weekly(sessions=3))
+    assert days(recurrence.occurrences(date(2029, 1, 1), date(2031, 1, 1))) == [
+        date(2030, 1, 7),
+        date(2030, 1, 14),
+        date(2030, 1, 21),
+    ]
+
+
+def test_occurrences_stop_at_until_and_skip_weeks():
+    recurrence = Recurrence(weekly(interval_weeks=2, until=date(2030, 2, 10)))
+    assert days(recurrence.occurrences(START, date(2031, 1, 1))) == [
+        date(2030, 1, 7),
+        date(2030, 1, 21),
+        date(2030, 2, 4),
+    ]
+
+
+def test_occurrences_are_clipped_to_the_window():
+    recurrence = Recurrence(weekly())
+    window = recurrence.occurrences(date(2030, 1, 8), date(2030, 1, 28))
+    assert days(window) == [date(2030, 1, 14), date(2030, 1, 21), date(2030, 1, 28)]
+    backwards = recurrence.occurrences(date(2030, 1, 8), date(2030, 1, 28), True)
+    assert days(backwards) == [date(2030, 1, 28), date(2030, 1, 21), date(2030, 1, 14)]
+
+
+def test_rows_carry_the_negated_series_id():
+    row = next(Recurrence(weekly()).occurrences(START, START))
+    assert row == (-1, "dnd", START, time(18, 0))
+
+
+def test_overrides_move_retype_and_cancel_occurrences():
+    recurrence = Recurrence(
+        weekly(sessions=3),
+        [
+            # the first session moves past the second one
+            Override(date(2030, 1, 7), "cpr", date(2030, 1, 15), None, False),
+            Override(date(2030, 1, 21), None, None, None, True),
+        ],
+    )
+    assert list(recurrence.occurrences(START, date(2030, 2, 1))) == [
+        (-1, "dnd", date(2030, 1, 14), time(18, 0)),
+        (-1, "cpr", date(2030, 1, 15), time(18, 0)),
+    ]
+    assert recurrence.may_have_type("cpr")
+    assert not recurrence.may_have_type("chess")
+
+
+def test_is_occurrence():
+    recurrence = Recurrence(weekly(interval_weeks=2, sessions=2))
+    assert recurrence.is_occurrence(date(2030, 1, 21))
+    assert not recurrence.is_occurrence(date(2030, 1, 14))
+    assert not recurrence.is_occurrence(date(2030, 2, 4))
+    assert not recurrence.is_occurrence(date(2029, 12, 24))
+
+
+def test_next_after_skips_the_session_under_way():
+    recurrence = Recurrence(weekly())
+    moment = datetime.combine(date(2030, 1, 14), time(18, 30)).astimezone()
+    assert recurrence.next_after(moment)[2] == date(2030, 1, 21)
+    assert Recurrence(weekly(sessions=1)).next_after(moment) is None
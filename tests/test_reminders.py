@@ -0,0 +1,112 @@
+"""
+Tests for the min-heap reminder scheduler
+"""
+
+import asyncio
+from datetime import datetime, timedelta
+from paps_bot.reminders import ReminderScheduler
+from paps_bot.repository import EventChange
+
+GUILD = 1
+CHANNEL = 10
+LEAD = timedelta(hours=1)
+
+
+class StubChannel:
+    def __init__(self, sent):
+        self.sent = sent
+
+    async def send(self, embed):
+        self.sent.append(int(embed.fields[0].value))
+
+
+class StubClient:
+    """Collects the ids of the events reminded about, in order"""
+
+    def __init__(self):
+        self.sent = []
+
+    def get_partial_messageable(self, channel_id):
+        return StubChannel(self.sent)
+
+
+class StubRepository:
+    def __init__(self, upcoming=()):
+        self.upcoming = list(upcoming)
+        self.listeners = []
+
+    def add_listener(self, listener):
+        self.listeners.append(listener)
+
+    async def upcoming_events(self, since):
+        return self.upcoming
+
+    async def all_series(self):
+        return []
+
+    def publish(self, change):
+        for listener in self.listeners:
+            listener(change)
+
+
+def row(game_id, seconds):
+    """An event whose reminder is due in the given number of seconds"""
+    start = datetime.now() + LEAD + timedelta(seconds=seconds)
+    return (game_id, "dnd", start.date(), start.time())
+
+
+def test_reminders_are_sent_in_due_time_order():
+    async def scenario():
+        client = StubClient()
+        repository = StubRepository(
+            [(GUILD, CHANNEL, row(1, 0.06)), (GUILD, CHANNEL, row(2, -60))]
+        )
+        reminders = ReminderScheduler(client, repository, LEAD)
+        await reminders.start()
+        # came due while the bot was offline, so it is not sent late
+        assert len(reminders) == 1
+        reminders.schedule(GUILD, CHANNEL, row(3, 0.02))
+        reminders.schedule(GUILD, CHANNEL, row(4, 0.04))
+        await asyncio.sleep(0.15)
+        await reminders.stop()
+        assert client.sent == [3, 4, 1]
+        assert not len(reminders)
+
+    asyncio.run(scenario())
+
+
+def test_edited_events_are_rescheduled():
+    async def scenario():
+        client = StubClient()
+        repository = StubRepository()
+        reminders = ReminderScheduler(client, repository, LEAD)
+        await reminders.start()
+        reminders.schedule(GUILD, CHANNEL, row(1, 0.02))
+        reminders.schedule(GUILD, CHANNEL, row(2, 600))
+        # an edit without a channel keeps the one the reminder already had
+        repository.publish(EventChange("update", GUILD, 1, row(1, 600)))
+        repository.publish(EventChange("update", GUILD, 2, row(2, 0.04)))
+        await asyncio.sleep(0.1)
+        await reminders.stop()
+        assert client.sent == [2]
+        assert len(reminders) == 1
+
+    asyncio.run(scenario())
+
+
+def test_cancelled_and_deleted_events_are_not_reminded():
+    async def scenario():
+        client = StubClient()
+        repository = StubRepository()
+        reminders = ReminderScheduler(client, repository, LEAD)
+        await reminders.start()
+        reminders.schedule(GUILD, CHANNEL, row(1, 0.02))
+        reminders.schedule(GUILD, CHANNEL, row(2, 0.02))
+        reminders.schedule(GUILD, CHANNEL, row(3, 0.04))
+        reminders.cancel(1)
+        repository.publish(EventChange("delete", GUILD, 2, None))
+        await asyncio.sleep(0.1)
+        await reminders.stop()
+        assert client.sent == [3]
+
+    asyncio.run(scenario())
@@ -0,0 +1,125 @@
+"""
+Tests for the repository's keyset pages, read-through cache and write notifications
+"""
+
+import asyncio
+from datetime import date, time
+from paps_bot.cache import EventCache
+from paps_bot.repository import (
+    LEGACY_GUILD_ID,
+    EventPage,
+    EventRepository,
+    _select_events_page,
+)
+
+GUILD = 1
+ROWS = [(game_id, "dnd", date(2030, 1, game_id), time(18, 0)) for game_id in (1, 2, 3)]
+
+
+class StubPool:
+    """Answers every query function by name, and counts the calls"""
+
+    def __init__(self, **results):
+        self.results = results
+        self.calls = []
+
+    async def run(self, func, *args):
+        self.calls.append(func.__name__)
+        return self.results[func.__name__]
+
+
+class FakeCursor:
+    """Returns the given rows for the first query, and records every statement"""
+
+    def __init__(self, connection, rows):
+        self.connection = connection
+        self.results = [rows]
+        self.executed = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def execute(self, query, params=None):
+        self.executed.append((query, params))
+
+    def fetchall(self):
+        # the guild has no recurring series
+        return list(self.results.pop()) if self.results else []
+
+
+class FakeConnection:
+    def __init__(self, rows):
+        self.prepared = set()
+        self.cur = FakeCursor(self, rows)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def cursor(self):
+        return self.cur
+
+
+def test_a_page_reads_one_extra_row_to_know_if_more_follow():
+    conn = FakeConnection(ROWS)
+    page = _select_events_page(conn, GUILD, None, None, None, False, 2)
+    assert page == EventPage(tuple(ROWS[:2]), True)
+    query, params = conn.cur.executed[1]
+    assert query.startswith("EXECUTE paps_events_page_all_first")
+    assert params == (GUILD, 3)
+    assert page.first == (ROWS[0][2], ROWS[0][3], 1)
+    assert page.last == (ROWS[1][2], ROWS[1][3], 2)
+
+
+def test_backward_pages_are_read_descending_and_returned_in_order():
+    cursor = (date(2030, 1, 9), time(18, 0), 9)
+    conn = FakeConnection(list(reversed(ROWS)))
+    page = _select_events_page(conn, GUILD, "game_type", "dnd", cursor, True, 5)
+    assert page == EventPage(tuple(ROWS), False)
+    assert "paps_events_page_game_type_before" in conn.prepared
+    query, params = conn.cur.executed[1]
+    assert query.startswith("EXECUTE paps_events_page_game_type_before")
+    assert params == (GUILD, "dnd") + cursor + (6,)
+
+
+def test_pages_are_cached_per_guild_and_cursor():
+    async def scenario():
+        pool = StubPool(_select_events_page=EventPage(tuple(ROWS), False))
+        repository = EventRepository(pool, cache=EventCache())
+        assert (await repository.find_events(GUILD)).rows == tuple(ROWS)
+        await repository.find_events(GUILD)
+        assert pool.calls == ["_select_events_page"]
+        await repository.find_events(2)
+        await repository.find_events(GUILD, after=(date(2030, 1, 1), time(18, 0), 1))
+        assert len(pool.calls) == 3
+
+    asyncio.run(scenario())
+
+
+def test_claimed_legacy_events_move_between_guilds():
+    async def scenario():
+        pool = StubPool(
+            _select_events_page=EventPage(tuple(ROWS), False),
+            _claim_legacy_events=[(ROWS[0], 10, 180)],
+        )
+        repository = EventRepository(pool, cache=EventCache())
+        changes = []
+        repository.add_listener(changes.append)
+        await repository.find_events(LEGACY_GUILD_ID)
+        await repository.find_events(GUILD)
+        assert await repository.claim_legacy_events(GUILD) == 1
+        assert [(change.action, change.guild_id) for change in changes] == [
+            ("delete", LEGACY_GUILD_ID),
+            ("insert", GUILD),
+        ]
+        # both guilds read their events again
+        await repository.find_events(LEGACY_GUILD_ID)
+        await repository.find_events(GUILD)
+        assert len(pool.calls) == 5
+
+    asyncio.run(scenario())
@@ -0,0 +1,56 @@
+"""
+Tests for moving past events into the archive
+"""
+
+import asyncio
+from datetime import date, timedelta
+from paps_bot.cache import EventCache
+from paps_bot.repository import EventPage, EventRepository
+from paps_bot.retention import ArchiveJob
+
+
+class StubPool:
+    """Moves batch events per archive call until none are left"""
+
+    def __init__(self, remaining):
+        self.remaining = remaining
+        self.calls = []
+
+    async def run(self, func, *args):
+        self.calls.append((func.__name__, args))
+        if func.__name__ == "_select_events_page":
+            return EventPage((), False)
+        before, batch = args
+        count = min(batch, self.remaining)
+        self.remaining -= count
+        return [(1, game_id) for game_id in range(count)]
+
+
+def test_past_events_are_archived_a_batch_at_a_time():
+    async def scenario():
+        pool = StubPool(5)
+        repository = EventRepository(pool)
+        changes = []
+        repository.add_listener(changes.append)
+        job = ArchiveJob(repository, keep=timedelta(days=30), batch=2)
+        assert await job.run_once() == 5
+        assert len(pool.calls) == 3
+        assert pool.calls[0][1] == (date.today() - timedelta(days=30), 2)
+        assert [change.action for change in changes] == ["delete"] * 5
+        # nothing left, a single empty batch ends the run
+        assert await job.run_once() == 0
+        assert len(pool.calls) == 4
+
+    asyncio.run(scenario())
+
+
+def test_archived_pages_are_never_cached():
+    async def scenario():
+        pool = StubPool(0)
+        repository = EventRepository(pool, cache=EventCache())
+        await repository.find_events(1, archived=True)
+        await repository.find_events(1, archived=True)
+        assert [name for name, _ in pool.calls] == ["_select_events_page"] * 2
+        assert pool.calls[0][1][-1] is True
+
+    asyncio.run(scenario())
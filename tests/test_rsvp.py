@@ -0,0 +1,115 @@
+"""
+Tests for the write-behind signup tracker
+"""
+
+import asyncio
+from types import SimpleNamespace
+import psycopg2
+from paps_bot.rsvp import ATTENDING, NOT_ATTENDING, RsvpTracker
+
+GAME = 7
+MESSAGE = 70
+BOT = 1
+
+
+class StubRepository:
+    """Records every batch written, optionally failing the first one"""
+
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.batches = []
+
+    def add_listener(self, listener):
+        pass
+
+    async def event_messages(self, since):
+        return [(MESSAGE, GAME)]
+
+    async def write_attendees(self, upserts, removals):
+        if self.fail:
+            self.fail = False
+            raise psycopg2.OperationalError("connection lost")
+        self.batches.append((sorted(upserts), sorted(removals)))
+
+
+def reaction(user_id, emoji, message_id=MESSAGE):
+    return SimpleNamespace(message_id=message_id, user_id=user_id, emoji=emoji)
+
+
+def tracker(repository, **kwargs):
+    return RsvpTracker(
+        SimpleNamespace(user=SimpleNamespace(id=BOT)), repository, **kwargs
+    )
+
+
+def test_reactions_are_written_in_one_batch_per_window():
+    async def scenario():
+        repository = StubRepository()
+        rsvp = tracker(repository, flush_interval=0.02)
+        await rsvp.start()
+        for user_id in (10, 11, 12):
+            rsvp.handle_reaction(reaction(user_id, ATTENDING), added=True)
+        # the bot's own reactions and other messages are not signups
+        rsvp.handle_reaction(reaction(BOT, ATTENDING), added=True)
+        rsvp.handle_reaction(reaction(13, ATTENDING, message_id=99), added=True)
+        await asyncio.sleep(0.06)
+        await rsvp.stop()
+        going = [(GAME, user_id, "going") for user_id in (10, 11, 12)]
+        assert repository.batches == [(going, [])]
+
+    asyncio.run(scenario())
+
+
+def test_a_full_buffer_is_written_before_the_window_ends():
+    async def scenario():
+        repository = StubRepository()
+        rsvp = tracker(repository, flush_interval=60, flush_size=2)
+        await rsvp.start()
+        rsvp.handle_reaction(reaction(10, ATTENDING), added=True)
+        await asyncio.sleep(0.01)
+        assert not repository.batches
+        rsvp.handle_reaction(reaction(11, NOT_ATTENDING), added=True)
+        await asyncio.sleep(0.01)
+        assert repository.batches == [
+            ([(GAME, 10, "going"), (GAME, 11, "declined")], [])
+        ]
+        await rsvp.stop()
+
+    asyncio.run(scenario())
+
+
+def test_the_latest_reaction_of_a_user_wins():
+    async def scenario():
+        repository = StubRepository()
+        rsvp = tracker(repository, flush_interval=60)
+        await rsvp.start()
+        # given and withdrawn again
+        rsvp.handle_reaction(reaction(10, ATTENDING), added=True)
+        rsvp.handle_reaction(reaction(10, ATTENDING), added=False)
+        # switched to declined, then the old reaction is removed
+        rsvp.handle_reaction(reaction(11, ATTENDING), added=True)
+        rsvp.handle_reaction(reaction(11, NOT_ATTENDING), added=True)
+        rsvp.handle_reaction(reaction(11, ATTENDING), added=False)
+        assert sorted(rsvp.overlay(GAME, [(10, "going"), (12, "going")])) == [
+            (11, "declined"),
+            (12, "going"),
+        ]
+        await rsvp.stop()
+        assert repository.batches == [([(GAME, 11, "declined")], [(GAME, 10, "going")])]
+
+    asyncio.run(scenario())
+
+
+def test_stopping_flushes_the_buffer_and_failed_writes_are_kept():
+    async def scenario():
+        repository = StubRepository(fail=True)
+        rsvp = tracker(repository, flush_interval=60)
+        await rsvp.start()
+        rsvp.handle_reaction(reaction(10, ATTENDING), added=True)
+        assert await rsvp.flush() == 0
+        rsvp.handle_reaction(reaction(11, ATTENDING), added=True)
+        await rsvp.stop()
+        going = [(GAME, 10, "going"), (GAME, 11, "going")]
+        assert repository.batches == [(going, [])]
+
+    asyncio.run(scenario())
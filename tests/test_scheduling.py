@@ -0,0 +1,78 @@
+"""
+Tests for the overlap checks and the bitset slot finder
+"""
+
+import random
+from datetime import date, datetime, time
+from paps_bot.scheduling import GuildSpans, add_to_counter, at_least, runs
+
+DAY = date(2030, 1, 7)
+
+
+def row(game_id, hour, minute=0):
+    return (game_id, "dnd", DAY, time(hour, minute))
+
+
+def at(hour, minute=0):
+    return datetime.combine(DAY, time(hour, minute))
+
+
+def ids(spans):
+    return [span[2][0] for span in spans]
+
+
+def test_overlapping_finds_events_crossing_the_range():
+    spans = GuildSpans()
+    spans.add(row(1, 12), 60)
+    spans.add(row(2, 14), 120)
+    spans.add(row(3, 18), 60)
+    assert ids(spans.overlapping(at(12, 30), at(15))) == [1, 2]
+    assert ids(spans.overlapping(at(15, 30), at(17))) == [2]
+    assert not spans.overlapping(at(16), at(17))
+
+
+def test_back_to_back_events_do_not_overlap():
+    spans = GuildSpans()
+    spans.add(row(1, 12), 60)
+    spans.add(row(2, 14), 60)
+    assert not spans.overlapping(at(13), at(14))
+
+
+def test_long_events_starting_early_are_found():
+    spans = GuildSpans()
+    spans.add(row(1, 8), 600)
+    spans.add(row(2, 9), 30)
+    assert ids(spans.overlapping(at(17), at(18))) == [1]
+
+
+def test_add_replaces_and_remove_returns_the_duration():
+    spans = GuildSpans()
+    spans.add(row(1, 12), 60)
+    spans.add(row(1, 20), 90)
+    assert not spans.overlapping(at(12), at(13))
+    assert spans.remove(1) == 90
+    assert spans.remove(1) is None
+    assert not spans.overlapping(at(0), at(23))
+
+
+def test_runs_keeps_the_starts_of_long_enough_runs():
+    mask = 0b1111_0110_1110
+    assert runs(mask, 1) == mask
+    assert runs(mask, 2) == 0b0111_0010_0110
+    assert runs(mask, 3) == 0b0011_0000_0010
+    assert runs(mask, 4) == 0b0001_0000_0000
+    assert runs(mask, 5) == 0
+
+
+def test_at_least_matches_counting_each_bucket():
+    rng = random.Random(7)
+    buckets = 64
+    universe = (1 << buckets) - 1
+    masks = [rng.getrandbits(buckets) for _ in range(13)]
+    slices = []
+    for mask in masks:
+        add_to_counter(slices, mask)
+    counts = [sum(mask >> i & 1 for mask in masks) for i in range(buckets)]
+    for count in range(0, 16):
+        expected = sum(1 << i for i, c in enumerate(counts) if c >= count)
+        assert at_least(slices, count, universe) == expected
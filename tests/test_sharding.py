@@ -0,0 +1,53 @@
+"""
+Tests for splitting shards over processes and the guilds each one owns
+"""
+
+import pytest
+from paps_bot.sharding import ShardOwnership, shard_for_guild, split_shards
+
+
+def test_split_shards_in_nearly_equal_runs():
+    assert split_shards(10, 3) == [[0, 1, 2, 3], [4, 5, 6], [7, 8, 9]]
+    assert split_shards(2, 2) == [[0], [1]]
+    assert split_shards(5, 1) == [[0, 1, 2, 3, 4]]
+
+
+@pytest.mark.parametrize("workers", [0, 4])
+def test_split_shards_needs_a_shard_per_worker(workers):
+    with pytest.raises(ValueError):
+        split_shards(3, workers)
+
+
+def test_shard_for_guild_uses_the_timestamp_bits():
+    assert shard_for_guild(5 << 22, 4) == 1
+    assert shard_for_guild((5 << 22) + 12345, 4) == 1
+
+
+def test_default_ownership_owns_everything():
+    ownership = ShardOwnership()
+    assert ownership.owns_everything
+    assert ownership.owns_shard(7)
+    assert ownership.owns_guild(123)
+    assert ownership.query_filter() is None
+
+
+def test_all_shards_count_as_everything():
+    ownership = ShardOwnership([1, 0], 2)
+    assert ownership.owns_everything
+    assert ownership.query_filter() is None
+
+
+def test_partial_ownership():
+    ownership = ShardOwnership([3, 1], 4)
+    assert not ownership.owns_everything
+    assert ownership.query_filter() == (4, [1, 3])
+    assert ownership.owns_guild(1 << 22)
+    assert not ownership.owns_guild(2 << 22)
+    assert ownership.owns_shard(3)
+    assert not ownership.owns_shard(0)
+
+
+@pytest.mark.parametrize("shard_ids, shard_count", [([0], None), ([4], 4), ([-1], 4)])
+def test_invalid_ownership(shard_ids, shard_count):
+    with pytest.raises(ValueError):
+        ShardOwnership(shard_ids, shard_count)
@@ -0,0 +1,92 @@
+"""
+Tests for coalescing identical concurrent reads
+"""
+
+import asyncio
+from datetime import date, time
+import psycopg2
+import pytest
+from paps_bot.repository import EventPage, EventRepository
+from paps_bot.singleflight import SingleFlight
+
+GUILD = 1
+PAGE = EventPage(((1, "dnd", date(2030, 1, 7), time(18, 0)),), False)
+
+
+class GatedPool:
+    """Holds every query until released, then answers it or fails it"""
+
+    def __init__(self, error=None):
+        self.error = error
+        self.queries = 0
+        self.release = asyncio.Event()
+
+    async def run(self, func, *args):
+        self.queries += 1
+        await self.release.wait()
+        if self.error is not None:
+            raise self.error
+        return PAGE
+
+
+async def settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+def test_concurrent_identical_reads_share_one_query():
+    async def scenario():
+        pool = GatedPool()
+        repository = EventRepository(pool)
+        reads = [
+            asyncio.ensure_future(repository.find_events(GUILD, game_type="dnd"))
+            for _ in range(5)
+        ]
+        other = asyncio.ensure_future(repository.find_events(GUILD, game_type="cpr"))
+        await settle()
+        pool.release.set()
+        assert await asyncio.gather(*reads) == [PAGE] * 5
+        await other
+        assert pool.queries == 2
+        assert repository.page_reads.stats() == {"calls": 2, "coalesced": 4}
+        # once answered, the next read queries again
+        await repository.find_events(GUILD, game_type="dnd")
+        assert pool.queries == 3
+
+    asyncio.run(scenario())
+
+
+def test_a_failed_read_reaches_every_waiter():
+    async def scenario():
+        pool = GatedPool(psycopg2.OperationalError("connection lost"))
+        repository = EventRepository(pool)
+        reads = [asyncio.ensure_future(repository.find_events(GUILD)) for _ in range(3)]
+        await settle()
+        pool.release.set()
+        results = await asyncio.gather(*reads, return_exceptions=True)
+        assert [type(result) for result in results] == [psycopg2.OperationalError] * 3
+        assert pool.queries == 1
+        assert not len(repository.page_reads)
+
+    asyncio.run(scenario())
+
+
+def test_a_cancelled_caller_does_not_cancel_the_others():
+    async def scenario():
+        flight = SingleFlight("test")
+        release = asyncio.Event()
+
+        async def call():
+            await release.wait()
+            return 42
+
+        first = asyncio.ensure_future(flight.do("key", call))
+        second = asyncio.ensure_future(flight.do("key", call))
+        await settle()
+        first.cancel()
+        release.set()
+        assert await second == 42
+        with pytest.raises(asyncio.CancelledError):
+            await first
+
+    asyncio.run(scenario())
@@ -0,0 +1,44 @@
+"""
+Tests for the state snapshot handed from a stopping bot to the next start
+"""
+
+import pickle
+import zlib
+from datetime import date, time
+from paps_bot import snapshot
+from paps_bot.snapshot import StateSnapshot, read_snapshot, write_snapshot
+
+ROW = (1, "dnd", date(2030, 1, 7), time(18, 0))
+
+
+def state():
+    return StateSnapshot(
+        watermark="100:100:",
+        shards=None,
+        events=[(1, ROW, 180)],
+        series=[],
+        votes=[],
+        upcoming=[(1, 10, ROW)],
+        messages={55: 1},
+        cache=[],
+    )
+
+
+def test_a_snapshot_is_read_back_once(tmp_path):
+    path = str(tmp_path / "state.bin")
+    assert write_snapshot(path, state()) > 0
+    assert read_snapshot(path) == state()
+    assert read_snapshot(path) is None
+
+
+def test_other_formats_and_broken_files_are_ignored(tmp_path, monkeypatch):
+    path = tmp_path / "state.bin"
+    write_snapshot(str(path), state())
+    monkeypatch.setattr(snapshot, "SNAPSHOT_FORMAT", snapshot.SNAPSHOT_FORMAT + 1)
+    assert read_snapshot(str(path)) is None
+    assert not path.exists()
+    path.write_bytes(zlib.compress(b"not a pickle"))
+    assert read_snapshot(str(path)) is None
+    path.write_bytes(pickle.dumps("not compressed"))
+    assert read_snapshot(str(path)) is None
+    assert not path.exists()
@@ -0,0 +1,44 @@
+"""
+Tests for the repository on the SQLite backend
+"""
+
+import asyncio
+from datetime import date, time
+import psycopg2
+import pytest
+from paps_bot.repository import EventRepository
+from paps_bot.sqlite import SQLitePool
+
+GUILD = 1
+
+
+def test_event_round_trip(tmp_path):
+    async def round_trip():
+        pool = SQLitePool(str(tmp_path / "paps.sqlite3"), readers=2)
+        await pool.open()
+        try:
+            repository = EventRepository(pool)
+            await repository.migrate()
+            game_id = await repository.add_event(
+                GUILD, "dnd", date(2030, 1, 7), time(18, 0)
+            )
+            page = await repository.find_events(GUILD, game_time=time(18, 0))
+            assert list(page.rows) == [(game_id, "dnd", date(2030, 1, 7), time(18, 0))]
+            assert not (await repository.find_events(2)).rows
+
+            assert await repository.update_event(
+                GUILD, game_id, game_type="cpr", game_time=time(19, 30)
+            )
+            page = await repository.find_events(GUILD, game_type="cpr")
+            assert list(page.rows) == [(game_id, "cpr", date(2030, 1, 7), time(19, 30))]
+
+            with pytest.raises(psycopg2.Error):
+                await repository.update_event(GUILD, game_id, game_date="07-01-2030")
+
+            assert await repository.delete_event(GUILD, game_id)
+            assert not await repository.delete_event(GUILD, game_id)
+            assert not (await repository.find_events(GUILD)).rows
+        finally:
+            await pool.close()
+
+    asyncio.run(round_trip())
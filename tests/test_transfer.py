@@ -0,0 +1,103 @@
+"""
+Tests for the CSV and iCalendar import and export of events
+"""
+
+import io
+from datetime import date, time
+import pytest
+from paps_bot.transfer import (
+    EventWriter,
+    RejectedRow,
+    parse_csv,
+    parse_ics,
+    parse_import,
+)
+
+
+def ics(*lines):
+    return "\r\n".join(("BEGIN:VCALENDAR",) + lines + ("END:VCALENDAR", ""))
+
+
+def test_parse_csv_skips_the_header_and_rejects_bad_rows():
+    parsed = parse_csv(
+        "game_type,game_date,game_time\n"
+        "dnd,07-01-2030,18:00\n"
+        "\n"
+        ",07-01-2030,18:00\n"
+        "cpr,2030-01-07,18:00\n"
+        "cpr,07-01-2030,6pm\n"
+        "cpr,07-01-2030\n"
+    )
+    assert parsed.rows == [("dnd", date(2030, 1, 7), time(18, 0))]
+    assert parsed.errors == [
+        RejectedRow(4, "missing game type"),
+        RejectedRow(5, "missing or invalid date"),
+        RejectedRow(6, "missing or invalid time"),
+        RejectedRow(7, "expected 3 columns"),
+    ]
+
+
+def test_parse_csv_without_a_header():
+    parsed = parse_csv('"Dnd, oneshot" ,07-01-2030, 18:30\r\n')
+    assert parsed.rows == [("Dnd, oneshot", date(2030, 1, 7), time(18, 30))]
+    assert not parsed.errors
+
+
+def test_parse_ics_reads_summary_and_floating_start():
+    parsed = parse_ics(
+        ics(
+            "BEGIN:VEVENT",
+            "SUMMARY:dnd\\, session",
+            "  one",
+            "DTSTART:20300107T180000",
+            "END:VEVENT",
+        )
+    )
+    assert parsed.rows == [("dnd, session one", date(2030, 1, 7), time(18, 0))]
+    assert not parsed.errors
+
+
+def test_parse_ics_rejects_events_without_a_start_time():
+    parsed = parse_ics(
+        ics(
+            "BEGIN:VEVENT",
+            "SUMMARY:no start",
+            "END:VEVENT",
+            "BEGIN:VEVENT",
+            "SUMMARY:all day",
+            "DTSTART;VALUE=DATE:20300107",
+            "END:VEVENT",
+            "BEGIN:VEVENT",
+            "SUMMARY:unknown zone",
+            "DTSTART;TZID=Nowhere/Special:20300107T180000",
+            "END:VEVENT",
+        )
+    )
+    assert not parsed.rows
+    assert parsed.errors == [
+        RejectedRow(2, "missing DTSTART"),
+        RejectedRow(5, "missing or invalid time"),
+        RejectedRow(9, "missing or invalid date"),
+    ]
+
+
+def test_parse_import_picks_the_parser_by_extension():
+    assert parse_import("events.CSV", "dnd,07-01-2030,18:00").rows
+    with pytest.raises(ValueError):
+        parse_import("events.txt", "")
+
+
+@pytest.mark.parametrize("file_format", ["csv", "ics"])
+def test_exports_import_again(file_format):
+    rows = [
+        (1, "dnd, oneshot", date(2030, 1, 7), time(18, 0)),
+        (2, "cpr", date(2030, 1, 8), time(19, 30)),
+    ]
+    file = io.BytesIO()
+    with EventWriter(file, file_format) as writer:
+        writer.write(rows[:1])
+        writer.write(rows[1:])
+    assert writer.count == 2
+    parsed = parse_import(f"events.{file_format}", file.getvalue().decode())
+    assert parsed.rows == [row[1:] for row in rows]
+    assert not parsed.errors
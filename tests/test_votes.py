@@ -0,0 +1,189 @@
+"""
+Tests for the vote engine's reaction routing, expiry and decisions
+"""
+
+import asyncio
+from datetime import date, datetime, time, timedelta, timezone
+from types import SimpleNamespace
+from paps_bot import votes
+from paps_bot.votes import THUMBS_DOWN, THUMBS_UP, Vote, VoteEngine
+
+BOT_ID = 1
+
+
+class StubChannel:
+    def __init__(self):
+        self.sent = []
+
+    async def send(self, content):
+        self.sent.append(content)
+
+
+class StubClient:
+    def __init__(self):
+        self.user = SimpleNamespace(id=BOT_ID)
+        self.channel = StubChannel()
+
+    def get_partial_messageable(self, channel_id):
+        return self.channel
+
+
+class StubRepository:
+    def __init__(self, rows=()):
+        self.rows = list(rows)
+        self.calls = []
+        # set to make tally writes wait
+        self.tally_gate = None
+        self.writing = 0
+        self.overlapped = False
+
+    async def open_votes(self):
+        return self.rows
+
+    async def add_vote(self, row):
+        self.calls.append(("add", row[0]))
+
+    async def update_vote_tally(self, message_id, thumbs_up, thumbs_down):
+        self.writing += 1
+        self.overlapped |= self.writing > 1
+        if self.tally_gate is not None:
+            await self.tally_gate.wait()
+        self.calls.append(("tally", message_id, thumbs_up, thumbs_down))
+        self.writing -= 1
+
+    async def pass_vote(self, message_id):
+        await asyncio.sleep(0)
+        self.calls.append(("pass", message_id))
+        return True
+
+    async def close_vote(self, message_id, status):
+        await asyncio.sleep(0)
+        self.calls.append((status, message_id))
+        return True
+
+
+def message(message_id):
+    return SimpleNamespace(
+        id=message_id, guild=SimpleNamespace(id=1), channel=SimpleNamespace(id=10)
+    )
+
+
+def reaction(message_id, emoji=THUMBS_UP, user_id=2):
+    return SimpleNamespace(message_id=message_id, user_id=user_id, emoji=emoji)
+
+
+def vote_row(message_id, deadline):
+    return Vote(
+        message_id=message_id,
+        guild_id=1,
+        channel_id=10,
+        game_type="dnd",
+        game_date=date(2030, 1, 7),
+        game_time=time(18, 0),
+        count_limit_success=1,
+        count_limit_fail=1,
+        deadline=deadline,
+    ).as_row()
+
+
+def test_reactions_are_routed_by_message_id(monkeypatch):
+    monkeypatch.setattr(votes, "COUNT_LIMIT_SUCCESS", 3)
+
+    async def scenario():
+        engine = VoteEngine(StubClient(), StubRepository())
+        first = await engine.open_vote(message(100), "dnd", date(2030, 1, 7), None)
+        second = await engine.open_vote(message(200), "cpr", date(2030, 1, 8), None)
+        await engine.handle_reaction(reaction(100), True)
+        await engine.handle_reaction(reaction(300), True)
+        await engine.handle_reaction(reaction(200, THUMBS_UP, BOT_ID), True)
+        await engine.handle_reaction(reaction(200, "🎲"), True)
+        assert (first.thumbs_up, second.thumbs_up) == (1, 0)
+        await engine.handle_reaction(reaction(100), False)
+        await engine.handle_reaction(reaction(100), False)
+        assert first.thumbs_up == 0
+
+    asyncio.run(scenario())
+
+
+def test_a_vote_passes_exactly_once():
+    async def scenario():
+        client, repository = StubClient(), StubRepository()
+        engine = VoteEngine(client, repository)
+        await engine.open_vote(message(100), "dnd", date(2030, 1, 7), None)
+        await asyncio.gather(
+            *(engine.handle_reaction(reaction(100), True) for _ in range(3))
+        )
+        await engine.handle_reaction(reaction(100, THUMBS_DOWN), True)
+        assert repository.calls == [("add", 100), ("pass", 100)]
+        assert len(client.channel.sent) == 1
+        assert len(engine) == 0
+
+    asyncio.run(scenario())
+
+
+def test_a_vote_fails_exactly_once():
+    async def scenario():
+        repository = StubRepository()
+        engine = VoteEngine(StubClient(), repository)
+        await engine.open_vote(message(100), "dnd", date(2030, 1, 7), None)
+        await asyncio.gather(
+            *(
+                engine.handle_reaction(reaction(100, THUMBS_DOWN), True)
+                for _ in range(2)
+            )
+        )
+        assert repository.calls == [("add", 100), ("failed", 100)]
+
+    asyncio.run(scenario())
+
+
+def test_tally_writes_run_one_at_a_time_and_end_with_the_latest_count(monkeypatch):
+    monkeypatch.setattr(votes, "COUNT_LIMIT_SUCCESS", 5)
+
+    async def scenario():
+        repository = StubRepository()
+        engine = VoteEngine(StubClient(), repository)
+        await engine.open_vote(message(100), "dnd", date(2030, 1, 7), None)
+        repository.tally_gate = asyncio.Event()
+        writes = [
+            asyncio.create_task(engine.handle_reaction(reaction(100), True))
+            for _ in range(3)
+        ]
+        await asyncio.sleep(0)
+        repository.tally_gate.set()
+        await asyncio.gather(*writes)
+        tallies = [call[2] for call in repository.calls if call[0] == "tally"]
+        # the first write was already under way, the ones queued behind it saw every reaction
+        assert tallies == [1, 3, 3]
+        assert not repository.overlapped
+
+    asyncio.run(scenario())
+
+
+def test_votes_expire_in_deadline_order_unless_decided():
+    async def scenario():
+        now = datetime.now(timezone.utc)
+        repository = StubRepository(
+            [
+                vote_row(100, now - timedelta(minutes=1)),
+                vote_row(200, now - timedelta(minutes=5)),
+                vote_row(300, now + timedelta(milliseconds=50)),
+                vote_row(400, now + timedelta(milliseconds=50)),
+            ]
+        )
+        engine = VoteEngine(StubClient(), repository)
+        await engine.resume()
+        try:
+            await asyncio.sleep(0.01)
+            await engine.handle_reaction(reaction(400), True)
+            await asyncio.sleep(0.2)
+        finally:
+            await engine.stop()
+        assert repository.calls == [
+            ("expired", 200),
+            ("expired", 100),
+            ("pass", 400),
+            ("expired", 300),
+        ]
+
+    asyncio.run(scenario())